@@ -2,14 +2,26 @@ import aiohttp
 import asyncio
 import async_timeout
 import getopt
+import hashlib
 import json
 import logging
+import os
 import re
-from bs4 import BeautifulSoup
+import time
+from concurrent.futures import ProcessPoolExecutor
 from os import path
 from sys import argv, exit
 
-from setup import getPokemon, getSoup
+from pokeRecord import PokeRecord
+from pokeSnapshot import writeSnapshot
+from pokeStore import writeStore
+from prefixIndex import normalizePrefixes
+from rateLimit import HostLimiter, fetch
+from setup import (ParseError, appendRecord, checkpointFile,
+                   compactCheckpoint, getSoup, loadCheckpoint, openCheckpoint,
+                   parsePokemon)
+from soupUtils import makeSoup, tableStrainer
+from upstream import setUpstream
 
 user_agent = 'Mozilla/5.0 (Windows; U; Windows NT 10.0; rv:10.0) Gecko/20100101 Firefox/52.0'
 sendHeader={'User-Agent':user_agent,}
@@ -18,11 +30,38 @@ sendHeader={'User-Agent':user_agent,}
 nationalDex = dict()
 # Dictionary for the Terraria prefixes
 prefixDict  = dict()
+# Results of the previous crawl that unchanged pages are copied from
+previousDex       = dict()
+previousPrefixes  = dict()
+# ETag, Last-Modified and content hash of every page from the previous crawl
+crawlManifest = dict()
+manifestFile  = "crawlManifest.json"
+# Whether to ignore the manifest and refetch and reparse every page
+fullCrawl = False
+# Number of pages that were reparsed or reused from the previous crawl
+crawlStats = {"updated": 0, "unchanged": 0}
+# Checkpoint file that every Pokemon is streamed to once it's done
+checkpoint = None
+# Pokemon that were finished before an interrupted crawl
+completed = set()
+# Pokemon whose pages couldn't be fetched or parsed, retried with --resume
+failed = set()
+# Per-host token buckets and adaptive concurrency limits for every request
+hostLimiter = HostLimiter()
+# Process pool that parses the pages so parsing doesn't block the event loop
+# None to parse the pages on the event loop
+parsePool = None
 
 def help(returnCode):
   info = """\
 Usage: %s [options...]
+  -f, --full            Refetch and reparse every page
   -h, --help            Print this help message
+  -r, --resume          Resume an interrupted crawl
+  -u, --upstream URL    Request the pages from URL (e.g. a replayServer.py)
+                        instead of the wikis
+  -w, --workers N       Parse pages in N worker processes (default: one per
+                        CPU, 0 to parse on the event loop)
 """ % path.split(__file__)[1]
   print(info)
   exit(returnCode)
@@ -42,17 +81,67 @@ def saveDict(writeDict, writeFile, errorMsg):
     logging.error(e)
     exit(1)
   return
+
+# Load a dictionary from readFile, which was written by saveDict
+# Return an empty dictionary if readFile doesn't exist or can't be read
+def loadDict(readFile):
+  if (not path.exists(readFile)):
+    return dict()
+  try:
+    with open(readFile, "r") as f:
+      return json.load(f)
+  except Exception as e:
+    logging.error("Error reading %s" % readFile)
+    logging.error(e)
+  return dict()
+
+# Send a rate limited GET request for url that is conditional on it having
+# changed since the previous crawl
+# Failed requests are retried with backoff by rateLimit.fetch
+# Return the data from the response or None if the page hasn't changed, either
+# because the server responded with 304 Not Modified or because the page has
+# the same content hash as last time
+# Set conditional to False if there's no previous result to fall back on
+async def conditionalGet(session, url, conditional=True):
+  entry = crawlManifest.get(url, dict())
+  conditional = (conditional and (not fullCrawl))
+  headers = dict()
+  if (conditional and ("etag" in entry)):
+    headers["If-None-Match"] = entry["etag"]
+  if (conditional and ("lastModified" in entry)):
+    headers["If-Modified-Since"] = entry["lastModified"]
+  (status, responseHeaders, data) = await fetch(session, url, hostLimiter,
+                                                headers=headers)
+  if (conditional and (status == 304)):
+    return None
+  assert(status == 200)
+  newEntry = {"sha1": hashlib.sha1(data).hexdigest()}
+  if ("ETag" in responseHeaders):
+    newEntry["etag"] = responseHeaders["ETag"]
+  if ("Last-Modified" in responseHeaders):
+    newEntry["lastModified"] = responseHeaders["Last-Modified"]
+  crawlManifest[url] = newEntry
+  if (conditional and (entry.get("sha1") == newEntry["sha1"])):
+    return None
+  return data
   
 async def getDexURL(session):
   global nationalDex
   baseURL = "http://bulbapedia.bulbagarden.net"
-  async with session.get("%s%s"%(baseURL, "/wiki/List_of_Pok%C3%A9mon_by_National_Pok%C3%A9dex_number")) as response:
-    try:
-      assert(response.status == 200)
-      data = await response.read()
-      soup = BeautifulSoup(data, "html.parser")
-    except Exception as e:
-      logging.error(e)
+  try:
+    data = await conditionalGet(session, "%s%s"%(baseURL, "/wiki/List_of_Pok%C3%A9mon_by_National_Pok%C3%A9dex_number"),
+                                conditional=(len(previousDex) > 0))
+  except Exception as e:
+    logging.error(e)
+    # Recrawl the Pokemon from the previous crawl rather than none at all
+    logging.error("Unable to get the Pokémon list, reusing the previous one")
+    data = None
+  # The list hasn't changed so reuse the URLs from the previous crawl
+  if (data is None):
+    for (key, value) in previousDex.items():
+      nationalDex[key] = {"url": value["url"]}
+    return
+  soup = makeSoup(data, tableStrainer)
   regions = {"Kanto", "Johto", "Hoenn", "Sinnoh", "Unova", "Kalos", "Alola"}
   tables = soup.find_all("table")
   for tableBody in tables:
@@ -91,13 +180,18 @@ async def getDexURL(session):
   
 async def getPrefixes(session):
   global prefixDict
-  async with session.get("http://terraria.gamepedia.com/Prefix_IDs") as response:
-    try:
-      assert(response.status == 200)
-      data = await response.read()
-      soup = BeautifulSoup(data, "html.parser")
-    except Exception as e:
-      logging.error(e)
+  try:
+    data = await conditionalGet(session, "http://terraria.gamepedia.com/Prefix_IDs",
+                                conditional=(len(previousPrefixes) > 0))
+  except Exception as e:
+    logging.error(e)
+    logging.error("Unable to get the prefixes, keeping the previous ones")
+    data = None
+  # The prefixes haven't changed so reuse the previous crawl's prefixes
+  if (data is None):
+    prefixDict.update(previousPrefixes)
+    return
+  soup = makeSoup(data, tableStrainer)
   # Get the tables
   tables = soup.find_all("table")
   for tableBody in tables:
@@ -109,11 +203,8 @@ async def getPrefixes(session):
         if (len(cols) == 2):
           prefix  = cols[0].string.lower().strip()
           id      = cols[1].string.lower().strip()
-          # Prefix that has multiple IDs
-          if (prefix in prefixDict):
-            prefixDict[prefix] = [prefixDict[prefix], id]
-          else:
-            prefixDict[prefix] = id
+          # Prefixes may have multiple IDs
+          prefixDict.setdefault(prefix, []).append(id)
         # Ignore the table headers
         else:
           assert(len(row.find_all("th")) != 0)
@@ -124,71 +215,189 @@ async def getPrefixes(session):
   
 async def getPokeInfo(key, session):
   tempDict = nationalDex[key]
-  async with session.get(tempDict["url"]) as response:
-    try:
-      assert(response.status == 200)
-      data = await response.read()
-      soup = BeautifulSoup(data, "html.parser")
-    except Exception as e:
-      logging.error(e)
-  tempDict.update(getPokemon(soup, key))
-  nationalDex[key] = tempDict
+  # Only reuse a previous record for the same page
+  previous = previousDex.get(key)
+  if ((previous is not None) and (previous.get("url") != tempDict["url"])):
+    previous = None
+  try:
+    data = await conditionalGet(session, tempDict["url"],
+                                conditional=(previous is not None))
+  except Exception as e:
+    logging.error(e)
+    # Keep the previous record in pokedex.json and retry with --resume
+    failed.add(key)
+    return
+  # The page hasn't changed so skip parsing it again
+  if (data is None):
+    appendRecord(checkpoint, key, previous)
+    crawlStats["unchanged"] += 1
+    return
+  if (parsePool is None):
+    pokeInfo = parseInWorker(data, key)
+  else:
+    # Hand the raw HTML to a worker process and get back the parsed info
+    loop = asyncio.get_event_loop()
+    pokeInfo = await loop.run_in_executor(parsePool, parseInWorker, data, key)
+  if (pokeInfo is None):
+    logging.error("Skipping %s" % key)
+    failed.add(key)
+    return
+  tempDict.update(pokeInfo)
+  # Stream the Pokemon to the checkpoint instead of keeping it in memory
+  appendRecord(checkpoint, key, tempDict)
+  nationalDex[key] = {"url": tempDict["url"]}
+  crawlStats["updated"] += 1
   return
 
-async def limitGetPokeInfo(sem, key, session):
-  async with sem:
-    await getPokeInfo(key, session)
-  
+# Parse data, the HTML of the Pokemon key's Bulbapedia page, with parsePokemon
+# Runs in the parsePool worker processes and returns plain Python objects
+# Return None if the page can't be parsed instead of losing the whole crawl so
+# that the Pokemon can be retried with --resume
+def parseInWorker(data, key):
+  try:
+    pokeInfo = parsePokemon(data, key)
+  except ParseError:
+    return None
+  # The strings are BeautifulSoup NavigableStrings that reference the whole
+  # parse tree, so convert them to plain strings before they're pickled
+  return json.loads(json.dumps(pokeInfo))
+
 async def getPokedex():
-  # Semaphore to limit the maximum number of concurrent requests
-  sem = asyncio.Semaphore(128)
+  keys = []
   tasks = []
+  start = time.time()
   # Share a client session so it will not open a new session for each request
-  async with aiohttp.ClientSession() as session:
+  # Concurrency is limited per host by hostLimiter
+  connector = aiohttp.TCPConnector(limit=hostLimiter.maximum)
+  async with aiohttp.ClientSession(connector=connector,
+                                   headers=sendHeader) as session:
     for key in nationalDex:
-      task = asyncio.ensure_future(limitGetPokeInfo(sem, key, session))
-      tasks.append(task)
-    await asyncio.wait(tasks)
+      if (key in completed):
+        continue
+      keys.append(key)
+      tasks.append(asyncio.ensure_future(getPokeInfo(key, session)))
+    # Collect the exceptions (e.g. from a parse worker) instead of losing them
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+  for (key, result) in zip(keys, results):
+    if (isinstance(result, BaseException)):
+      logging.error("Error crawling %s" % key)
+      logging.error(result)
+      failed.add(key)
+  # conditionalGet saved the new validators of the pages that failed to parse,
+  # so forget them to download and parse the pages again next time instead of
+  # getting a 304 or a hash match and keeping the previous records
+  for key in failed:
+    crawlManifest.pop(nationalDex[key]["url"], None)
+  elapsed = time.time() - start
+  # Unchanged and failed pages weren't downloaded and parsed
+  parsed = crawlStats["updated"]
+  logging.debug("Parsed %d pages in %.1f seconds (%.1f pages/sec)" %
+                (parsed, elapsed, parsed / max(elapsed, 1e-9)))
   return
   
 async def setup():
-  # Semaphore to limit the maximum number of concurrent requests
-  sem = asyncio.Semaphore(128)
   tasks = []
   # Share a client session so it will not open a new session for each request
-  async with aiohttp.ClientSession() as session:
+  async with aiohttp.ClientSession(headers=sendHeader) as session:
     tasks.append(asyncio.ensure_future(getDexURL(session)))
     tasks.append(asyncio.ensure_future(getPrefixes(session)))
     await asyncio.wait(tasks)
   return
   
 def main(argv):
+  global checkpoint, fullCrawl, parsePool
   logFormat   = "%(asctime)s %(levelname)s %(message)s"
   dateFormat  = "%Y-%m-%d %H:%M:%S UTC-%z"
   logging.basicConfig(format=logFormat, datefmt=dateFormat, level=10)
-  shortOpts = "h"
-  longOpts = ["help"]
+  shortOpts = "fhru:w:"
+  longOpts = ["full", "help", "resume", "upstream=", "workers="]
   try:
     opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
   except getopt.GetoptError as e:
     logging.error(e)
     help(2)
+  # Whether or not to skip the Pokemon already in the checkpoint file
+  resume = False
+  # Number of worker processes to parse the pages in
+  workers = os.cpu_count() or 1
   for (o, a) in opts:
-    if (o in ("-h", "--help")):
+    if (o in ("-f", "--full")):
+      fullCrawl = True
+    elif (o in ("-h", "--help")):
       help(2)
+    elif (o in ("-r", "--resume")):
+      resume = True
+    elif (o in ("-u", "--upstream")):
+      setUpstream(a)
+    elif (o in ("-w", "--workers")):
+      try:
+        workers = int(a)
+        assert(workers >= 0)
+      except (AssertionError, ValueError):
+        logging.error("Invalid number of workers '%s'" % a)
+        help(2)
+  # Merge into the results of the previous crawl
+  if (not fullCrawl):
+    # Convert records from older versions to the PokeRecord format
+    for (key, value) in loadDict("pokedex.json").items():
+      if ("baseStats" in value):
+        value = PokeRecord.fromDict(value).toDict()
+      previousDex[key] = value
+    previousPrefixes.update(normalizePrefixes(loadDict("terrariaPrefixes.json")))
+    crawlManifest.update(loadDict(manifestFile))
+  if (resume):
+    completed.update(loadCheckpoint(checkpointFile))
+    logging.debug("Resuming with %d Pokémon already done" % len(completed))
+  checkpoint = openCheckpoint(checkpointFile, resume)
+  if (workers > 0):
+    parsePool = ProcessPoolExecutor(max_workers=workers)
   # It's the same event loop so don't close it until the end
   # No need to call asyncio.new_event_loop since we have run_until_complete()
   loop = asyncio.get_event_loop()
   # Finish setup before completing the pokedex
   loop.run_until_complete(asyncio.ensure_future(setup()))
+  # Don't overwrite the bot's data with an empty Pokedex
+  if (len(nationalDex) == 0):
+    logging.error("No Pokémon to crawl, leaving pokedex.json unchanged")
+    checkpoint.close()
+    exit(1)
   loop.run_until_complete(asyncio.ensure_future(getPokedex()))
   loop.close()
-  saveDict(writeDict=nationalDex,
-           writeFile="pokedex.json",
-           errorMsg="Error writing pokedex to pokedex.json")
-  saveDict(writeDict=prefixDict,
-           writeFile="terrariaPrefixes.json",
-           errorMsg="Error writing prefixes to terrariaPrefixes.json")
+  if (parsePool is not None):
+    parsePool.shutdown()
+  checkpoint.close()
+  # Keep the previous records of the Pokemon that failed
+  compactCheckpoint(checkpointFile=checkpointFile,
+                    writeFile="pokedex.json",
+                    errorMsg="Error writing pokedex to pokedex.json",
+                    fallback={key: previousDex[key] for key in failed
+                              if (key in previousDex)},
+                    keep=(len(failed) > 0))
+  if (len(failed) > 0):
+    logging.error("%d Pokémon failed, retry them with --resume" %
+                  len(failed))
+  nationalDex = loadDict("pokedex.json")
+  # Compact snapshot of pokedex.json that the bot imports into an empty store
+  try:
+    writeSnapshot(nationalDex, "pokedex.bin")
+  except Exception as e:
+    logging.error("Error writing pokedex.bin")
+    logging.error(e)
+  # Indexed store of the Pokedex that the bot looks Pokemon up in
+  try:
+    writeStore(nationalDex, "pokedex.db")
+  except Exception as e:
+    logging.error("Error writing pokedex.db")
+    logging.error(e)
+  if (len(prefixDict) > 0):
+    saveDict(writeDict=prefixDict,
+             writeFile="terrariaPrefixes.json",
+             errorMsg="Error writing prefixes to terrariaPrefixes.json")
+  saveDict(writeDict=crawlManifest,
+           writeFile=manifestFile,
+           errorMsg="Error writing the crawl manifest to %s" % manifestFile)
+  logging.debug("Reparsed %d pages and reused %d unchanged pages" %
+                (crawlStats["updated"], crawlStats["unchanged"]))
   return
 
 if __name__ == '__main__':
@@ -0,0 +1,240 @@
+import asyncio
+import getopt
+import json
+import logging
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from os import path
+from sys import argv, exit
+
+from pokemon import Pokemon
+from recordedPages import (loadFixture, pageFixtures, pokeFixtures, pokedexURL,
+                           prefixURL, record)
+from setup import getPokemon
+from soupUtils import makeSoup, parserName, pokePageStrainer
+from terraria import Terraria
+
+baselineFile = path.join(path.split(__file__)[0], "benchmarkBaseline.json")
+
+
+class FixtureResponse:
+    """Stand-in for an aiohttp response to a recorded page."""
+    def __init__(self, data):
+        self.status = 200
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FixtureSession:
+    """Stand-in for an aiohttp session that serves recorded pages."""
+    def __init__(self, pages):
+        """Keyword arguments:
+        pages -- a dictionary of URL -> the recorded page
+        """
+        self.pages = pages
+
+    def get(self, url, **kw):
+        return FixtureResponse(self.pages[url])
+
+
+def measure(func, number):
+    """Time func and measure its memory use.
+
+    Returns a dictionary with the minimum, median and maximum time of a call
+    in milliseconds, the peak memory allocated during a call and the memory
+    still allocated after it in KiB.
+    Keyword arguments:
+    func   -- the function to benchmark, called without arguments
+    number -- the number of timed calls
+    """
+    # Warm up caches and lazy imports before timing anything
+    func()
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    # tracemalloc slows calls down, so memory is measured separately
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"min": min(times),
+            "median": statistics.median(times),
+            "max": max(times),
+            "peakKiB": (peak - before) / 1024,
+            "retainedKiB": (current - before) / 1024,
+            }
+
+
+def runBenchmarks(number, only=None):
+    """Run every benchmark with recorded fixtures.
+
+    Returns a dictionary of benchmark name -> results from measure.
+    Keyword arguments:
+    number -- the number of timed calls per benchmark
+    only   -- only run benchmarks whose names contain this string
+    """
+    loop = asyncio.get_event_loop()
+    tempDir = tempfile.mkdtemp()
+    # The cogs' data files go in a temporary directory so the benchmarks
+    # don't read or overwrite the bot's
+    pokemonCog = Pokemon(None, None, cogDir=tempDir)
+    terrariaCog = Terraria(None, None, cogDir=tempDir)
+    benchmarks = dict()
+    for (pokemon, (fixture, _)) in sorted(pokeFixtures.items()):
+        data = loadFixture(fixture)
+        if (data is None):
+            continue
+        soup = makeSoup(data, pokePageStrainer)
+        benchmarks["makeSoup[{}]".format(pokemon)] = (
+            lambda data=data: makeSoup(data, pokePageStrainer))
+        benchmarks["Pokemon._getPokeData[{}]".format(pokemon)] = (
+            lambda soup=soup, pokemon=pokemon:
+            pokemonCog._getPokeData(soup, pokemon))
+        benchmarks["setup.getPokemon[{}]".format(pokemon)] = (
+            lambda soup=soup, pokemon=pokemon: getPokemon(soup, pokemon))
+    pages = dict()
+    for (fixture, url) in pageFixtures.items():
+        data = loadFixture(fixture)
+        if (data is not None):
+            pages[url] = data
+    session = FixtureSession(pages)
+    if (pokedexURL in pages):
+        benchmarks["Pokemon._getPokeURLs"] = (
+            lambda: loop.run_until_complete(
+                pokemonCog._getPokeURLs(session)))
+    if (prefixURL in pages):
+        benchmarks["Terraria._getTPrefixes"] = (
+            lambda: loop.run_until_complete(
+                terrariaCog._getTPrefixes(session)))
+    results = dict()
+    for (name, func) in sorted(benchmarks.items()):
+        if ((only is not None) and (only not in name)):
+            continue
+        try:
+            results[name] = measure(func, number)
+        except Exception as e:
+            logging.error("Error running {}".format(name))
+            logging.error(e)
+    pokemonCog.storeWriter.close()
+    pokemonCog.store.close()
+    shutil.rmtree(tempDir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the results next to the baseline and return the regressions.
+
+    A benchmark has regressed if its median time is more than threshold
+    (e.g. 0.25 for 25%) slower than its median time in the baseline.
+    Keyword arguments:
+    results   -- the results from runBenchmarks
+    baseline  -- the results saved with --save
+    threshold -- the fraction that the median time may grow by
+    """
+    regressions = []
+    width = max([len(name) for name in results] + [9])
+    print("{:<{}}  {:>9}  {:>9}  {:>9}  {:>10}  {:>8}".format(
+        "Benchmark", width, "min ms", "median ms", "baseline", "peak KiB",
+        "change"))
+    for (name, result) in sorted(results.items()):
+        old = baseline.get(name)
+        if (old is None):
+            oldMedian = change = "-"
+        else:
+            ratio = result["median"] / old["median"] - 1
+            oldMedian = "{:.3f}".format(old["median"])
+            change = "{:+.1%}".format(ratio)
+            if (ratio > threshold):
+                regressions.append(name)
+                change += " !"
+        print("{:<{}}  {:>9.3f}  {:>9.3f}  {:>9}  {:>10.1f}  {:>8}".format(
+            name, width, result["min"], result["median"], oldMedian,
+            result["peakKiB"], change))
+    return regressions
+
+
+def help(returnCode):
+    info = """\
+Usage: %s [options...]
+  -h, --help            Print this help message
+  -r, --record          Download the fixtures from the live wikis
+  -s, --save            Save the results as the new baseline
+  -n, --number N        Number of timed calls per benchmark (default: 20)
+  -t, --threshold F     Fail if a median time is more than F slower than the
+                        baseline (default: 0.25 i.e. 25%%)
+  -k, --only NAME       Only run benchmarks whose names contain NAME
+""" % path.split(__file__)[1]
+    print(info)
+    exit(returnCode)
+
+
+def main(argv):
+    logFormat = "%(asctime)s %(levelname)s %(message)s"
+    dateFormat = "%Y-%m-%d %H:%M:%S UTC-%z"
+    logging.basicConfig(format=logFormat, datefmt=dateFormat, level=20)
+    shortOpts = "hrsn:t:k:"
+    longOpts = ["help", "record", "save", "number=", "threshold=", "only="]
+    try:
+        opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
+    except getopt.GetoptError as e:
+        logging.error(e)
+        help(2)
+    recordFixtures = False
+    save = False
+    number = 20
+    threshold = 0.25
+    only = None
+    for (o, a) in opts:
+        if (o in ("-h", "--help")):
+            help(2)
+        elif (o in ("-r", "--record")):
+            recordFixtures = True
+        elif (o in ("-s", "--save")):
+            save = True
+        elif (o in ("-n", "--number")):
+            number = int(a)
+        elif (o in ("-t", "--threshold")):
+            threshold = float(a)
+        elif (o in ("-k", "--only")):
+            only = a
+    if (recordFixtures):
+        record()
+    logging.info("Parsing with {}".format(parserName))
+    results = runBenchmarks(number, only)
+    if (len(results) == 0):
+        logging.error("No fixtures found, record them with --record")
+        exit(1)
+    baseline = dict()
+    if (path.exists(baselineFile)):
+        with open(baselineFile, "r") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, threshold)
+    if (save):
+        baseline.update(results)
+        with open(baselineFile, "w") as f:
+            json.dump(baseline, f, sort_keys=True, indent=2)
+        logging.info("Saved the baseline to {}".format(baselineFile))
+    elif (len(regressions) > 0):
+        logging.error("{} benchmark(s) regressed by more than {:.0%}".format(
+            len(regressions), threshold))
+        exit(1)
+    return
+
+
+if __name__ == '__main__':
+    main(argv)
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
+import time
+# When the bot started, used to report how long startup took
+startTime = time.time()
 import argparse
+import asyncio
 import configparser
 import json
 import logging
@@ -12,17 +16,63 @@ from os import path
 import discord
 from discord.ext import commands
 
+import metrics
+import sharding
+from httpClient import HTTPClient
+from sendScheduler import SendScheduler, bulkPriority
+from upstream import setUpstream
+
+# Seconds taken by each step of starting up, reported once the bot is ready
+startupTimes = [("imports", time.time() - startTime)]
+# The most times !repeat repeats a message
+maxRepeats = 50
+# Cogs that can be loaded as extensions -> their modules
+extensions = {"pokemon": "pokemon",
+              "terraria": "terraria",
+              }
+
 description = """\
 A rudimentary bot based on discord.py's basic_bot.py and discord.py's \
 playlist.py. Please report any issues at https://github.com/reedchan/companionbot\
 """
-bot = commands.Bot(command_prefix=commands.when_mentioned_or("!"),
-                   description=description)
+
+
+class ScheduledContext(commands.Context):
+    """A commands.Context that sends replies through the SendScheduler."""
+    async def send(self, content=None, **kwargs):
+        return await self.bot.sendScheduler.send(self.channel, content,
+                                                 **kwargs)
+
+
+# A process of a sharded bot only connects the shards that launch() gave it
+class CompanionBot(commands.AutoShardedBot if sharding.shardIDs else
+                   commands.Bot):
+    """A commands.Bot that owns the HTTP client shared by every cog."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.httpClient = HTTPClient()
+        # Queues, rate limits and coalesces every reply
+        self.sendScheduler = SendScheduler()
+
+    async def get_context(self, message, *, cls=ScheduledContext):
+        """Give commands a context that replies through the scheduler."""
+        return await super().get_context(message, cls=cls)
+
+    async def close(self):
+        """Close the shared HTTP client before logging out."""
+        await self.httpClient.close()
+        await super().close()
+
+
+bot = CompanionBot(command_prefix=commands.when_mentioned_or("!"),
+                   description=description, **sharding.shardOptions())
 botGameStatus       = discord.Game()
 # What the bot is playing/streaming
 botGameStatus.name  = "CompanionBot at github.com/reedchan/CompanionBot"
 # 0 for playing, 1 for streaming
 botGameStatus.type  = 0
+# CommandProfiler for --profile, None if commands aren't profiled
+profiler = None
 
 @bot.event
 async def on_ready():
@@ -30,7 +80,47 @@ async def on_ready():
     logging.info(bot.user.name)
     logging.info(bot.user.id)
     logging.info('------')
+    elapsed = time.time() - startTime
+    if (startupTimes[-1][0] != "connecting"):
+        startupTimes.append(("connecting",
+                             elapsed - sum(t for (_, t) in startupTimes)))
+        logging.info("Startup: {}".format(", ".join(
+            "{} {:.3f}s".format(step, t) for (step, t) in startupTimes)))
+    logging.info("Ready for commands {:.3f} seconds after starting".format(
+        elapsed))
     await bot.change_presence(game=botGameStatus, afk=False)
+
+def loadExtension(name):
+    """Load a cog's extension and return how many seconds it took.
+
+    Keyword arguments:
+    name -- the name of the cog in extensions
+    """
+    start = time.time()
+    bot.load_extension(extensions[name])
+    return time.time() - start
+
+@bot.before_invoke
+async def startCommandTimer(ctx):
+    if (profiler is not None):
+        profiler.start(ctx)
+    ctx.invokedAt = time.perf_counter()
+
+# after_invoke hooks also run when the command raised an error
+@bot.after_invoke
+async def recordCommandTime(ctx):
+    metrics.commandLatency.observe(time.perf_counter() - ctx.invokedAt,
+                                   ctx.command.qualified_name)
+    if (profiler is not None):
+        profiler.stop(ctx)
+
+@bot.event
+async def on_command_error(ctx, error):
+    command = ctx.command.qualified_name if ctx.command else "unknown"
+    metrics.commandErrors.inc(command, type(error).__name__)
+    # Keep the traceback that discord.py would have printed
+    logging.error("Error in command '{}': {}".format(command, error),
+                  exc_info=(type(error), error, error.__traceback__))
     
 # The order of the @bot.command functions determines their order in the help msg
 
@@ -66,8 +156,15 @@ async def joined(ctx, member : discord.Member):
 @bot.command()
 async def repeat(ctx, times : int, content='repeating...'):
     """Repeats a message multiple times."""
-    for i in range(times):
-        await ctx.send(content)
+    if (times > maxRepeats):
+        await ctx.send('I can only repeat a message up to {} times!'.format(
+            maxRepeats))
+        return
+    # Queue every repetition at once so they're coalesced into as few messages
+    # as possible and replies to other commands can go first
+    sent = [bot.sendScheduler.send(ctx.channel, content, priority=bulkPriority)
+            for i in range(times)]
+    await asyncio.gather(*sent)
 
 @bot.command()
 async def roll(ctx, dice : str):
@@ -81,8 +178,74 @@ async def roll(ctx, dice : str):
     result = ', '.join(str(random.randint(1, limit)) for r in range(rolls))
     await ctx.send(result)
 
+@bot.command(hidden=True)
+@commands.is_owner()
+async def stats(ctx):
+    """Shows command latency, cache and error metrics."""
+    summary = metrics.summary()
+    # Leave room for the code block in Discord's 2000 character limit
+    if (len(summary) > 1990):
+        summary = summary[:1986] + "\n..."
+    await ctx.send("```{}```".format(summary))
+
+@bot.command(hidden=True)
+@commands.is_owner()
+async def profile(ctx, sortBy="tottime"):
+    """Shows the hottest functions in this session's command profiles."""
+    if (profiler is None):
+        await ctx.send("```Profiling is off, start the bot with --profile```")
+        return
+    if (sortBy not in ("tottime", "cumtime")):
+        await ctx.send("```Sort by tottime or cumtime```")
+        return
+    from profiler import hotFunctions
+    report = hotFunctions(profiler.profileFiles(), limit=15, sortBy=sortBy)
+    await ctx.send("```{}```".format(report[:1990]))
+
+@bot.command(hidden=True)
+@commands.is_owner()
+async def load(ctx, cog : str):
+    """Loads a cog without restarting the bot."""
+    if (cog not in extensions):
+        await ctx.send("```Unknown cog '{}', choose from {}```".format(
+            cog, ", ".join(sorted(extensions))))
+        return
+    try:
+        elapsed = loadExtension(cog)
+    except Exception as e:
+        logging.error(e)
+        await ctx.send("```Error loading {}: {}```".format(cog, e))
+        return
+    await ctx.send("```Loaded {} in {:.3f} seconds```".format(cog, elapsed))
+
+@bot.command(hidden=True)
+@commands.is_owner()
+async def unload(ctx, cog : str):
+    """Unloads a cog without restarting the bot."""
+    if (extensions.get(cog) not in bot.extensions):
+        await ctx.send("```The {} cog isn't loaded```".format(cog))
+        return
+    bot.unload_extension(extensions[cog])
+    await ctx.send("```Unloaded {}```".format(cog))
+
+@bot.command(hidden=True)
+@commands.is_owner()
+async def reload(ctx, cog : str):
+    """Reloads a cog's code without restarting the bot."""
+    if (extensions.get(cog) not in bot.extensions):
+        await ctx.send("```The {} cog isn't loaded```".format(cog))
+        return
+    bot.unload_extension(extensions[cog])
+    try:
+        elapsed = loadExtension(cog)
+    except Exception as e:
+        logging.error(e)
+        await ctx.send("```Error reloading {}: {}```".format(cog, e))
+        return
+    await ctx.send("```Reloaded {} in {:.3f} seconds```".format(cog, elapsed))
+
 def main():
-  global bot
+  global bot, profiler
   logFormat   = "{asctime}  {levelname:<10} {message}"
   dateFormat  = "%Y-%m-%d %H:%M:%S UTC-%z"
   logging.basicConfig(format=logFormat, datefmt=dateFormat, level=logging.INFO,
@@ -106,6 +269,26 @@ def main():
   parser.add_argument("--terraria",
                       help="add Terraria prefix ID lookup functionality to the bot",
                       action="store_true")
+  parser.add_argument("--metrics-port",
+                      help="serve Prometheus metrics on localhost:METRICS_PORT/metrics",
+                      type=int)
+  parser.add_argument("--profile",
+                      help="profile a fraction (e.g. 0.01) of the commands with cProfile",
+                      type=float)
+  parser.add_argument("--profile-dir",
+                      help="write the profiles to PROFILE_DIR (default: profiles)",
+                      type=str,
+                      default="profiles")
+  parser.add_argument("--upstream",
+                      help="request pages from UPSTREAM (e.g. a replayServer.py) instead of the wikis",
+                      type=str)
+  parser.add_argument("--shards",
+                      help="connect to Discord with SHARDS shards",
+                      type=int)
+  parser.add_argument("--processes",
+                      help="split the shards between PROCESSES bot processes (default: 1)",
+                      type=int,
+                      default=1)
   args = parser.parse_args()
   config = configparser.ConfigParser()
   # Directory that this file is in
@@ -138,6 +321,29 @@ def main():
       logging.error(e)
       sys.exit(1)
 
+  if (args.shards and (sharding.shardIDs is None)):
+    # Start the processes that run the bot and wait for them
+    sys.exit(sharding.launch(args.shards, args.processes, sys.argv))
+  if (sharding.shardIDs is not None):
+    logging.info("Process {} running shards {} of {}".format(
+      sharding.processIndex, sharding.shardIDs, sharding.shardCount))
+  if (args.upstream):
+    setUpstream(args.upstream)
+  if (args.profile):
+    profileDir = args.profile_dir
+    if (sharding.shardIDs is not None):
+      profileDir = path.join(profileDir,
+                             "process{}".format(sharding.processIndex))
+    # Imported only when profiling so cProfile and pstats aren't loaded
+    # otherwise
+    from profiler import CommandProfiler
+    profiler = CommandProfiler(args.profile, profileDir)
+    logging.info("Profiling {:.1%} of the commands in {}".format(
+      args.profile, profiler.sessionDir))
+  if (args.metrics_port):
+    # Every process serves its own metrics on the next port
+    bot.loop.create_task(metrics.startServer(
+      port=args.metrics_port + sharding.processIndex))
   if (args.verbose or (args.config and config["DEFAULT"].getboolean("verbose"))):
     logging.getLogger().setLevel(logging.DEBUG)
   if (args.music or (args.config and config["COGS"].getboolean("music"))):
@@ -155,20 +361,13 @@ def main():
     except Exception as e:
       logging.error(e)
       sys.exit(1)
-  if (args.pokemon or (args.config and config["COGS"].getboolean("pokemon"))):
-    try:
-      from pokemon import Pokemon
-      bot.add_cog(Pokemon(bot))
-    except Exception as e:
-      logging.error(e)
-      sys.exit(1)
-  if (args.terraria or (args.config and config["COGS"].getboolean("terraria"))):
-    try:
-      from terraria import Terraria
-      bot.add_cog(Terraria(bot))
-    except Exception as e:
-      logging.error(e)
-      sys.exit(1)
+  for cog in sorted(extensions):
+    if (getattr(args, cog) or (args.config and config["COGS"].getboolean(cog))):
+      try:
+        startupTimes.append((cog, loadExtension(cog)))
+      except Exception as e:
+        logging.error(e)
+        sys.exit(1)
   if (args.config):
     token = config["DEFAULT"]["token"]
   else:
@@ -0,0 +1,59 @@
+import logging
+
+import aiohttp
+
+user_agent = """\
+Mozilla/5.0 (Windows; U; Windows NT 10.0; rv:10.0) Gecko/20100101 Firefox/52.0\
+"""
+sendHeader = {"User-Agent": user_agent,
+              "Accept-Encoding": "gzip, deflate",
+              }
+
+# Connection pool settings
+connLimit = 64          # Total number of simultaneous connections
+connLimitPerHost = 8    # Simultaneous connections to a single wiki
+dnsCacheTTL = 300       # Seconds to cache DNS lookups
+keepAliveTimeout = 60   # Seconds to keep idle connections open
+# Request timeouts in seconds
+totalTimeout = 30
+connectTimeout = 10
+
+
+class HTTPClient:
+    """Long-lived pooled HTTP client shared by every cog.
+
+    The underlying aiohttp session is created lazily on first use so that it
+    is bound to the bot's running event loop.
+    """
+    def __init__(self):
+        self._session = None
+
+    @property
+    def session(self):
+        """Return the shared aiohttp session, creating it if needed."""
+        if ((self._session is None) or self._session.closed):
+            connector = aiohttp.TCPConnector(limit=connLimit,
+                                             limit_per_host=connLimitPerHost,
+                                             ttl_dns_cache=dnsCacheTTL,
+                                             keepalive_timeout=keepAliveTimeout)
+            timeout = aiohttp.ClientTimeout(total=totalTimeout,
+                                            connect=connectTimeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout,
+                                                  headers=sendHeader)
+        return self._session
+
+    def get(self, url, **kwargs):
+        """Send a GET request using the shared session.
+
+        Keyword arguments:
+        url -- the URL to request
+        """
+        return self.session.get(url, **kwargs)
+
+    async def close(self):
+        """Close the shared session and its pooled connections."""
+        if ((self._session is not None) and (not self._session.closed)):
+            await self._session.close()
+            logging.debug("Closed the shared HTTP session")
+        self._session = None
@@ -0,0 +1,294 @@
+import logging
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds of the latency histograms' buckets
+defaultBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                  float("inf"))
+
+
+def _formatLabels(labelNames, labels, extra=()):
+    """Format label values like {command="pokemon",le="0.5"}.
+
+    Keyword arguments:
+    labelNames -- the names of the labels
+    labels     -- the values of the labels
+    extra      -- additional (name, value) pairs
+    """
+    pairs = list(zip(labelNames, labels)) + list(extra)
+    if (len(pairs) == 0):
+        return ""
+    return "{{{}}}".format(",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for (name, value) in pairs))
+
+
+def _formatValue(value):
+    """Format a sample value in the Prometheus text format."""
+    if (value == float("inf")):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, e.g. of cache hits or errors."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelNames=()):
+        """Keyword arguments:
+        name       -- the metric's name
+        help       -- a description of the metric
+        labelNames -- the names of the labels the counts are split by
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        # Label values -> count
+        self.values = dict()
+
+    def inc(self, *labels, amount=1):
+        """Add amount to the count for the label values."""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        """Return the count for the label values."""
+        return self.values.get(labels, 0)
+
+    def render(self):
+        """Return the samples in the Prometheus text format."""
+        return ["{}{} {}".format(self.name,
+                                 _formatLabels(self.labelNames, labels),
+                                 _formatValue(value))
+                for (labels, value) in sorted(self.values.items())]
+
+
+class Timer:
+    """Context manager that adds the time taken by its block to a histogram."""
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class Histogram:
+    """Distribution of durations in fixed buckets.
+
+    Only the number of observations in each bucket is kept, so recording an
+    observation takes constant time and memory no matter how many there are.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelNames=(), buckets=defaultBuckets):
+        """Keyword arguments:
+        name       -- the metric's name
+        help       -- a description of the metric
+        labelNames -- the names of the labels the observations are split by
+        buckets    -- the sorted upper bounds of the buckets
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        # Label values -> [count in each bucket, sum, count]
+        self.series = dict()
+
+    def observe(self, value, *labels):
+        """Record an observation for the label values."""
+        series = self.series.get(labels)
+        if (series is None):
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels):
+        """Return a context manager that times its block."""
+        return Timer(self, labels)
+
+    def count(self, *labels):
+        """Return the number of observations for the label values."""
+        series = self.series.get(labels)
+        return 0 if (series is None) else series[2]
+
+    def mean(self, *labels):
+        """Return the mean observation for the label values."""
+        series = self.series.get(labels)
+        if ((series is None) or (series[2] == 0)):
+            return 0.0
+        return series[1] / series[2]
+
+    def quantile(self, q, *labels):
+        """Estimate a quantile by interpolating within its bucket.
+
+        Keyword arguments:
+        q      -- the quantile between 0 and 1, e.g. 0.99
+        labels -- the label values
+        """
+        series = self.series.get(labels)
+        if ((series is None) or (series[2] == 0)):
+            return 0.0
+        rank = q * series[2]
+        seen = 0
+        for (i, count) in enumerate(series[0]):
+            if ((count > 0) and (seen + count >= rank)):
+                lower = self.buckets[i - 1] if (i > 0) else 0.0
+                upper = self.buckets[i]
+                # Observations past the last finite bucket
+                if (upper == float("inf")):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def render(self):
+        """Return the samples in the Prometheus text format."""
+        lines = []
+        for (labels, (counts, total, count)) in sorted(self.series.items()):
+            cumulative = 0
+            for (bound, bucketCount) in zip(self.buckets, counts):
+                cumulative += bucketCount
+                lines.append("{}_bucket{} {}".format(
+                    self.name,
+                    _formatLabels(self.labelNames, labels,
+                                  (("le", _formatValue(bound)),)),
+                    cumulative))
+            lines.append("{}_sum{} {}".format(
+                self.name, _formatLabels(self.labelNames, labels),
+                _formatValue(total)))
+            lines.append("{}_count{} {}".format(
+                self.name, _formatLabels(self.labelNames, labels), count))
+        return lines
+
+
+class Registry:
+    """Collection of metrics that are exported together."""
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelNames=()):
+        """Create and register a Counter."""
+        metric = Counter(name, help, labelNames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelNames=(), buckets=defaultBuckets):
+        """Create and register a Histogram."""
+        metric = Histogram(name, help, labelNames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+commandLatency = registry.histogram(
+    "companionbot_command_seconds", "Time taken to run a command",
+    ("command",))
+commandErrors = registry.counter(
+    "companionbot_command_errors_total", "Commands that raised an error",
+    ("command", "error"))
+httpLatency = registry.histogram(
+    "companionbot_http_seconds", "Time taken to download a page",
+    ("host",))
+httpErrors = registry.counter(
+    "companionbot_http_errors_total", "Failed page downloads",
+    ("host", "reason"))
+parseLatency = registry.histogram(
+    "companionbot_parse_seconds", "Time taken to parse a page", ("page",))
+embedLatency = registry.histogram(
+    "companionbot_embed_seconds", "Time taken to render an embed")
+cacheLookups = registry.counter(
+    "companionbot_cache_lookups_total", "Cache lookups by result",
+    ("cache", "result"))
+
+
+def errorReason(response, error):
+    """Return the reason label of a failed download.
+
+    Keyword arguments:
+    response -- the response, or None if there isn't one
+    error    -- the exception that was raised
+    """
+    if ((response is not None) and (response.status != 200)):
+        return "HTTP {}".format(response.status)
+    return type(error).__name__
+
+
+def _latencyLine(histogram, labels, name):
+    """Format a histogram series as a line of !stats."""
+    return "{:<24} {:>6} {:>8.0f} {:>8.0f} {:>8.0f}".format(
+        name[:24], histogram.count(*labels),
+        histogram.quantile(0.5, *labels) * 1000,
+        histogram.quantile(0.95, *labels) * 1000,
+        histogram.quantile(0.99, *labels) * 1000)
+
+
+def summary():
+    """Return a plain text summary of the metrics for !stats."""
+    lines = ["{:<24} {:>6} {:>8} {:>8} {:>8}".format(
+        "Latency (ms)", "count", "p50", "p95", "p99")]
+    for (histogram, prefix) in ((commandLatency, "!"),
+                                (httpLatency, "GET "),
+                                (parseLatency, "parse "),
+                                (embedLatency, "embed")):
+        for labels in sorted(histogram.series):
+            lines.append(_latencyLine(histogram, labels,
+                                       prefix + " ".join(labels)))
+    lookups = dict()
+    for ((cache, result), count) in cacheLookups.values.items():
+        lookups.setdefault(cache, dict())[result] = count
+    for (cache, results) in sorted(lookups.items()):
+        total = sum(results.values())
+        lines.append("{} cache: {:.1%} hits of {} ({})".format(
+            cache, results.get("hit", 0) / max(total, 1), total,
+            ", ".join("{} {}".format(count, result)
+                      for (result, count) in sorted(results.items()))))
+    for (counter, name) in ((commandErrors, "Command errors"),
+                            (httpErrors, "HTTP errors")):
+        if (len(counter.values) > 0):
+            lines.append("{}: {}".format(name, ", ".join(
+                "{} x {}".format(count, " ".join(labels))
+                for (labels, count) in sorted(counter.values.items()))))
+    return "\n".join(lines)
+
+
+async def _handleMetrics(request):
+    from aiohttp import web
+    return web.Response(body=registry.render().encode("utf-8"),
+                        headers={"Content-Type":
+                                 "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def startServer(host="localhost", port=9100):
+    """Serve the metrics at http://host:port/metrics for Prometheus.
+
+    Keyword arguments:
+    host -- the interface to listen on
+    port -- the port to listen on
+    """
+    # Only imported when metrics are served
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", _handleMetrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Serving metrics on http://{}:{}/metrics".format(host, port))
+    return runner
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from os import path
+
+from pokeRecord import PokeRecord
+
+# How long a record is considered fresh (7 days)
+defaultTTL = 7 * 24 * 60 * 60
+# How long a stale record may still be served while it is refreshed (90 days)
+defaultMaxStale = 90 * 24 * 60 * 60
+
+
+class PokeCache:
+    """Memory and disk backed cache of parsed Pokemon records (PokeRecords).
+
+    Every entry stores the time it was fetched and its own TTL. Entries past
+    their TTL are still returned (flagged as stale) until they are older than
+    maxStale so the caller can serve them immediately and refresh them in the
+    background.
+    """
+    def __init__(self, cacheFile, ttl=defaultTTL, maxStale=defaultMaxStale):
+        """Create the cache and load any entries saved on disk.
+
+        Keyword arguments:
+        cacheFile -- the JSON file used to persist the cache between restarts
+        ttl       -- the default number of seconds an entry stays fresh
+        maxStale  -- the number of seconds after which an entry is discarded
+        """
+        self.cacheFile = cacheFile
+        self.ttl = ttl
+        self.maxStale = maxStale
+        self.entries = dict()
+        # Memory-mapped crawler snapshot used for Pokemon that aren't cached
+        self.snapshot = None
+        # pokeStore.PokeStore with the records fetched by the bot's other
+        # processes
+        self.store = None
+        # Only one process writes the cache file when the bot is sharded
+        self.readOnly = False
+        self._dirty = False
+        self._saveHandle = None
+        self.load()
+
+    def load(self):
+        """Load the cache entries from the cache file if it exists."""
+        if (not path.exists(self.cacheFile)):
+            return
+        try:
+            with open(self.cacheFile, "r") as f:
+                entries = json.load(f)
+            for entry in entries.values():
+                entry["data"] = PokeRecord.fromDict(entry["data"])
+            self.entries = entries
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error loading {}".format(self.cacheFile))
+            self.entries = dict()
+
+    def attachSnapshot(self, snapshot):
+        """Fall back on a crawler snapshot for Pokemon that aren't cached.
+
+        Records from the snapshot are decoded lazily and are always stale so
+        they are refreshed on first use.
+        Keyword arguments:
+        snapshot -- a pokeSnapshot.PokeSnapshot
+        """
+        self.snapshot = snapshot
+
+    def attachStore(self, store):
+        """Pick up the records fetched by the bot's other processes.
+
+        Records that are missing or stale are looked up in the store before
+        they're reported as such. The processes put the records they fetch
+        in the store themselves.
+        Keyword arguments:
+        store -- a pokeStore.PokeStore
+        """
+        self.store = store
+
+    def _fromStore(self, key, entry):
+        """Return the store's entry for a Pokemon if it's newer than entry.
+
+        Keyword arguments:
+        key   -- the name of the Pokemon
+        entry -- the cache's entry for the Pokemon or None
+        """
+        newerThan = 0 if (entry is None) else entry["fetched"]
+        shared = self.store.getNewer(key, newerThan)
+        if (shared is None):
+            return entry
+        (data, fetched) = shared
+        entry = self.entries[key] = {"fetched": fetched,
+                                     "ttl": self.ttl,
+                                     "data": data}
+        self._markDirty()
+        return entry
+
+    def get(self, key):
+        """Return a tuple of (record, fresh) for a cached Pokemon.
+
+        record is None if the Pokemon is not cached or the entry is too old to
+        be served. fresh is False if the entry should be refreshed.
+        Keyword arguments:
+        key -- the name of the Pokemon
+        """
+        entry = self.entries.get(key)
+        if ((self.store is not None) and
+            ((entry is None) or
+             (time.time() - entry["fetched"] > entry["ttl"]))):
+            entry = self._fromStore(key, entry)
+        if (entry is None):
+            if ((self.snapshot is not None) and (key in self.snapshot)):
+                return (self.snapshot.get(key), False)
+            return (None, False)
+        age = time.time() - entry["fetched"]
+        if (age > max(entry["ttl"], self.maxStale)):
+            del self.entries[key]
+            self._markDirty()
+            return (None, False)
+        return (entry["data"], age <= entry["ttl"])
+
+    def version(self, key):
+        """Return the time a cached Pokemon's record was fetched.
+
+        Keyword arguments:
+        key -- the name of the Pokemon
+        """
+        entry = self.entries.get(key)
+        if (entry is None):
+            if ((self.snapshot is not None) and (key in self.snapshot)):
+                return 0
+            return None
+        return entry["fetched"]
+
+    def put(self, key, data, ttl=None):
+        """Store a freshly parsed record in the cache.
+
+        Keyword arguments:
+        key  -- the name of the Pokemon
+        data -- the PokeRecord with the Pokemon's information
+        ttl  -- the number of seconds the entry stays fresh
+        """
+        if (ttl is None):
+            ttl = self.ttl
+        self.entries[key] = {"fetched": time.time(),
+                             "ttl": ttl,
+                             "data": data}
+        self._markDirty()
+
+    def _markDirty(self):
+        """Schedule the cache to be written to disk."""
+        self._dirty = True
+        if (self._saveHandle is not None):
+            return
+        try:
+            loop = asyncio.get_event_loop()
+        except Exception:
+            self.save()
+            return
+        if (loop.is_running()):
+            # Coalesce bursts of updates into a single write
+            self._saveHandle = loop.call_later(5, self.save)
+        else:
+            self.save()
+
+    def save(self):
+        """Write the cache to disk if it has changed."""
+        self._saveHandle = None
+        if ((not self._dirty) or self.readOnly):
+            return
+        tempFile = "{}.tmp".format(self.cacheFile)
+        try:
+            entries = {key: {"fetched": entry["fetched"],
+                             "ttl": entry["ttl"],
+                             "data": entry["data"].toDict()}
+                       for (key, entry) in self.entries.items()}
+            with open(tempFile, "w") as f:
+                json.dump(entries, f)
+            # Replace the old file atomically so a crash can't corrupt it
+            os.replace(tempFile, self.cacheFile)
+            self._dirty = False
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error writing {}".format(self.cacheFile))
+
+
+class LRUCache:
+    """Bounded least recently used cache with hit and miss counters.
+
+    The cache is bounded both by the number of entries and by the combined
+    size of its values as reported by sizeOf.
+    """
+    def __init__(self, maxEntries, maxBytes, sizeOf=len):
+        """Create an empty cache.
+
+        Keyword arguments:
+        maxEntries -- the maximum number of entries to keep
+        maxBytes   -- the maximum combined size of the values to keep
+        sizeOf     -- a function returning the approximate size of a value
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key or None if it is not cached.
+
+        Keyword arguments:
+        key -- the key to look up
+        """
+        try:
+            (value, _) = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Cache value under key, evicting the oldest entries if needed.
+
+        Keyword arguments:
+        key   -- the key to store the value under
+        value -- the value to cache
+        """
+        size = self.sizeOf(value)
+        if (size > self.maxBytes):
+            return
+        self.pop(key)
+        self.entries[key] = (value, size)
+        self.size += size
+        while ((len(self.entries) > self.maxEntries) or
+               (self.size > self.maxBytes)):
+            (_, (_, oldSize)) = self.entries.popitem(last=False)
+            self.size -= oldSize
+
+    def pop(self, key):
+        """Remove key from the cache if it is cached.
+
+        Keyword arguments:
+        key -- the key to remove
+        """
+        entry = self.entries.pop(key, None)
+        if (entry is not None):
+            self.size -= entry[1]
+
+    def invalidate(self, match):
+        """Remove every entry whose key satisfies match.
+
+        Keyword arguments:
+        match -- a function that takes a key and returns True to remove it
+        """
+        for key in [key for key in self.entries if match(key)]:
+            self.pop(key)
+
+    def stats(self):
+        """Return a dictionary with the cache's counters."""
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": (self.hits / lookups) if lookups else 0.0,
+                }
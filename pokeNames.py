@@ -0,0 +1,136 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Nicknames that can't be derived from the Pokemon's name
+extraAliases = {"derpkip": "mudkip",
+                }
+# Everything except for letters and numbers is ignored when matching names
+ignoreRE = re.compile("[^a-z0-9]")
+
+
+def normalize(name):
+    """Normalize a Pokemon's name for matching.
+
+    Accents, case, punctuation, spaces and underscores are ignored, and the
+    gender symbols are treated as "f" and "m", so "Flabébé", "flabebe",
+    "Nidoran♀", "nidoran_(f)" and "Type: Null" all match their Pokemon.
+    Keyword arguments:
+    name -- the name to normalize
+    """
+    name = name.lower().replace("♀", "f").replace("♂", "m")
+    # Split accented characters into the letter and the accent
+    name = unicodedata.normalize("NFKD", name)
+    return ignoreRE.sub("", name)
+
+
+def trigrams(name):
+    """Return the set of trigrams of a normalized name.
+
+    Keyword arguments:
+    name -- the normalized name
+    """
+    padded = "  {} ".format(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def editDistance(a, b, limit):
+    """Return the Levenshtein distance between two strings.
+
+    Stops early and returns limit + 1 once the distance exceeds limit.
+    Keyword arguments:
+    a     -- the first string
+    b     -- the second string
+    limit -- the largest distance that is of interest
+    """
+    if (abs(len(a) - len(b)) > limit):
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for (i, charA) in enumerate(a, 1):
+        current = [i]
+        for (j, charB) in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (charA != charB)))
+        if (min(current) > limit):
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class NameIndex:
+    """Alias table and trigram index of the Pokemon's names.
+
+    Both are built once from the Pokedex index so that exact lookups are a
+    single dictionary lookup and typo-tolerant suggestions only compare the
+    query against names that share trigrams with it.
+    """
+    def __init__(self, names, aliases=extraAliases):
+        """Build the alias table and trigram index.
+
+        Keyword arguments:
+        names   -- the Pokemon's names as they appear in the Pokedex index
+        aliases -- extra nicknames mapped to names in the Pokedex index
+        """
+        # Normalized name -> name in the Pokedex index
+        self.aliases = dict()
+        # Trigram -> normalized names containing it
+        self.trigramIndex = defaultdict(set)
+        # Normalized name -> number of trigrams in it
+        self.trigramCounts = dict()
+        for name in names:
+            key = normalize(name)
+            self.aliases[key] = name
+            keyTrigrams = trigrams(key)
+            self.trigramCounts[key] = len(keyTrigrams)
+            for trigram in keyTrigrams:
+                self.trigramIndex[trigram].add(key)
+        for (alias, name) in aliases.items():
+            if (name in names):
+                self.aliases[normalize(alias)] = name
+
+    def __len__(self):
+        return len(self.aliases)
+
+    def resolve(self, query):
+        """Return the Pokedex name for a query or None if nothing matches.
+
+        Keyword arguments:
+        query -- the name the user specified
+        """
+        return self.aliases.get(normalize(query))
+
+    def suggest(self, query, limit=3, cutoff=0.3):
+        """Return up to limit Pokedex names that are similar to a query.
+
+        Keyword arguments:
+        query  -- the name the user specified
+        limit  -- the maximum number of suggestions
+        cutoff -- the minimum share of trigrams a suggestion must have
+        """
+        key = normalize(query)
+        if (key == ""):
+            return []
+        queryTrigrams = trigrams(key)
+        shared = defaultdict(int)
+        for trigram in queryTrigrams:
+            for candidate in self.trigramIndex.get(trigram, ()):
+                shared[candidate] += 1
+        scored = []
+        for (candidate, count) in shared.items():
+            # Dice coefficient of the two sets of trigrams
+            score = 2 * count / (len(queryTrigrams) +
+                                 self.trigramCounts[candidate])
+            if (score >= cutoff):
+                scored.append((score, candidate))
+        # Only rerank the best few candidates by edit distance
+        scored = sorted(scored, reverse=True)[:limit * 4]
+        ranked = []
+        for (score, candidate) in scored:
+            # Names starting with the query (e.g. "nidoran") are good matches
+            distance = (0 if candidate.startswith(key) else
+                        editDistance(key, candidate, len(key)))
+            ranked.append((distance, -score, candidate))
+        ranked.sort()
+        return [self.aliases[candidate]
+                for (_, _, candidate) in ranked[:limit]]
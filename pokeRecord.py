@@ -0,0 +1,202 @@
+import re
+from array import array
+
+# Stats in the order they are stored
+statNames = ("HP", "Attack", "Defense", "Sp.Atk", "Sp.Def", "Speed")
+# Stored instead of a stat that couldn't be converted to a number
+missing = 0xFFFF
+rangeRE = re.compile(r"^\s*(\d+)\s*-\s*(\d+)\s*$")
+
+
+def _toInt(string):
+    """Convert a stat to an int, or return missing if it isn't a number.
+
+    Keyword arguments:
+    string -- the stat to convert
+    """
+    try:
+        value = int(string)
+    except (TypeError, ValueError):
+        return missing
+    return value if (0 <= value < missing) else missing
+
+
+def _toRange(string):
+    """Convert a stat range such as "105 - 152" to two ints.
+
+    Keyword arguments:
+    string -- the stat range to convert
+    """
+    match = rangeRE.match(string or "")
+    if (match is None):
+        return [missing, missing]
+    return [_toInt(match.group(1)), _toInt(match.group(2))]
+
+
+def _fromInt(value):
+    """Convert a stored stat back to a string.
+
+    Keyword arguments:
+    value -- the stored stat
+    """
+    return "?" if (value == missing) else str(value)
+
+
+class FormStats:
+    """Base stats of one form of a Pokemon as an array of 31 integers.
+
+    For each stat in statNames the array holds the base stat and the minimum
+    and maximum at level 50 and at level 100, followed by the total.
+    """
+    __slots__ = ("values",)
+    size = 31
+
+    def __init__(self, values):
+        """Keyword arguments:
+        values -- the 31 integers
+        """
+        self.values = array("H", values)
+        assert(len(self.values) == self.size)
+
+    @classmethod
+    def fromParsed(cls, stats):
+        """Create the stats from the strings on a Bulbapedia page.
+
+        Keyword arguments:
+        stats -- a dictionary of stat name -> (base, range at Lv. 50,
+                 range at Lv. 100) with the total under "Total"
+        """
+        values = []
+        for stat in statNames:
+            (base, range50, range100) = stats.get(stat, ("", "", ""))
+            values.append(_toInt(base))
+            values += _toRange(range50)
+            values += _toRange(range100)
+        values.append(_toInt(stats.get("Total")))
+        return cls(values)
+
+    @classmethod
+    def fromStrings(cls, stats):
+        """Create the stats from the old ";"-joined format.
+
+        Keyword arguments:
+        stats -- a dictionary like {"HP": "78;100 - 150;200 - 300", ...}
+        """
+        parsed = dict()
+        for stat in statNames:
+            parts = stats.get(stat, "").split(";")
+            parsed[stat] = tuple(parts + [""] * (3 - len(parts)))[:3]
+        parsed["Total"] = stats.get("Total")
+        return cls.fromParsed(parsed)
+
+    def base(self, i):
+        """Return the base value of the i-th stat in statNames."""
+        return self.values[i * 5]
+
+    @property
+    def total(self):
+        """Return the base stat total."""
+        return self.values[30]
+
+    def totalString(self):
+        """Return the base stat total as a string."""
+        return _fromInt(self.values[30])
+
+    def strings(self, i):
+        """Return the i-th stat as (base, range at Lv. 50, range at Lv. 100).
+
+        Keyword arguments:
+        i -- the index of the stat in statNames
+        """
+        (base, min50, max50, min100, max100) = self.values[i * 5:i * 5 + 5]
+        return (_fromInt(base),
+                "{} - {}".format(_fromInt(min50), _fromInt(max50)),
+                "{} - {}".format(_fromInt(min100), _fromInt(max100)))
+
+    def __eq__(self, other):
+        return (isinstance(other, FormStats) and
+                (self.values == other.values))
+
+
+class PokeRecord:
+    """A Pokemon's information from its Bulbapedia page.
+
+    types and abilities map each form (e.g. "Mega Charizard X" or
+    "Hidden Ability") to a tuple of strings and baseStats maps each form to
+    its FormStats.
+    """
+    __slots__ = ("url", "category", "natDexNo", "img", "types", "abilities",
+                 "baseStats")
+
+    def __init__(self, category, natDexNo, img, types, abilities, baseStats,
+                 url=None):
+        """Keyword arguments:
+        category  -- the Pokemon's category e.g. "Seed Pokemon"
+        natDexNo  -- the Pokemon's National Pokedex number e.g. "#001"
+        img       -- the URL of the Pokemon's image
+        types     -- a dictionary of form -> types
+        abilities -- a dictionary of form -> abilities
+        baseStats -- a dictionary of form -> FormStats
+        url       -- the Pokemon's Bulbapedia URL
+        """
+        # str() drops BeautifulSoup's references to the whole parse tree
+        self.category = str(category)
+        self.natDexNo = str(natDexNo)
+        img = str(img)
+        # The crawlers used to store protocol-relative image URLs
+        if (img.startswith("//")):
+            img = "https:{}".format(img)
+        self.img = img
+        self.types = {str(form): tuple(str(t) for t in values)
+                      for (form, values) in types.items()}
+        self.abilities = {str(form): tuple(str(a) for a in values)
+                          for (form, values) in abilities.items()}
+        self.baseStats = {str(form): stats
+                          for (form, stats) in baseStats.items()}
+        self.url = url
+
+    @classmethod
+    def fromDict(cls, info):
+        """Create a record from its JSON dictionary.
+
+        Also accepts the old format with ";"-joined strings.
+        Keyword arguments:
+        info -- the dictionary from toDict or pokedex.json
+        """
+        def forms(d):
+            return {form: (values.split(";") if isinstance(values, str)
+                           else values)
+                    for (form, values) in d.items()}
+
+        baseStats = dict()
+        for (form, stats) in info["baseStats"].items():
+            if (isinstance(stats, dict)):
+                baseStats[form] = FormStats.fromStrings(stats)
+            else:
+                baseStats[form] = FormStats(stats)
+        return cls(category=info["category"],
+                   natDexNo=info["natDexNo"],
+                   img=info["img"],
+                   types=forms(info["types"]),
+                   abilities=forms(info["abilities"]),
+                   baseStats=baseStats,
+                   url=info.get("url"))
+
+    def toDict(self):
+        """Return the record as a dictionary that can be saved as JSON."""
+        info = {"category": self.category,
+                "natDexNo": self.natDexNo,
+                "img": self.img,
+                "types": {f: list(v) for (f, v) in self.types.items()},
+                "abilities": {f: list(v) for (f, v) in self.abilities.items()},
+                "baseStats": {f: list(s.values)
+                              for (f, s) in self.baseStats.items()},
+                }
+        if (self.url is not None):
+            info["url"] = self.url
+        return info
+
+    def __eq__(self, other):
+        return (isinstance(other, PokeRecord) and
+                all(getattr(self, s) == getattr(other, s)
+                    for s in self.__slots__))
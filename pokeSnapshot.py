@@ -0,0 +1,286 @@
+import getopt
+import json
+import logging
+import mmap
+import os
+import struct
+from os import path
+from sys import argv, exit
+
+from pokeRecord import FormStats, PokeRecord
+
+# Layout of a snapshot file (all integers are little-endian):
+#   header   -- magic, version, record count, string count, and the offsets of
+#               the string table and the index
+#   strings  -- (string count + 1) uint32 offsets followed by the UTF-8 data of
+#               every distinct string (names, types, abilities, ...)
+#   index    -- (name string ID, record offset) uint32 pairs sorted by name
+#   records  -- one variable-length record per Pokemon
+# Every record is made of string IDs and fixed-width uint16 stat arrays:
+#   url, category, natDexNo, img                    4 x uint32
+#   type forms, then per form: form, count, types   uint16, (uint32, uint16,
+#                                                   count x uint32)
+#   ability forms, laid out like the type forms
+#   stat forms, then per form: form, 31 stats       uint16, (uint32,
+#                                                   31 x uint16)
+# The 31 stats are the values of a pokeRecord.FormStats.
+magic = b"PDEX"
+version = 1
+header = struct.Struct("<4sHIIII")
+u16 = struct.Struct("<H")
+u32 = struct.Struct("<I")
+pair = struct.Struct("<II")
+statStruct = struct.Struct("<31H")
+recordHeader = struct.Struct("<4I")
+# The wiki URLs all share this prefix, so only the rest of the URL is stored
+baseURL = "http://bulbapedia.bulbagarden.net"
+
+
+def writeSnapshot(nationalDex, writeFile):
+    """Write a Pokedex dictionary to a compact snapshot file.
+
+    Keyword arguments:
+    nationalDex -- a dictionary like the one in pokedex.json, in either the
+                   PokeRecord.toDict format or the old ";"-joined format
+    writeFile   -- the snapshot file to write
+    """
+    strings = []
+    stringIDs = dict()
+
+    def intern(string):
+        """Return the ID of a string, adding it to the string table."""
+        string = "" if (string is None) else str(string)
+        if (string not in stringIDs):
+            stringIDs[string] = len(strings)
+            strings.append(string)
+        return stringIDs[string]
+
+    def packForms(forms):
+        """Pack a dictionary of form -> tuple of strings."""
+        data = [u16.pack(len(forms))]
+        for (form, values) in sorted(forms.items()):
+            data.append(u32.pack(intern(form)))
+            data.append(u16.pack(len(values)))
+            data.extend(u32.pack(intern(value)) for value in values)
+        return b"".join(data)
+
+    records = []
+    for (pokemon, info) in sorted(nationalDex.items()):
+        if ("baseStats" not in info):
+            logging.debug("Skipping {} since it has no data".format(pokemon))
+            continue
+        record = PokeRecord.fromDict(info)
+        url = record.url or ""
+        if (url.startswith(baseURL)):
+            url = url[len(baseURL):]
+        data = [recordHeader.pack(intern(url),
+                                  intern(record.category),
+                                  intern(record.natDexNo),
+                                  intern(record.img)),
+                packForms(record.types),
+                packForms(record.abilities),
+                u16.pack(len(record.baseStats))]
+        for (form, stats) in sorted(record.baseStats.items()):
+            data.append(u32.pack(intern(form)))
+            data.append(statStruct.pack(*stats.values))
+        records.append((intern(pokemon), b"".join(data)))
+    encoded = [string.encode("utf-8") for string in strings]
+    # Lay out the string table, the index and then the records
+    stringsOffset = header.size
+    offsets = [0]
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    stringTable = (struct.pack("<{}I".format(len(offsets)), *offsets) +
+                   b"".join(encoded))
+    indexOffset = stringsOffset + len(stringTable)
+    recordOffset = indexOffset + pair.size * len(records)
+    index = []
+    recordData = []
+    for (nameID, data) in records:
+        index.append(pair.pack(nameID, recordOffset))
+        recordData.append(data)
+        recordOffset += len(data)
+    tempFile = "{}.{}.tmp".format(writeFile, os.getpid())
+    try:
+        with open(tempFile, "wb") as f:
+            f.write(header.pack(magic, version, len(records), len(strings),
+                                stringsOffset, indexOffset))
+            f.write(stringTable)
+            f.write(b"".join(index))
+            f.write(b"".join(recordData))
+        # Replace the old snapshot atomically so that a bot starting up never
+        # reads a partly written one
+        os.replace(tempFile, writeFile)
+    finally:
+        if (path.exists(tempFile)):
+            os.remove(tempFile)
+    return len(records)
+
+
+class PokeSnapshot:
+    """Read-only, memory-mapped view of a snapshot written by writeSnapshot.
+
+    Only the index is read when the snapshot is opened. Records are decoded
+    when they are looked up.
+    """
+    def __init__(self, snapshotFile):
+        """Memory-map a snapshot file and read its index.
+
+        Keyword arguments:
+        snapshotFile -- the snapshot file to open
+        """
+        self.snapshotFile = snapshotFile
+        with open(snapshotFile, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (fileMagic, fileVersion, count, stringCount, self._stringsOffset,
+         indexOffset) = header.unpack_from(self._map, 0)
+        if ((fileMagic != magic) or (fileVersion != version)):
+            self._map.close()
+            raise ValueError("{} is not a version {} Pokedex snapshot".format(
+                snapshotFile, version))
+        self._stringData = self._stringsOffset + u32.size * (stringCount + 1)
+        self._strings = dict()
+        # Pokemon name -> record offset
+        self.offsets = dict()
+        for i in range(count):
+            (nameID, offset) = pair.unpack_from(self._map,
+                                                indexOffset + pair.size * i)
+            self.offsets[self._string(nameID)] = offset
+
+    def _string(self, stringID):
+        """Return a string from the string table.
+
+        Keyword arguments:
+        stringID -- the ID of the string
+        """
+        string = self._strings.get(stringID)
+        if (string is None):
+            (start, end) = struct.unpack_from(
+                "<2I", self._map, self._stringsOffset + u32.size * stringID)
+            string = self._map[self._stringData + start:
+                               self._stringData + end].decode("utf-8")
+            self._strings[stringID] = string
+        return string
+
+    def _forms(self, offset):
+        """Decode a packed dictionary of forms.
+
+        Returns the dictionary and the offset after it.
+        Keyword arguments:
+        offset -- where the packed forms start
+        """
+        forms = dict()
+        (count,) = u16.unpack_from(self._map, offset)
+        offset += u16.size
+        for _ in range(count):
+            (formID,) = u32.unpack_from(self._map, offset)
+            (valueCount,) = u16.unpack_from(self._map, offset + u32.size)
+            offset += u32.size + u16.size
+            valueIDs = struct.unpack_from("<{}I".format(valueCount),
+                                          self._map, offset)
+            offset += u32.size * valueCount
+            forms[self._string(formID)] = tuple(
+                self._string(valueID) for valueID in valueIDs)
+        return (forms, offset)
+
+    def __contains__(self, pokemon):
+        return pokemon in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def names(self):
+        """Return the names of every Pokemon in the snapshot."""
+        return self.offsets.keys()
+
+    def url(self, pokemon):
+        """Return a Pokemon's Bulbapedia URL without decoding its record.
+
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        """
+        (urlID,) = u32.unpack_from(self._map, self.offsets[pokemon])
+        url = self._string(urlID)
+        return "{}{}".format(baseURL, url) if url.startswith("/") else url
+
+    def get(self, pokemon):
+        """Decode a Pokemon's record into a PokeRecord.
+
+        Returns None if the Pokemon isn't in the snapshot.
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        """
+        offset = self.offsets.get(pokemon)
+        if (offset is None):
+            return None
+        (_, categoryID, natDexNoID, imgID) = recordHeader.unpack_from(
+            self._map, offset)
+        (types, offset) = self._forms(offset + recordHeader.size)
+        (abilities, offset) = self._forms(offset)
+        baseStats = dict()
+        (count,) = u16.unpack_from(self._map, offset)
+        offset += u16.size
+        for _ in range(count):
+            (formID,) = u32.unpack_from(self._map, offset)
+            values = statStruct.unpack_from(self._map, offset + u32.size)
+            offset += u32.size + statStruct.size
+            baseStats[self._string(formID)] = FormStats(values)
+        return PokeRecord(category=self._string(categoryID),
+                          natDexNo=self._string(natDexNoID),
+                          img=self._string(imgID),
+                          types=types,
+                          abilities=abilities,
+                          baseStats=baseStats,
+                          url=self.url(pokemon))
+
+    def close(self):
+        """Unmap the snapshot file."""
+        self._map.close()
+
+
+def help(returnCode):
+    info = """\
+Usage: %s [options...]
+  -h, --help            Print this help message
+  -i, --input FILE      Pokedex JSON to convert (default: pokedex.json)
+  -o, --output FILE     Snapshot file to write (default: pokedex.bin)
+""" % path.split(__file__)[1]
+    print(info)
+    exit(returnCode)
+
+
+def main(argv):
+    logFormat = "%(asctime)s %(levelname)s %(message)s"
+    dateFormat = "%Y-%m-%d %H:%M:%S UTC-%z"
+    logging.basicConfig(format=logFormat, datefmt=dateFormat, level=10)
+    shortOpts = "hi:o:"
+    longOpts = ["help", "input=", "output="]
+    try:
+        opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
+    except getopt.GetoptError as e:
+        logging.error(e)
+        help(2)
+    inputFile = "pokedex.json"
+    outputFile = "pokedex.bin"
+    for (o, a) in opts:
+        if (o in ("-h", "--help")):
+            help(2)
+        elif (o in ("-i", "--input")):
+            inputFile = a
+        elif (o in ("-o", "--output")):
+            outputFile = a
+    try:
+        with open(inputFile, "r") as f:
+            nationalDex = json.load(f)
+    except Exception as e:
+        logging.error("Error reading {}".format(inputFile))
+        logging.error(e)
+        exit(1)
+    count = writeSnapshot(nationalDex, outputFile)
+    logging.debug("Wrote {} Pokemon to {} ({} bytes)".format(
+        count, outputFile, path.getsize(outputFile)))
+    return
+
+
+if __name__ == '__main__':
+    main(argv)
@@ -0,0 +1,444 @@
+import asyncio
+import getopt
+import json
+import logging
+import re
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from sys import argv, exit
+
+from pokeRecord import FormStats, PokeRecord, missing
+
+# Every Pokemon in the Pokedex index has a row in pokemon, and the Pokemon
+# whose pages have been crawled also have rows in forms, types and abilities.
+# fetched is the time the bot fetched a record, NULL for the crawlers' records.
+# natDexNo is the National Dex number as an int for lookups and sorting, and
+# dexText is the number as it appears on Bulbapedia, such as "#025".
+# types, abilities and the forms' names are compared case-insensitively so
+# that their indexes can answer lookups such as "fire" or "mega".
+schema = """
+CREATE TABLE IF NOT EXISTS pokemon (
+    name     TEXT PRIMARY KEY,
+    url      TEXT NOT NULL,
+    natDexNo INTEGER,
+    category TEXT,
+    img      TEXT,
+    fetched  REAL,
+    dexText  TEXT
+);
+CREATE INDEX IF NOT EXISTS pokemonNatDexNo ON pokemon (natDexNo);
+CREATE TABLE IF NOT EXISTS forms (
+    pokemon  TEXT NOT NULL,
+    form     TEXT NOT NULL COLLATE NOCASE,
+    hp       INTEGER,
+    attack   INTEGER,
+    defense  INTEGER,
+    spAtk    INTEGER,
+    spDef    INTEGER,
+    speed    INTEGER,
+    total    INTEGER,
+    stats    BLOB NOT NULL,
+    PRIMARY KEY (pokemon, form)
+);
+CREATE INDEX IF NOT EXISTS formsForm ON forms (form);
+CREATE TABLE IF NOT EXISTS types (
+    pokemon  TEXT NOT NULL,
+    form     TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    type     TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (pokemon, form, position)
+);
+CREATE INDEX IF NOT EXISTS typesType ON types (type);
+CREATE TABLE IF NOT EXISTS abilities (
+    pokemon  TEXT NOT NULL,
+    form     TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    ability  TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (pokemon, form, position)
+);
+CREATE INDEX IF NOT EXISTS abilitiesAbility ON abilities (ability);
+"""
+# The 31 values of a pokeRecord.FormStats
+statStruct = struct.Struct("<31H")
+# Columns of forms with the base stats, in the order of pokeRecord.statNames
+statColumns = ("hp", "attack", "defense", "spAtk", "spDef", "speed")
+numberRE = re.compile(r"\d+")
+# Subqueries of find() that select the Pokemon matching each filter
+filterQueries = {
+    "natDexNo": "SELECT name FROM pokemon WHERE natDexNo = ?",
+    "type": "SELECT pokemon FROM types WHERE type = ?",
+    "ability": "SELECT pokemon FROM abilities WHERE ability = ?",
+    # Prefix matches such as "mega" for "Mega Charizard X" use the index
+    "form": "SELECT pokemon FROM forms WHERE form LIKE ? ESCAPE '\\'",
+}
+
+
+def dexNumber(natDexNo):
+    """Return a National Dex number such as "#025" as an int.
+
+    Returns None if there's no number in it.
+    Keyword arguments:
+    natDexNo -- the number as it appears on Bulbapedia
+    """
+    match = numberRE.search(str(natDexNo or ""))
+    return None if (match is None) else int(match.group(0))
+
+
+class PokeStore:
+    """SQLite database of the Pokedex index and the crawled records.
+
+    Lookups by name, National Dex number, type, ability and form are answered
+    from indexes so only the rows that are asked for are read. The database
+    uses write-ahead logging so the crawler and every bot process can read
+    it while another one writes to it.
+    It can be attached to a PokeCache like a PokeSnapshot, whose interface
+    it shares, and it shares the records fetched by each of the bot's
+    processes with the others.
+    """
+    def __init__(self, dbFile):
+        """Open the database, creating the tables if they don't exist.
+
+        Keyword arguments:
+        dbFile -- the SQLite database file
+        """
+        self.dbFile = dbFile
+        self.db = sqlite3.connect(dbFile)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(schema)
+        # Databases written before fetched and dexText were added don't have
+        # the columns
+        columns = [row[1] for row in
+                   self.db.execute("PRAGMA table_info(pokemon)")]
+        for (column, columnType) in (("fetched", "REAL"), ("dexText", "TEXT")):
+            if (column not in columns):
+                with self.db:
+                    self.db.execute("ALTER TABLE pokemon ADD COLUMN {} {}"
+                                    .format(column, columnType))
+
+    def __contains__(self, pokemon):
+        return self.db.execute("SELECT 1 FROM pokemon WHERE name = ?",
+                               (pokemon,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT count(*) FROM pokemon").fetchone()[0]
+
+    def recordCount(self):
+        """Return the number of Pokemon with crawled records."""
+        return self.db.execute("""SELECT count(*) FROM pokemon
+                                  WHERE category IS NOT NULL""").fetchone()[0]
+
+    def names(self):
+        """Return the names of every Pokemon in the Pokedex index."""
+        return [name for (name,) in
+                self.db.execute("SELECT name FROM pokemon")]
+
+    def url(self, pokemon):
+        """Return a Pokemon's Bulbapedia URL or None if it isn't indexed.
+
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        """
+        row = self.db.execute("SELECT url FROM pokemon WHERE name = ?",
+                              (pokemon,)).fetchone()
+        return None if (row is None) else row[0]
+
+    def _forms(self, table, column, pokemon):
+        """Return a Pokemon's types or abilities as form -> tuple."""
+        forms = dict()
+        for (form, value) in self.db.execute(
+                "SELECT form, {} FROM {} WHERE pokemon = ? "
+                "ORDER BY form, position".format(column, table), (pokemon,)):
+            forms.setdefault(form, []).append(value)
+        return {form: tuple(values) for (form, values) in forms.items()}
+
+    def get(self, pokemon):
+        """Return a Pokemon's PokeRecord.
+
+        Returns None if the Pokemon's page hasn't been crawled.
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        """
+        row = self.db.execute("""SELECT url, natDexNo, category, img, dexText
+                                 FROM pokemon WHERE name = ?""",
+                              (pokemon,)).fetchone()
+        if ((row is None) or (row[2] is None)):
+            return None
+        (url, natDexNo, category, img, dexText) = row
+        # Records stored before dexText was added only have the number
+        if ((dexText is None) and (natDexNo is not None)):
+            dexText = "#{:03d}".format(natDexNo)
+        baseStats = {form: FormStats(statStruct.unpack(stats))
+                     for (form, stats) in self.db.execute(
+                         "SELECT form, stats FROM forms WHERE pokemon = ?",
+                         (pokemon,))}
+        return PokeRecord(category=category,
+                          natDexNo=dexText or "",
+                          img=img,
+                          types=self._forms("types", "type", pokemon),
+                          abilities=self._forms("abilities", "ability",
+                                                pokemon),
+                          baseStats=baseStats,
+                          url=url)
+
+    def getNewer(self, pokemon, newerThan=0):
+        """Return (PokeRecord, fetched) if the bot fetched a newer record.
+
+        Returns None if the Pokemon's record was written by a crawler or was
+        fetched at or before newerThan.
+        Keyword arguments:
+        pokemon   -- the name of the Pokemon
+        newerThan -- the time the caller's own record was fetched
+        """
+        row = self.db.execute("SELECT fetched FROM pokemon WHERE name = ?",
+                              (pokemon,)).fetchone()
+        if ((row is None) or (row[0] is None) or (row[0] <= newerThan)):
+            return None
+        record = self.get(pokemon)
+        return None if (record is None) else (record, row[0])
+
+    def find(self, natDexNo=None, type=None, ability=None, form=None):
+        """Return the names of the Pokemon that match every filter.
+
+        The Pokemon are sorted by National Dex number.
+        Keyword arguments:
+        natDexNo -- the National Dex number as an int
+        type     -- a type that one of the Pokemon's forms has
+        ability  -- an ability that one of the Pokemon's forms can have
+        form     -- the start of the name of one of the Pokemon's forms
+        """
+        filters = {"natDexNo": natDexNo, "type": type, "ability": ability}
+        if (form is not None):
+            escaped = re.sub(r"([\\%_])", r"\\\1", form)
+            filters["form"] = "{}%".format(escaped)
+        clauses = []
+        params = []
+        for (name, value) in sorted(filters.items()):
+            if (value is not None):
+                clauses.append("name IN ({})".format(filterQueries[name]))
+                params.append(value)
+        query = "SELECT name FROM pokemon"
+        if (len(clauses) > 0):
+            query += " WHERE {}".format(" AND ".join(clauses))
+        query += " ORDER BY natDexNo, name"
+        return [name for (name,) in self.db.execute(query, params)]
+
+    def statRows(self):
+        """Return the base stats of every form.
+
+        The rows are (Pokemon, form, National Dex number, the base stats in
+        statColumns order, total). Stats that couldn't be parsed are None.
+        """
+        return self.db.execute("""SELECT pokemon, form, natDexNo, {}, total
+                                  FROM forms JOIN pokemon
+                                  ON pokemon.name = forms.pokemon
+                                  ORDER BY natDexNo, pokemon, form""".format(
+                                      ", ".join(statColumns))).fetchall()
+
+    def formRows(self, table):
+        """Return every Pokemon's types or abilities as (Pokemon, form, value).
+
+        Keyword arguments:
+        table -- "types" or "abilities"
+        """
+        column = {"types": "type", "abilities": "ability"}[table]
+        return self.db.execute("SELECT pokemon, form, {} FROM {}".format(
+            column, table)).fetchall()
+
+    def _putURL(self, pokemon, url, natDexNo=None):
+        """Add a Pokemon to the index or update its URL."""
+        self.db.execute("""INSERT INTO pokemon (name, url, natDexNo)
+                           VALUES (?, ?, ?)
+                           ON CONFLICT (name) DO UPDATE SET
+                           url = excluded.url,
+                           natDexNo = coalesce(excluded.natDexNo, natDexNo)""",
+                        (pokemon, url, natDexNo))
+
+    def _putRecord(self, pokemon, record, fetched=None):
+        """Replace a Pokemon's record."""
+        url = record.url or self.url(pokemon)
+        if (url is None):
+            logging.error("Not storing {} since it has no URL".format(pokemon))
+            return
+        self.db.execute("""INSERT OR REPLACE INTO pokemon
+                           (name, url, natDexNo, category, img, fetched,
+                            dexText)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (pokemon, url, dexNumber(record.natDexNo),
+                         record.category, record.img, fetched,
+                         record.natDexNo))
+        for table in ("forms", "types", "abilities"):
+            self.db.execute("DELETE FROM {} WHERE pokemon = ?".format(table),
+                            (pokemon,))
+        for (form, stats) in record.baseStats.items():
+            bases = [stats.base(i) for i in range(len(statColumns))]
+            bases.append(stats.total)
+            self.db.execute(
+                "INSERT INTO forms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [pokemon, form] +
+                [None if (value == missing) else value for value in bases] +
+                [statStruct.pack(*stats.values)])
+        for (table, forms) in (("types", record.types),
+                               ("abilities", record.abilities)):
+            self.db.executemany(
+                "INSERT INTO {} VALUES (?, ?, ?, ?)".format(table),
+                [(pokemon, form, position, value)
+                 for (form, values) in forms.items()
+                 for (position, value) in enumerate(values)])
+
+    def putURLs(self, pokedex, numbers=None):
+        """Add or update the Pokemon in the Pokedex index.
+
+        Crawled records are kept.
+        Keyword arguments:
+        pokedex -- a dictionary of Pokemon names -> Bulbapedia URLs
+        numbers -- a dictionary of Pokemon names -> National Dex numbers
+        """
+        if (numbers is None):
+            numbers = dict()
+        with self.db:
+            for (pokemon, url) in pokedex.items():
+                self._putURL(pokemon, url, numbers.get(pokemon))
+
+    def put(self, pokemon, record, fetched=None):
+        """Add or replace a Pokemon's record.
+
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        record  -- the PokeRecord, whose url is kept if it's None
+        fetched -- the time the bot fetched the record, None for a crawler
+        """
+        with self.db:
+            self._putRecord(pokemon, record, fetched)
+
+    def putRecords(self, nationalDex):
+        """Add or replace every Pokemon in a crawled Pokedex at once.
+
+        Keyword arguments:
+        nationalDex -- a dictionary like the one in pokedex.json, in either
+                       the PokeRecord.toDict format or the old ";"-joined
+                       format
+        """
+        count = 0
+        with self.db:
+            for (pokemon, info) in nationalDex.items():
+                if ("baseStats" not in info):
+                    self._putURL(pokemon, info["url"])
+                    continue
+                self._putRecord(pokemon, PokeRecord.fromDict(info))
+                count += 1
+        return count
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+
+class StoreWriter:
+    """Runs a PokeStore's writes in a thread of their own.
+
+    A write waits up to SQLite's 5 second busy timeout while the crawler or
+    another of the bot's processes holds the write lock, so writes are kept
+    off the event loop. The thread opens its own connection since a SQLite
+    connection can only be used by the thread that opened it, and it runs
+    the writes one at a time in the order they were made.
+    """
+    def __init__(self, dbFile):
+        """Keyword arguments:
+        dbFile -- the SQLite database file
+        """
+        self.dbFile = dbFile
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Opened by the writer thread on the first write
+        self.store = None
+
+    def _call(self, method, args):
+        """Call a PokeStore method in the writer thread."""
+        if (self.store is None):
+            self.store = PokeStore(self.dbFile)
+        return getattr(self.store, method)(*args)
+
+    def run(self, method, *args):
+        """Return a future that calls a PokeStore method in the thread.
+
+        Keyword arguments:
+        method -- the name of the method, e.g. "put"
+        args   -- the arguments of the method
+        """
+        return asyncio.wrap_future(self.executor.submit(self._call, method,
+                                                        args))
+
+    def _close(self):
+        """Close the writer thread's connection."""
+        if (self.store is not None):
+            self.store.close()
+            self.store = None
+
+    def close(self):
+        """Finish the pending writes and close the connection."""
+        self.executor.submit(self._close)
+        self.executor.shutdown(wait=True)
+
+
+def writeStore(nationalDex, dbFile):
+    """Add every Pokemon in a crawled Pokedex to a store.
+
+    The store is updated in place rather than replaced so that the bot can
+    keep reading it.
+    Keyword arguments:
+    nationalDex -- a dictionary like the one in pokedex.json
+    dbFile      -- the SQLite database file
+    """
+    store = PokeStore(dbFile)
+    try:
+        return store.putRecords(nationalDex)
+    finally:
+        store.close()
+
+
+def help(returnCode):
+    info = """\
+Usage: %s [options...]
+  -h, --help            Print this help message
+  -i, --input FILE      Pokedex JSON to add (default: pokedex.json)
+  -o, --output FILE     SQLite database to write (default: pokedex.db)
+""" % path.split(__file__)[1]
+    print(info)
+    exit(returnCode)
+
+
+def main(argv):
+    logFormat = "%(asctime)s %(levelname)s %(message)s"
+    dateFormat = "%Y-%m-%d %H:%M:%S UTC-%z"
+    logging.basicConfig(format=logFormat, datefmt=dateFormat, level=10)
+    shortOpts = "hi:o:"
+    longOpts = ["help", "input=", "output="]
+    try:
+        opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
+    except getopt.GetoptError as e:
+        logging.error(e)
+        help(2)
+    inputFile = "pokedex.json"
+    outputFile = "pokedex.db"
+    for (o, a) in opts:
+        if (o in ("-h", "--help")):
+            help(2)
+        elif (o in ("-i", "--input")):
+            inputFile = a
+        elif (o in ("-o", "--output")):
+            outputFile = a
+    try:
+        with open(inputFile, "r") as f:
+            nationalDex = json.load(f)
+    except Exception as e:
+        logging.error("Error reading {}".format(inputFile))
+        logging.error(e)
+        exit(1)
+    count = writeStore(nationalDex, outputFile)
+    logging.debug("Wrote {} Pokemon to {}".format(count, outputFile))
+    return
+
+
+if __name__ == '__main__':
+    main(argv)
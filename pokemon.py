@@ -1,25 +1,119 @@
 # TODO: FIX INDENTATION TO REMOVE THIS ERROR
 #       PEP8-COMPLIANT MEANS 4 SPACES/TAB
+import asyncio
+import json
 import logging
 import re
+import time
+from os import path
 
-import aiohttp
 import discord
-from bs4 import BeautifulSoup
 from discord.ext import commands
-from asyncTest import saveDict
-
-user_agent = """\
-Mozilla/5.0 (Windows; U; Windows NT 10.0; rv:10.0) Gecko/20100101 Firefox/52.0\
-"""
-sendHeader = {'User-Agent': user_agent, }
+import metrics
+import sharding
+from pokeCache import LRUCache, PokeCache
+from pokeRecord import FormStats, PokeRecord, statNames
+from pokeStore import PokeStore, StoreWriter
+from singleFlight import SingleFlight
+from upstream import upstreamURL
+
+# Limits for the cache of rendered embeds
+embedCacheSize = 128          # Maximum number of embeds
+embedCacheBytes = 1024 * 1024  # Maximum combined size of the embeds
+# Limits for !team
+maxTeamSize = 6         # Maximum number of Pokemon to compare
+lookupConcurrency = 4   # Maximum number of pages downloaded at once
+# Maximum number of Pokemon listed by !dex
+maxDexResults = 60
+# A National Dex number such as "25" or "#025"
+dexNoRE = re.compile(r"^#?(\d+)$")
+# A cell of the Pokedex list with a Pokemon's regional or National Dex number
+listNoRE = re.compile(r"#(\d+)")
+
+
+def embedSize(embed):
+    """Return the approximate size of an embed's payload in bytes.
+
+    Keyword arguments:
+    embed -- the Discord Embed object
+    """
+    return len(json.dumps(embed.to_dict()))
 
 
 class Pokemon:
     """Pokemon related commands."""
-    def __init__(self, bot):
+    def __init__(self, bot, httpClient, cogDir=None):
+        """Create the cog and open its data files.
+
+        Keyword arguments:
+        bot        -- the bot the cog is added to
+        httpClient -- the HTTP client shared by every cog
+        cogDir     -- the directory with the cog's data files, the directory
+                      this file is in by default
+        """
         self.bot = bot
-        self.pokedex = None
+        # The HTTP client shared by every cog
+        self.httpClient = httpClient
+        # Aliases and "did you mean" suggestions built from self.store
+        self.names = None
+        if (cogDir is None):
+            cogDir = path.split(__file__)[0]
+        self._warmUpTask = None
+        self.cache = PokeCache(path.join(cogDir, "pokeCache.json"))
+        # The Pokedex index and the crawled records, indexed by name, National
+        # Dex number, type, ability and form
+        self.store = PokeStore(path.join(cogDir, "pokedex.db"))
+        if (len(self.store) == 0):
+            self._importPokedex(cogDir)
+        # Writes to the store run in a thread so they can't block the bot
+        self.storeWriter = StoreWriter(self.store.dbFile)
+        # Records that aren't cached are read from the store
+        self.cache.attachSnapshot(self.store)
+        # Pick up the records fetched by the bot's other processes
+        if (sharding.shardIDs is not None):
+            self.cache.attachStore(self.store)
+            self.cache.readOnly = not sharding.isLeader
+        # Pokemon currently being refreshed in the background
+        self._refreshing = set()
+        # Coalesces concurrent downloads of the same page
+        self.flights = SingleFlight()
+        # Rendered embeds keyed by (Pokemon, record version)
+        self.embedCache = LRUCache(maxEntries=embedCacheSize,
+                                   maxBytes=embedCacheBytes,
+                                   sizeOf=embedSize)
+        # Bounds the downloads started by every !team at once
+        self.lookupSlots = asyncio.BoundedSemaphore(lookupConcurrency)
+        # statQuery.StatTable for !query, updated as pages are fetched
+        self.statTable = None
+
+    def _importPokedex(self, cogDir):
+        """Fill an empty store from a crawler's pokedex.bin or pokedex.json.
+
+        Keyword arguments:
+        cogDir -- the directory that the crawlers' output is in
+        """
+        snapshotFile = path.join(cogDir, "pokedex.bin")
+        dexFile = path.join(cogDir, "pokedex.json")
+        try:
+            if (path.exists(snapshotFile)):
+                # Imported on first use since the snapshot is only read once
+                from pokeSnapshot import PokeSnapshot
+                snapshot = PokeSnapshot(snapshotFile)
+                nationalDex = {pokemon: snapshot.get(pokemon).toDict()
+                               for pokemon in snapshot.names()}
+                snapshot.close()
+            elif (path.exists(dexFile)):
+                with open(dexFile, "r") as f:
+                    nationalDex = json.load(f)
+            else:
+                return
+            count = self.store.putRecords(nationalDex)
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error importing the crawled Pokedex")
+            return
+        logging.info("Imported {} Pokemon into {}".format(
+            count, self.store.dbFile))
 
     def _getPokeCategory(self, tble, poke):
         """Get a Pokemon's category from its Bulbapedia page.
@@ -115,12 +209,7 @@ Error getting National Pokedex number for {}\
                 else:
                     key = poke
                 for type in typeTable.find_all(name="a", title=typeRE):
-                    if (key in pokeTypes):
-                        # pokeTypes[key] = pokeTypes[key] + ";" + type.string
-                        pokeTypes[key] = "{};{}".format(pokeTypes[key],
-                                                        type.string)
-                    else:
-                        pokeTypes[key] = type.string
+                    pokeTypes.setdefault(key, []).append(type.string)
         except Exception as e:
             logging.error(e)
             logging.error("Error getting types for {}".format(poke))
@@ -161,11 +250,7 @@ Error getting National Pokedex number for {}\
                         # Pokemon may have multiple possible abilities
                         # e.g. Snorlax may normally have Immunity or Thick Fat
                     for link in ability.find_all(name="a"):
-                        if (key in abilities):
-                            abilities[key] = "{};{}".format(abilities[key],
-                                                            link.string)
-                        else:
-                            abilities[key] = link.string
+                        abilities.setdefault(key, []).append(link.string)
         except Exception as e:
             logging.error(e)
             logging.error("Error getting abilities for {}".format(poke))
@@ -217,8 +302,8 @@ Error getting National Pokedex number for {}\
                     return temp
 
                 key = baseStat.a.string
-                tempDict[key] = """\
-{};{};{}""".format(getNextNext(baseStat, "th", True), range50, range100)
+                tempDict[key] = (getNextNext(baseStat, "th", True),
+                                 range50, range100)
                 # Do this 5 more times (total of 6) to get all of the stats
                 for i in range(0, 5):
                     baseStat = getNextNext(baseStat, "td")
@@ -226,11 +311,11 @@ Error getting National Pokedex number for {}\
                     range100 = range50.find_next(name="small").string
                     range50 = range50.string
                     key = baseStat.a.string
-                    tempDict[key] = """\
-{};{};{}""".format(getNextNext(baseStat, "th", True), range50, range100)
+                    tempDict[key] = (getNextNext(baseStat, "th", True),
+                                     range50, range100)
                 baseStat = getNextNext(baseStat, "td")
                 tempDict["Total"] = getNextNext(baseStat, "th", True)
-                baseStats[title] = tempDict
+                baseStats[title] = FormStats.fromParsed(tempDict)
         except Exception as e:
             logging.error(e)
             logging.error("Error getting base stats for {}".format(poke))
@@ -238,7 +323,7 @@ Error getting National Pokedex number for {}\
         return baseStats
 
     def _getPokeData(self, soup, poke):
-        """Get a Pokemon's data from its Bulbapedia page.
+        """Get a Pokemon's data from its Bulbapedia page as a PokeRecord.
 
         Keyword arguments:
         soup -- the BeautifulSoup object of the Pokemon's page
@@ -272,37 +357,25 @@ Error getting National Pokedex number for {}\
         for key in pokeDict:
             if (not pokeDict[key]):
                 return False
-        return pokeDict
+        return PokeRecord(**pokeDict)
 
     def _createDiscordEmbed(self, info, poke):
         """Create a formatted Discord Embed object for a Pokemon.
 
         Keyword arguments:
-        info -- the dictionary containing the Pokemon's information
+        info -- the PokeRecord containing the Pokemon's information
         poke -- the name of the Pokemon
         """
         pokeName = self._titlecase(poke.replace("_", " "))
-
-        def unicodeFix(str):
-            """Replace certain substrings with Unicode characters.
-
-            Return a copy of str with certain substrings replaced with Unicode
-            characters.
-            Keyword arguments:
-            str -- the string to copy and modify
-            """
-            temp = re.sub("[ _]\([fF]\)", "\u2640", str)
-            temp = re.sub("[ _]\([mM]\)", "\u2642", temp)
-            return temp
-
+        unicodeFix = self._unicodeFix
         pokeName = unicodeFix(pokeName)
         embed = discord.Embed(title=pokeName,
-                              description="{}: {}".format(info["natDexNo"],
-                                                          info["category"]),
-                              url=self.pokedex[poke])
-        types = info["types"]
-        abilities = info["abilities"]
-        baseStats = info["baseStats"]
+                              description="{}: {}".format(info.natDexNo,
+                                                          info.category),
+                              url=self.store.url(poke))
+        types = info.types
+        abilities = info.abilities
+        baseStats = info.baseStats
 
         def addField(fieldDict: dict, name: str, inline: bool=False):
             """Add a field to the embed containing the items in the dict.
@@ -314,11 +387,11 @@ Error getting National Pokedex number for {}\
             """
             strList = []
             if (len(fieldDict) == 1):
-                strList.append(list(fieldDict.values())[0].replace(";", ", "))
+                strList.append(", ".join(list(fieldDict.values())[0]))
             else:
                 for item in sorted(fieldDict.items()):
                     strList.append("{}: {}".format(item[0],
-                                                   item[1].replace(";", ", ")))
+                                                   ", ".join(item[1])))
             embed.add_field(name=name,
                             value="\n".join(strList),
                             inline=inline)
@@ -331,28 +404,18 @@ Error getting National Pokedex number for {}\
         statStr.append("{:15}{:^12}{:^12}".format("",
                                                   "At Lv. 50", "At Lv. 100"))
 
-        def getValues(poke, stat):
-            """Return a list of values for a Pokemon's stat.
+        def appendStats(poke):
+            """Append formatted strs of a Pokemon's stats to the stat list.
 
             Keyword arguments:
             poke -- the name of the Pokemon
-            stat -- the stat to get
             """
-            return baseStats[poke][stat].split(";")
-
-        def appendStat(poke, stat):
-            """Append a formatted str of a Pokemon's stat to the stat list.
-
-            Keyword arguments:
-            poke -- the name of the Pokemon
-            stat -- the stat to get
-            """
-            tempStr = "{}:".format(stat)
-            if (stat.lower() != "total"):
-                formatStr = "{0:<9}{1[0]:<6}{1[1]:^12}{1[2]:^12}"
-            else:
-                formatStr = "{0:<9}{1[0]}"
-            statStr.append(formatStr.format(tempStr, getValues(poke, stat)))
+            stats = baseStats[poke]
+            formatStr = "{0:<9}{1[0]:<6}{1[1]:^12}{1[2]:^12}"
+            for (i, stat) in enumerate(statNames):
+                statStr.append(formatStr.format("{}:".format(stat),
+                                                stats.strings(i)))
+            statStr.append("{0:<9}{1}".format("Total:", stats.totalString()))
             return
 
         keys = sorted(baseStats.keys())
@@ -366,22 +429,65 @@ Error getting National Pokedex number for {}\
             if (count == 3):
                 break
             statStr.append(unicodeFix(key))
-            appendStat(key, "HP")
-            appendStat(key, "Attack")
-            appendStat(key, "Defense")
-            appendStat(key, "Sp.Atk")
-            appendStat(key, "Sp.Def")
-            appendStat(key, "Speed")
-            appendStat(key, "Total")
+            appendStats(key)
             count += 1
         statStr.append("```")
         embed.add_field(name="Base Stats",
                         value="\n".join(statStr),
                         inline=False)
-        embed.set_thumbnail(url=info["img"])
+        embed.set_thumbnail(url=info.img)
+        embed.set_footer(text="Source: https://bulbapedia.bulbagarden.net")
+        return embed
+
+    def _createTeamEmbed(self, team, notes):
+        """Create a Discord Embed object comparing several Pokemon.
+
+        Keyword arguments:
+        team  -- a list of (name of the Pokemon, PokeRecord) tuples
+        notes -- lines about the Pokemon that couldn't be compared
+        """
+        rows = ["{:<12}{:>4}{:>4}{:>4}{:>4}{:>4}{:>4}{:>6}".format(
+            "Pokemon", "HP", "Atk", "Def", "SpA", "SpD", "Spe", "Total")]
+        types = []
+        for (poke, info) in team:
+            pokeName = self._unicodeFix(self._titlecase(poke.replace("_", " ")))
+            # Compare the default forms
+            form = self._titlecase(poke.replace("_", " "))
+            if (form not in info.baseStats):
+                form = sorted(info.baseStats.keys())[0]
+            stats = info.baseStats[form]
+            rows.append("{:<12}{:>4}{:>4}{:>4}{:>4}{:>4}{:>4}{:>6}".format(
+                pokeName[:11],
+                *(stats.strings(i)[0] for i in range(len(statNames))),
+                stats.totalString()))
+            formTypes = info.types.get(form)
+            if (formTypes is None):
+                formTypes = info.types[sorted(info.types.keys())[0]]
+            types.append("[{}]({}) {}: {}".format(pokeName,
+                                                  self.store.url(poke),
+                                                  info.natDexNo,
+                                                  ", ".join(formTypes)))
+        embed = discord.Embed(title="Team Comparison",
+                              description="```{}```".format("\n".join(rows)))
+        embed.add_field(name="Types", value="\n".join(types), inline=False)
+        if (len(notes) > 0):
+            embed.add_field(name="Not Compared", value="\n".join(notes),
+                            inline=False)
         embed.set_footer(text="Source: https://bulbapedia.bulbagarden.net")
         return embed
 
+    def _unicodeFix(self, string):
+        """Replace certain substrings with Unicode characters.
+
+        Return a copy of string with certain substrings replaced with Unicode
+        characters.
+        Keyword arguments:
+        string -- the string to copy and modify
+        """
+        temp = re.sub("[ _]\([fF]\)", "\u2640", string)
+        temp = re.sub("[ _]\([mM]\)", "\u2642", temp)
+        return temp
+
     def _titlecase(self, string):
         """Titlecase workaround for a string with apostrophes.
 
@@ -403,13 +509,28 @@ Error getting National Pokedex number for {}\
         page = "/wiki/List_of_Pok%C3%A9mon_by_National_Pok%C3%A9dex_number"
         pokeUrl = "{}{}".format(baseURL, page)
         pokedex = dict()
-        async with session.get(pokeUrl) as response:
+        # Pokemon -> National Dex number
+        numbers = dict()
+        # Imported on first use since BeautifulSoup is slow to import
+        from soupUtils import makeSoup, tableStrainer
+        # Connection errors are raised by session.get before there's a response
+        response = None
+        with metrics.httpLatency.time("bulbapedia"):
             try:
-                assert(response.status == 200)
-                data = await response.read()
-                soup = BeautifulSoup(data, "html.parser")
+                async with session.get(upstreamURL(pokeUrl)) as response:
+                    assert(response.status == 200)
+                    data = await response.read()
             except Exception as e:
+                metrics.httpErrors.inc("bulbapedia",
+                                       metrics.errorReason(response, e))
                 logging.error(e)
+                return False
+        try:
+            with metrics.parseLatency.time("pokedex"):
+                soup = makeSoup(data, tableStrainer)
+        except Exception as e:
+            logging.error(e)
+            return False
         # Add more regions as needed
         regions = {"Kanto",
                    "Johto",
@@ -428,6 +549,8 @@ Error getting National Pokedex number for {}\
                 (not regions.isdisjoint(str(tableBody.th).split(" ")))):
                 rows = tableBody.find_all("tr")
                 for row in rows:
+                    # The National Dex number comes after any regional one
+                    rowNumbers = listNoRE.findall(row.get_text())
                     for link in row.find_all("a"):
                         URL = link.get("href")
                         if (("Pok%C3%A9mon" in URL) and
@@ -445,85 +568,437 @@ Error getting National Pokedex number for {}\
                             pokemon = pokemon.replace("%c3%a9", "é")
                             pokemon = pokemon.lower()
                             pokedex[pokemon] = "{}{}".format(baseURL, URL)
-        self.pokedex = pokedex
-        saveDict(pokedex, "asyncPokedex.json", "")
+                            if (len(rowNumbers) > 0):
+                                numbers[pokemon] = int(rowNumbers[-1])
+        try:
+            await self.storeWriter.run("putURLs", pokedex, numbers)
+        except Exception as e:
+            logging.error(e)
+            return False
+        self._loadNames()
         return
 
+    def _loadNames(self):
+        """Rebuild the name index from the Pokemon in the store."""
+        # Imported on first use since the index is built after startup
+        from pokeNames import NameIndex
+        self.names = NameIndex(set(self.store.names()))
+
+    def _loadPokeURLs(self):
+        """Load the Pokedex index from the store.
+
+        Returns False if the index has never been downloaded or imported.
+        """
+        if (len(self.store) == 0):
+            return False
+        # Don't rebuild an index that was downloaded in the meantime
+        if (self.names is None):
+            self._loadNames()
+        return True
+
+    async def warmUp(self):
+        """Load the Pokedex index from the store and then refresh it.
+
+        Commands can run as soon as the index is loaded. If the store is
+        empty they wait for the download started here.
+        """
+        start = time.time()
+        try:
+            self._loadStatTable()
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error building the stat table")
+        if (self._loadPokeURLs()):
+            logging.info("""Loaded {} Pokemon from {} in {:.3f} seconds\
+""".format(len(self.names), self.store.dbFile, time.time() - start))
+            # Only one of the bot's processes refreshes the shared index
+            if (not sharding.isLeader):
+                return
+        try:
+            await self.flights.do(("index",), self._getPokeURLs,
+                                  self.httpClient.session)
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error refreshing the Pokedex index")
+            return
+        logging.info("Pokedex warm-up finished in {:.3f} seconds".format(
+            time.time() - start))
+
+    def _loadStatTable(self):
+        """Return the stat table for !query, building it if needed.
+
+        Returns None if NumPy isn't installed.
+        """
+        # Imported on first use since NumPy is slow to import
+        import statQuery
+        if (statQuery.numpy is None):
+            return None
+        if (self.statTable is None):
+            start = time.time()
+            self.statTable = statQuery.StatTable(self.store)
+            logging.info("Built the stat table of {} forms in {:.3f} seconds\
+".format(len(self.statTable), time.time() - start))
+        return self.statTable
+
+    def startWarmUp(self):
+        """Start warming up the Pokedex index without blocking the bot."""
+        if (self._warmUpTask is None):
+            self._warmUpTask = asyncio.ensure_future(self.warmUp())
+
+    async def on_ready(self):
+        # on_ready is also dispatched after reconnecting
+        self.startWarmUp()
+
+    def __unload(self):
+        """Stop the warm-up, save the cache and close the store."""
+        if (self._warmUpTask is not None):
+            self._warmUpTask.cancel()
+        self.cache.save()
+        self.storeWriter.close()
+        self.store.close()
+
+    async def _fetchPokeData(self, session, pokemon):
+        """Download and parse a Pokemon's Bulbapedia page and cache it.
+
+        Keyword arguments:
+        session -- the aiohttp session to use
+        pokemon -- the name of the Pokemon
+        """
+        # Imported on first use since BeautifulSoup is slow to import
+        from soupUtils import makeFullSoup, makeSoup, pokePageStrainer
+        # Get the Bulbapedia URL
+        URL = self.store.url(pokemon)
+        # Get the Bulbapedia page
+        # Connection errors are raised by session.get before there's a response
+        response = None
+        with metrics.httpLatency.time("bulbapedia"):
+            try:
+                async with session.get(upstreamURL(URL)) as response:
+                    assert(response.status == 200)
+                    data = await response.read()
+            except Exception as e:
+                metrics.httpErrors.inc("bulbapedia",
+                                       metrics.errorReason(response, e))
+                logging.error(e)
+                return False
+        with metrics.parseLatency.time("pokemon"):
+            # Get a BeautifulSoup object of only the parts of the page we use
+            try:
+                soup = makeSoup(data, pokePageStrainer)
+            except Exception as e:
+                logging.error(e)
+                return False
+            # Get the Pokemon's information from the BeautifulSoup object
+            pokeDict = self._getPokeData(soup, pokemon)
+            if (not pokeDict):
+                # Retry with the whole page in case the page layout has changed
+                logging.debug("Reparsing the whole page for {}".format(
+                    pokemon))
+                pokeDict = self._getPokeData(makeFullSoup(data), pokemon)
+        if (not pokeDict):
+            logging.error("""Something went wrong while getting data from the \
+BeautifulSoup object for the Pokemon '{}'.""".format(pokemon))
+            return False
+        pokeDict.url = URL
+        self.cache.put(pokemon, pokeDict)
+        try:
+            # Shares the record with the bot's other processes
+            await self.storeWriter.run("put", pokemon, pokeDict,
+                                       self.cache.version(pokemon))
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error storing {}".format(pokemon))
+        # Include the new stats in the next !query
+        if (self.statTable is not None):
+            self.statTable.update(pokemon, pokeDict)
+        # Drop embeds rendered from the previous version of the record
+        self.embedCache.invalidate(lambda key: key[0] == pokemon)
+        return pokeDict
+
+    async def _refreshPokeData(self, pokemon):
+        """Refresh a stale cache entry in the background.
+
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        """
+        try:
+            await self.flights.do(("page", pokemon), self._fetchPokeData,
+                                  self.httpClient.session, pokemon)
+        except Exception as e:
+            logging.error(e)
+            logging.error("Error refreshing {}".format(pokemon))
+        finally:
+            self._refreshing.discard(pokemon)
+
+    async def _getPokeInfo(self, session, pokemon):
+        """Get a Pokemon's data from the cache or from its Bulbapedia page.
+
+        Stale cache entries are returned immediately and refreshed in the
+        background.
+        Keyword arguments:
+        session -- the aiohttp session to use
+        pokemon -- the name of the Pokemon
+        """
+        (pokeDict, fresh) = self.cache.get(pokemon)
+        metrics.cacheLookups.inc("record", ("miss" if (pokeDict is None) else
+                                            "hit" if fresh else "stale"))
+        if (pokeDict is None):
+            # Concurrent lookups of the same Pokemon share one download
+            return await self.flights.do(("page", pokemon),
+                                         self._fetchPokeData,
+                                         session, pokemon)
+        if ((not fresh) and (pokemon not in self._refreshing)):
+            self._refreshing.add(pokemon)
+            asyncio.ensure_future(self._refreshPokeData(pokemon))
+        return pokeDict
+
+    def _getPokeEmbed(self, info, poke):
+        """Get a Pokemon's embed from the embed cache or render it.
+
+        Keyword arguments:
+        info -- the PokeRecord containing the Pokemon's information
+        poke -- the name of the Pokemon
+        """
+        key = (poke, self.cache.version(poke))
+        embed = self.embedCache.get(key)
+        metrics.cacheLookups.inc("embed", "miss" if (embed is None) else "hit")
+        if (embed is None):
+            with metrics.embedLatency.time():
+                embed = self._createDiscordEmbed(info, poke)
+            self.embedCache.put(key, embed)
+        return embed
+
+    async def _loadPokedex(self, ctx, session):
+        """Make sure the Pokedex index has been loaded.
+
+        Returns False after telling the user if it couldn't be loaded.
+        Keyword arguments:
+        ctx     -- the context of the command
+        session -- the aiohttp session to use
+        """
+        # Setup the dictionary with all of the URL's first
+        if (self.names is None):
+            await self.flights.do(("index",), self._getPokeURLs, session)
+        if (self.names is None):
+            await ctx.send("```Unable to get the Pokedex from Bulbapedia.```")
+            return False
+        return True
+
+    def _resolve(self, species):
+        """Return the name of the Pokemon a query refers to or None.
+
+        Keyword arguments:
+        species -- a name, a nickname or a National Dex number e.g. "25"
+        """
+        match = dexNoRE.match(species)
+        if (match is not None):
+            found = self.store.find(natDexNo=int(match.group(1)))
+            return found[0] if (len(found) > 0) else None
+        return self.names.resolve(species)
+
+    async def _lookUpPokemon(self, session, pokemon):
+        """Get a Pokemon's data while holding one of the lookup slots.
+
+        Keyword arguments:
+        session -- the aiohttp session to use
+        pokemon -- the name of the Pokemon
+        """
+        async with self.lookupSlots:
+            return await self._getPokeInfo(session, pokemon)
+
     @commands.command()
     async def pokemon(self, ctx, *search: str):
-        """Look up a Pokemon on Bulbapedia"""
+        """Look up a Pokemon on Bulbapedia by name or National Dex number"""
         errorMsg = ["Invalid Pokemon '{}' specified.".format(" ".join(search)),
                     "Please specify a valid Pokemon to look up."]
         if (len(search) < 1):
             await ctx.send("```{0[1]}```".format(errorMsg))
             return
-        # Share a client session so it will not open a new session for each request
-        async with aiohttp.ClientSession() as session:
-            # Setup the dictionary with all of the URL's first
-            if (self.pokedex is None):
-                await self._getPokeURLs(session)
-            species = "_".join(search).lower()
-            species = species.replace("mega_", "")
-            URL = ""
-            pokemon = ""
-            # TODO: LOOK INTO MAKING THESE DICTIONARY ENTRIES INSTEAD OF CONDITIONALS
-            if (species in self.pokedex):
-                pokemon = species
-            elif (species == "derpkip"):
-                pokemon = "mudkip"
-            elif (species == "farfetchd"):
-                pokemon = "farfetch'd"
-            elif (species == "flabebe"):
-                pokemon = "flabébé"
-            elif ((species == "hakamoo") or (species == "hakamo_o")):
-                pokemon = "hakamo-o"
-            elif ((species == "ho_oh") or (species == "hooh")):
-                pokemon = "ho-oh"
-            elif ((species == "jangmoo") or (species == "jangmo_o")):
-                pokemon = "jangmo-o"
-            elif ((species == "kommoo") or (species == "kommo_o")):
-                pokemon = "kommo-o"
-            elif (species == "mime_jr"):
-                pokemon = "mime_jr."
-            elif (species == "mr_mime"):
-                pokemon = "mr._mime"
-            elif ((species == "porygon_z") or (species == "porygonz")):
-                pokemon = "porygon-z"
-            elif (species == "type_null"):
-                pokemon = "type:_null"
-            elif (species == "nidoran"):
-                await ctx.send("""```Please specify either Nidoran (F) or\
- Nidoran (M).```""")
-                return
-            elif (species == "nidoran_f"):
-                pokemon = "nidoran_(f)"
-            elif (species == "nidoran_m"):
-                pokemon = "nidoran_(m)"
+        # Use the bot's shared client session
+        session = self.httpClient.session
+        if (not await self._loadPokedex(ctx, session)):
+            return
+        species = "_".join(search).lower()
+        species = species.replace("mega_", "")
+        pokemon = self._resolve(species)
+        if (pokemon is None):
+            suggestions = self.names.suggest(species)
+            if (len(suggestions) > 0):
+                await ctx.send("```{} Did you mean {}?```".format(
+                    errorMsg[0],
+                    " or ".join(self._titlecase(s.replace("_", " "))
+                                for s in suggestions)))
             else:
                 await ctx.send("```{0[0]} {0[1]}```".format(errorMsg))
-                return
-            # Get the Bulbapedia URL
-            URL = self.pokedex[pokemon]
-            # Get the Bulbapedia page
-            async with session.get(URL) as response:
-                try:
-                    assert(response.status == 200)
-                    data = await response.read()
-                except Exception as e:
-                    logging.error(e)
+            return
+        # Get the Pokemon's information from the cache or Bulbapedia
+        pokeDict = await self._getPokeInfo(session, pokemon)
+        if (not pokeDict):
+            return
+        pokeEmbed = self._getPokeEmbed(pokeDict, pokemon)
+        await ctx.send(embed=pokeEmbed)
+        return
+
+    @commands.command()
+    async def team(self, ctx, *search: str):
+        """Compare up to 6 Pokemon separated by spaces or commas"""
+        if (len(search) < 1):
+            await ctx.send("```Please specify up to {} Pokemon to compare, \
+e.g. !team charizard, mr. mime, type: null```".format(maxTeamSize))
+            return
+        session = self.httpClient.session
+        if (not await self._loadPokedex(ctx, session)):
+            return
+        # Commas allow names with spaces such as "Mr. Mime"
+        text = " ".join(search)
+        queries = text.split(",") if ("," in text) else search
+        queries = [query.strip() for query in queries if query.strip()]
+        notes = []
+        if (len(queries) > maxTeamSize):
+            notes.append("Only the first {} Pokemon are compared".format(
+                maxTeamSize))
+            queries = queries[:maxTeamSize]
+        team = []
+        for query in queries:
+            species = "_".join(query.lower().split()).replace("mega_", "")
+            pokemon = self._resolve(species)
+            if (pokemon is None):
+                suggestions = self.names.suggest(species, limit=1)
+                notes.append("Unknown Pokemon '{}'{}".format(
+                    query, "".join(" (did you mean {}?)".format(
+                        self._titlecase(s.replace("_", " ")))
+                        for s in suggestions)))
+            elif (pokemon not in team):
+                team.append(pokemon)
+        # Download and parse every page at once, bounded by self.lookupSlots
+        results = await asyncio.gather(
+            *[self._lookUpPokemon(session, pokemon) for pokemon in team],
+            return_exceptions=True)
+        compared = []
+        for (pokemon, info) in zip(team, results):
+            if (isinstance(info, Exception)):
+                logging.error(info)
+                info = None
+            if (not info):
+                notes.append("Unable to get {} from Bulbapedia".format(
+                    self._titlecase(pokemon.replace("_", " "))))
+            else:
+                compared.append((pokemon, info))
+        if (len(compared) == 0):
+            await ctx.send("```{}```".format("\n".join(notes)))
+            return
+        await ctx.send(embed=self._createTeamEmbed(compared, notes))
+        return
+
+    @commands.command()
+    async def dex(self, ctx, *filters: str):
+        """List Pokemon by type, ability or form e.g. !dex type=fire"""
+        usage = """```Please specify filters such as type=fire, \
+ability=thick fat, form=mega or number=25```"""
+        # Filter names -> arguments of PokeStore.find
+        filterNames = {"type": "type",
+                       "ability": "ability",
+                       "form": "form",
+                       "number": "natDexNo",
+                       "no": "natDexNo",
+                       }
+        query = dict()
+        key = None
+        for word in filters:
+            (name, equals, value) = word.partition("=")
+            if (equals):
+                key = filterNames.get(name.lower())
+                if (key is None):
+                    await ctx.send(usage)
                     return
-        # Get a BeautifulSoup object
+                query[key] = value
+            elif (key is not None):
+                # Values with spaces such as "ability=thick fat"
+                query[key] = "{} {}".format(query[key], word)
+            else:
+                await ctx.send(usage)
+                return
+        if (len(query) == 0):
+            await ctx.send(usage)
+            return
+        if ("natDexNo" in query):
+            match = dexNoRE.match(query["natDexNo"])
+            if (match is None):
+                await ctx.send(usage)
+                return
+            query["natDexNo"] = int(match.group(1))
+        found = self.store.find(**query)
+        if (len(found) == 0):
+            await ctx.send("```No Pokemon match {}```".format(
+                " ".join(filters)))
+            return
+        names = [self._unicodeFix(self._titlecase(pokemon.replace("_", " ")))
+                 for pokemon in found[:maxDexResults]]
+        more = ""
+        if (len(found) > maxDexResults):
+            more = " and {} more".format(len(found) - maxDexResults)
+        await ctx.send("```{} Pokemon: {}{}```".format(len(found),
+                                                      ", ".join(names), more))
+        return
+
+    @commands.command()
+    async def query(self, ctx, *terms: str):
+        """Search base stats e.g. !query speed>100 type=fire sort=-attack"""
+        if (len(terms) < 1):
+            await ctx.send("""```Please specify stats, types, abilities or \
+forms to search for and optionally how to sort the results, \
+e.g. !query speed>100 type=fire sort=-attack limit=10```""")
+            return
+        # Imported on first use since NumPy is slow to import
+        import statQuery
+        try:
+            query = statQuery.StatQuery.parse(terms)
+        except ValueError as e:
+            await ctx.send("```{}```".format(e))
+            return
         try:
-            soup = BeautifulSoup(data, "html.parser")
+            table = self._loadStatTable()
         except Exception as e:
             logging.error(e)
+            await ctx.send("```Unable to load the base stats.```")
             return
-        # Get the Pokemon's information from the BeautifulSoup object
-        pokeDict = self._getPokeData(soup, pokemon)
-        if (not pokeDict):
-            logging.error("""Something went wrong while getting data from the \
-BeautifulSoup object for the Pokemon '{}'.""".format(pokemon))
+        if (table is None):
+            await ctx.send("```!query needs NumPy, which isn't installed.```")
             return
-        pokeEmbed = self._createDiscordEmbed(pokeDict, pokemon)
-        await ctx.send(embed=pokeEmbed)
+        (results, count) = table.run(query)
+        if (count == 0):
+            await ctx.send("```No Pokemon match {}```".format(" ".join(terms)))
+            return
+        rows = ["{:<18}{:>4}{:>4}{:>4}{:>4}{:>4}{:>4}{:>6}".format(
+            "Pokemon", "HP", "Atk", "Def", "SpA", "SpD", "Spe", "Total")]
+        for (pokemon, form, stats) in results:
+            rows.append("{:<18}{:>4}{:>4}{:>4}{:>4}{:>4}{:>4}{:>6}".format(
+                self._unicodeFix(form)[:17],
+                *(statQuery.formatStat(stats[column])
+                  for column in statQuery.statColumns + ("total",))))
+        await ctx.send("```{} of {} matching forms\n{}```".format(
+            len(results), count, "\n".join(rows)))
+        return
+
+    @commands.command(hidden=True)
+    async def pokecache(self, ctx):
+        """Show the Pokemon record and embed cache counters."""
+        stats = self.embedCache.stats()
+        await ctx.send("""```Records cached: {}
+Embeds cached:  {} ({} bytes)
+Embed hits:     {}
+Embed misses:   {}
+Embed hit rate: {:.1%}```""".format(len(self.cache.entries),
+                                    stats["entries"], stats["bytes"],
+                                    stats["hits"], stats["misses"],
+                                    stats["hitRate"]))
         return
+
+
+def setup(bot):
+    """Add the cog when the bot loads this module as an extension."""
+    cog = Pokemon(bot, bot.httpClient)
+    bot.add_cog(cog)
+    # on_ready has already been dispatched if the cog is loaded at runtime
+    if (bot.is_ready()):
+        cog.startWarmUp()
@@ -0,0 +1,98 @@
+from bisect import bisect_left
+
+
+def flattenIDs(ids):
+    """Return a prefix's IDs as a flat list of strings.
+
+    Older prefix files store a single ID as a string and multiple IDs as
+    nested lists such as [["a", "b"], "c"].
+    Keyword arguments:
+    ids -- the ID or IDs of a prefix
+    """
+    if (not isinstance(ids, list)):
+        return [ids]
+    flat = []
+    for id in ids:
+        flat.extend(flattenIDs(id))
+    return flat
+
+
+def normalizePrefixes(prefixes):
+    """Return a copy of a prefix dictionary with every value a list of IDs.
+
+    Keyword arguments:
+    prefixes -- a dictionary of prefix names to their ID or IDs
+    """
+    return {name: flattenIDs(ids) for (name, ids) in prefixes.items()}
+
+
+class PrefixIndex:
+    """Sorted-array index of the Terraria prefix names.
+
+    Prefix and substring matches are found with binary searches over the
+    sorted names and the sorted suffixes of every name, so lookups take
+    logarithmic time no matter how large the table is.
+    """
+    def __init__(self, names):
+        """Build the index.
+
+        Keyword arguments:
+        names -- the lowercase prefix names
+        """
+        self.names = sorted(set(names))
+        # Every suffix of every name, for substring matches
+        self.suffixes = sorted({(name[i:], name)
+                                for name in self.names
+                                for i in range(1, len(name))})
+        self._suffixKeys = [suffix for (suffix, _) in self.suffixes]
+
+    def __len__(self):
+        return len(self.names)
+
+    def startingWith(self, partial):
+        """Return the names that start with partial in alphabetical order.
+
+        Keyword arguments:
+        partial -- the start of the name
+        """
+        start = bisect_left(self.names, partial)
+        end = start
+        while ((end < len(self.names)) and
+               self.names[end].startswith(partial)):
+            end += 1
+        return self.names[start:end]
+
+    def containing(self, partial):
+        """Return the names that contain partial past their first letter.
+
+        Keyword arguments:
+        partial -- the part of the name
+        """
+        matches = set()
+        i = bisect_left(self._suffixKeys, partial)
+        while ((i < len(self._suffixKeys)) and
+               self._suffixKeys[i].startswith(partial)):
+            matches.add(self.suffixes[i][1])
+            i += 1
+        return matches
+
+    def search(self, term, limit=5):
+        """Return up to limit names matching term, best matches first.
+
+        An exact match comes first, then names starting with term, then names
+        containing term. Shorter names are ranked higher within each group.
+        Keyword arguments:
+        term  -- the lowercase search term
+        limit -- the maximum number of names to return
+        """
+        if (term == ""):
+            return []
+        ranked = []
+        for name in self.startingWith(term):
+            ranked.append((0 if (name == term) else 1, len(name), name))
+        if (len(ranked) < limit):
+            for name in self.containing(term):
+                if (not name.startswith(term)):
+                    ranked.append((2, len(name), name))
+        ranked.sort()
+        return [name for (_, _, name) in ranked[:limit]]
@@ -0,0 +1,160 @@
+import cProfile
+import getopt
+import glob
+import logging
+import pstats
+import random
+import time
+from os import makedirs, path
+from sys import argv, exit
+
+
+class CommandProfiler:
+    """Profiles a random fraction of command invocations with cProfile.
+
+    Every profile is written to its own file in a directory for the session.
+    Invocations that aren't sampled only cost a call to random.random(), so
+    the profiler can be left on at a low rate.
+    cProfile sees everything that runs on the event loop while a command is
+    being profiled, including other commands, so only one invocation is
+    profiled at a time.
+    """
+    def __init__(self, rate, profileDir="profiles"):
+        """Keyword arguments:
+        rate       -- the fraction of invocations to profile, e.g. 0.01
+        profileDir -- the directory to create the session's directory in
+        """
+        self.rate = rate
+        self.sessionDir = path.join(profileDir,
+                                    time.strftime("%Y%m%d-%H%M%S"))
+        # Number of profiles written this session
+        self.count = 0
+        # Context of the invocation being profiled
+        self._active = None
+        self._profile = None
+
+    def start(self, ctx):
+        """Start profiling an invocation if it's sampled.
+
+        Keyword arguments:
+        ctx -- the invocation's context
+        """
+        if ((self._active is not None) or (random.random() >= self.rate)):
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler is already running
+            logging.debug(e)
+            return
+        self._active = ctx
+        self._profile = profile
+
+    def stop(self, ctx):
+        """Stop profiling an invocation and write its profile.
+
+        Keyword arguments:
+        ctx -- the invocation's context
+        """
+        if (self._active is not ctx):
+            return
+        self._profile.disable()
+        profile = self._profile
+        self._active = None
+        self._profile = None
+        self.count += 1
+        command = ctx.command.qualified_name.replace(" ", "_")
+        profileFile = path.join(self.sessionDir, "{:05d}-{}.prof".format(
+            self.count, command))
+        try:
+            makedirs(self.sessionDir, exist_ok=True)
+            profile.dump_stats(profileFile)
+        except Exception as e:
+            logging.error("Error writing {}".format(profileFile))
+            logging.error(e)
+            return
+        logging.debug("Wrote the profile of '{}' to {}".format(
+            ctx.command.qualified_name, profileFile))
+
+    def profileFiles(self):
+        """Return the profiles written this session."""
+        return sorted(glob.glob(path.join(self.sessionDir, "*.prof")))
+
+
+def hotFunctions(profileFiles, limit=15, sortBy="tottime"):
+    """Return the hottest functions across several profiles as text.
+
+    Keyword arguments:
+    profileFiles -- the profiles to aggregate
+    limit        -- the number of functions to list
+    sortBy       -- "tottime" for time spent in the function itself or
+                    "cumtime" to include the functions it called
+    """
+    if (len(profileFiles) == 0):
+        return "No profiles"
+    stats = pstats.Stats(*profileFiles)
+    column = {"tottime": 2, "cumtime": 3}[sortBy]
+    # (file, line, function) -> (primitive calls, calls, tottime, cumtime, _)
+    ranked = sorted(stats.stats.items(), key=lambda item: item[1][column],
+                    reverse=True)[:limit]
+    lines = ["{} profiles, {:.3f} seconds".format(len(profileFiles),
+                                                 stats.total_tt),
+             "{:>9} {:>9} {:>8}  {}".format("tottime", "cumtime", "calls",
+                                            "function")]
+    for ((fileName, line, function), (_, calls, tottime, cumtime, _)) in ranked:
+        if (fileName == "~"):
+            # Built-in functions don't have a file
+            where = function
+        else:
+            where = "{} ({}:{})".format(function, path.split(fileName)[1],
+                                        line)
+        lines.append("{:>9.4f} {:>9.4f} {:>8}  {}".format(tottime, cumtime,
+                                                          calls, where))
+    return "\n".join(lines)
+
+
+def help(returnCode):
+    info = """\
+Usage: %s [options...] DIRECTORY...
+Aggregate the profiles written by bot.py --profile
+  -h, --help            Print this help message
+  -n, --limit N         Number of functions to list (default: 25)
+  -c, --cumulative      Rank functions by their time including the functions
+                        they called
+""" % path.split(__file__)[1]
+    print(info)
+    exit(returnCode)
+
+
+def main(argv):
+    logFormat = "%(asctime)s %(levelname)s %(message)s"
+    dateFormat = "%Y-%m-%d %H:%M:%S UTC-%z"
+    logging.basicConfig(format=logFormat, datefmt=dateFormat, level=20)
+    shortOpts = "hn:c"
+    longOpts = ["help", "limit=", "cumulative"]
+    try:
+        opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
+    except getopt.GetoptError as e:
+        logging.error(e)
+        help(2)
+    limit = 25
+    sortBy = "tottime"
+    for (o, a) in opts:
+        if (o in ("-h", "--help")):
+            help(2)
+        elif (o in ("-n", "--limit")):
+            limit = int(a)
+        elif (o in ("-c", "--cumulative")):
+            sortBy = "cumtime"
+    if (len(args) == 0):
+        help(2)
+    profileFiles = []
+    for directory in args:
+        profileFiles += sorted(glob.glob(path.join(directory, "*.prof")))
+    print(hotFunctions(profileFiles, limit, sortBy))
+    return
+
+
+if __name__ == '__main__':
+    main(argv)
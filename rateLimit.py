@@ -0,0 +1,247 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from upstream import upstreamURL
+
+# Statuses that mean the server is overloaded or throttling us
+retryStatuses = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of requests to a host."""
+    def __init__(self, rate, burst):
+        """Create a full bucket.
+
+        Keyword arguments:
+        rate  -- the number of tokens added per second
+        burst -- the maximum number of tokens in the bucket
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # Time before which no tokens are handed out (set by Retry-After)
+        self.pausedUntil = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a number of seconds.
+
+        The bucket doesn't refill during the pause, so the requests resume at
+        the normal rate instead of in a burst when it ends.
+        Keyword arguments:
+        seconds -- how long to pause for
+        """
+        self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 1)
+        self.updated = max(self.updated, self.pausedUntil)
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        # The lock makes waiters take tokens in the order they arrived
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if (now < self.pausedUntil):
+                    await asyncio.sleep(self.pausedUntil - now)
+                    continue
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if (self.tokens >= 1):
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted with additive increase/multiplicative decrease.
+
+    The limit grows by about one for every limit successful requests and is
+    halved when the server throttles us, fails, or responds slower than
+    targetLatency.
+    """
+    def __init__(self, initial=8, minimum=1, maximum=64, targetLatency=2.0):
+        """Create the limiter.
+
+        Keyword arguments:
+        initial       -- the starting number of concurrent requests
+        minimum       -- the lowest the limit can go
+        maximum       -- the highest the limit can go
+        targetLatency -- responses slower than this many seconds back off
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.targetLatency = targetLatency
+        self.active = 0
+        self._lastDecrease = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a free slot and take it."""
+        async with self._changed:
+            while (self.active >= int(self.limit)):
+                await self._changed.wait()
+            self.active += 1
+
+    async def release(self):
+        """Give a slot back."""
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify_all()
+
+    def onSuccess(self, latency):
+        """Grow the limit after a successful request.
+
+        Keyword arguments:
+        latency -- how many seconds the request took
+        """
+        if (latency > self.targetLatency):
+            self.onBackoff()
+            return
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def onBackoff(self):
+        """Halve the limit after the server throttled us or failed."""
+        now = time.monotonic()
+        # Only back off once per round of in flight requests
+        if (now - self._lastDecrease < self.targetLatency):
+            return
+        self._lastDecrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        logging.debug("Backing off to {} concurrent requests".format(
+            int(self.limit)))
+
+
+class HostLimiter:
+    """Rate and concurrency limits for every host that is crawled."""
+    def __init__(self, rate=20, burst=20, initial=8, maximum=64,
+                 targetLatency=2.0):
+        """Create the limiter.
+
+        Keyword arguments:
+        rate          -- the number of requests per second to each host
+        burst         -- the number of requests that can be sent at once
+        initial       -- the starting number of concurrent requests per host
+        maximum       -- the maximum number of concurrent requests per host
+        targetLatency -- responses slower than this many seconds back off
+        """
+        self.rate = rate
+        self.burst = burst
+        self.initial = initial
+        self.maximum = maximum
+        self.targetLatency = targetLatency
+        self.hosts = dict()
+
+    def forURL(self, url):
+        """Return the (TokenBucket, AdaptiveLimiter) for a URL's host.
+
+        Keyword arguments:
+        url -- the URL that will be requested
+        """
+        host = urlsplit(url).netloc
+        if (host not in self.hosts):
+            self.hosts[host] = (TokenBucket(self.rate, self.burst),
+                                AdaptiveLimiter(initial=self.initial,
+                                                maximum=self.maximum,
+                                                targetLatency=self.targetLatency))
+        return self.hosts[host]
+
+
+def retryAfter(headers):
+    """Return the number of seconds a Retry-After header asks us to wait.
+
+    Returns None if there is no valid Retry-After header.
+    Keyword arguments:
+    headers -- the response headers
+    """
+    value = headers.get("Retry-After")
+    if (value is None):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def backoffDelay(attempt, base=0.5, cap=30.0):
+    """Return a jittered exponential backoff delay in seconds.
+
+    Keyword arguments:
+    attempt -- the number of attempts that have failed so far
+    base    -- the delay before the first retry
+    cap     -- the maximum delay
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def fetch(session, url, limiter, headers=None, retries=4, timeout=20,
+                deadline=60):
+    """Send a rate limited GET request, retrying failures with backoff.
+
+    Returns a tuple of (status, headers, data). Raises the last error if every
+    attempt failed or the deadline passed.
+    Keyword arguments:
+    session  -- the aiohttp session to use
+    url      -- the URL to request
+    limiter  -- the HostLimiter shared by every request
+    headers  -- extra request headers
+    retries  -- the number of times to retry a failed request
+    timeout  -- the number of seconds each attempt may take
+    deadline -- the number of seconds all of the attempts may take
+    """
+    (bucket, concurrency) = limiter.forURL(url)
+    giveUpAt = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        delay = None
+        await bucket.acquire()
+        await concurrency.acquire()
+        start = time.monotonic()
+        try:
+            remaining = giveUpAt - start
+            if (remaining <= 0):
+                raise asyncio.TimeoutError("Deadline passed for {}".format(url))
+            clientTimeout = aiohttp.ClientTimeout(total=min(timeout, remaining))
+            async with session.get(upstreamURL(url), headers=headers,
+                                   timeout=clientTimeout) as response:
+                if (response.status in retryStatuses):
+                    concurrency.onBackoff()
+                    delay = retryAfter(response.headers)
+                    if (delay is not None):
+                        bucket.pause(delay)
+                    error = aiohttp.ClientResponseError(
+                        response.request_info, response.history,
+                        status=response.status, message=response.reason,
+                        headers=response.headers)
+                else:
+                    data = await response.read()
+                    concurrency.onSuccess(time.monotonic() - start)
+                    return (response.status, response.headers, data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            concurrency.onBackoff()
+            error = e
+        finally:
+            await concurrency.release()
+        if (attempt >= retries):
+            raise error
+        if (delay is None):
+            delay = backoffDelay(attempt)
+        if (time.monotonic() + delay >= giveUpAt):
+            raise error
+        logging.debug("Retrying {} in {:.1f} seconds ({})".format(
+            url, delay, error))
+        attempt += 1
+        await asyncio.sleep(delay)
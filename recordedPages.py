@@ -0,0 +1,65 @@
+import logging
+from os import makedirs, path
+
+from setup import getPage
+
+# Directory that the recorded pages are kept in
+fixtureDir = path.join(path.split(__file__)[0], "fixtures")
+bulbapedia = "http://bulbapedia.bulbagarden.net"
+pokedexURL = "{}/wiki/List_of_Pok%C3%A9mon_by_National_Pok%C3%A9dex_number".format(
+    bulbapedia)
+prefixURL = "http://terraria.gamepedia.com/Prefix_IDs"
+# Pokemon whose pages have caused parsing problems before:
+# Pokemon -> (fixture file, Bulbapedia URL)
+pokeFixtures = {
+    "deoxys": ("deoxys.html",
+               "{}/wiki/Deoxys_(Pok%C3%A9mon)".format(bulbapedia)),
+    "charizard": ("charizard.html",
+                  "{}/wiki/Charizard_(Pok%C3%A9mon)".format(bulbapedia)),
+    "nidoran_(f)": ("nidoran_f.html",
+                    "{}/wiki/Nidoran%E2%99%80_(Pok%C3%A9mon)".format(
+                        bulbapedia)),
+    "flabébé": ("flabebe.html",
+                "{}/wiki/Flab%C3%A9b%C3%A9_(Pok%C3%A9mon)".format(bulbapedia)),
+    "type:_null": ("type_null.html",
+                   "{}/wiki/Type:_Null_(Pok%C3%A9mon)".format(bulbapedia)),
+    "venusaur": ("venusaur.html",
+                 "{}/wiki/Venusaur_(Pok%C3%A9mon)".format(bulbapedia)),
+    }
+# Fixture file -> URL of every other page
+pageFixtures = {"pokedexList.html": pokedexURL,
+                "prefixIDs.html": prefixURL,
+                }
+
+
+def fixtureURLs():
+    """Return a dictionary of fixture file -> URL of every recorded page."""
+    urls = {fixture: url for (fixture, url) in pokeFixtures.values()}
+    urls.update(pageFixtures)
+    return urls
+
+
+def record():
+    """Download every fixture from the live wikis."""
+    makedirs(fixtureDir, exist_ok=True)
+    for (fixture, url) in sorted(fixtureURLs().items()):
+        data = getPage(targetURL=url,
+                       errorMsg="Error downloading {}".format(url))
+        with open(path.join(fixtureDir, fixture), "wb") as f:
+            f.write(data)
+        logging.info("Recorded {} ({} bytes)".format(fixture, len(data)))
+
+
+def loadFixture(fixture):
+    """Return a recorded page or None if it hasn't been recorded.
+
+    Keyword arguments:
+    fixture -- the fixture file in fixtureDir
+    """
+    fixtureFile = path.join(fixtureDir, fixture)
+    if (not path.exists(fixtureFile)):
+        logging.warning("Skipping {} since it hasn't been recorded".format(
+            fixture))
+        return None
+    with open(fixtureFile, "rb") as f:
+        return f.read()
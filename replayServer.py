@@ -0,0 +1,290 @@
+import asyncio
+import getopt
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from os import path
+from sys import argv, exit
+from urllib.parse import unquote, urlsplit
+
+from aiohttp import web
+
+from recordedPages import fixtureURLs, loadFixture
+
+try:
+    import resource
+except ImportError:
+    # Peak memory isn't reported on Windows
+    resource = None
+
+
+def percentile(values, fraction):
+    """Return the value that fraction (e.g. 0.99) of the values are below.
+
+    Keyword arguments:
+    values   -- a sorted list of numbers
+    fraction -- between 0 and 1
+    """
+    if (len(values) == 0):
+        return 0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ReplayServer:
+    """Local stand-in for the wikis that serves recorded pages.
+
+    Requests are expected in the form made by upstream.upstreamURL, e.g.
+    "/bulbapedia.bulbagarden.net/wiki/Mudkip_(Pok%C3%A9mon)". Latency, server
+    errors and 429 Too Many Requests responses can be injected so that the
+    crawlers' concurrency limits and retries can be tuned offline.
+    """
+    def __init__(self, latency=0.05, jitter=0.02, errorRate=0.0,
+                 throttleRate=0.0, retryAfter=1, fallback=None, seed=None):
+        """Load the recorded pages.
+
+        Keyword arguments:
+        latency      -- seconds to wait before every response
+        jitter       -- mean of an exponentially distributed extra wait, so
+                        that some responses are much slower than the rest
+        errorRate    -- fraction of requests to answer with 503
+        throttleRate -- fraction of requests to answer with 429
+        retryAfter   -- the Retry-After header of the 429 responses
+        fallback     -- fixture file served for Bulbapedia pages that weren't
+                        recorded, so a whole crawl can be replayed
+        seed         -- seed for the injected latency and errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.throttleRate = throttleRate
+        self.retryAfter = retryAfter
+        self.random = random.Random(seed)
+        # (host, unquoted path) -> recorded page
+        self.pages = dict()
+        for (fixture, url) in fixtureURLs().items():
+            data = loadFixture(fixture)
+            if (data is not None):
+                self.pages[self._key(url)] = data
+        self.fallback = None
+        if (fallback is not None):
+            self.fallback = loadFixture(fallback)
+        self.reset()
+
+    @staticmethod
+    def _key(url):
+        """Return the key of the page at a wiki URL."""
+        parts = urlsplit(url)
+        return (parts.netloc, unquote(parts.path))
+
+    def reset(self):
+        """Clear the statistics."""
+        # Response status -> number of responses
+        self.statuses = dict()
+        # Seconds taken to answer every request
+        self.requestTimes = []
+        # Seconds from the first request for a page until it was served
+        self.pageTimes = []
+        self._firstRequests = dict()
+        self.bytesSent = 0
+
+    async def handle(self, request):
+        """Answer a request like the wiki would, plus any injected faults."""
+        start = time.monotonic()
+        (host, _, rest) = request.path.lstrip("/").partition("/")
+        key = (host, unquote("/" + rest))
+        self._firstRequests.setdefault(key, start)
+        delay = self.latency
+        if (self.jitter > 0):
+            delay += self.random.expovariate(1 / self.jitter)
+        await asyncio.sleep(delay)
+        chance = self.random.random()
+        data = self.pages.get(key)
+        if ((data is None) and host.startswith("bulbapedia") and
+            rest.startswith("wiki/")):
+            data = self.fallback
+        if (chance < self.throttleRate):
+            response = web.Response(
+                status=429, headers={"Retry-After": str(self.retryAfter)})
+        elif (chance < self.throttleRate + self.errorRate):
+            response = web.Response(status=503)
+        elif (data is None):
+            response = web.Response(status=404)
+        else:
+            response = web.Response(body=data, content_type="text/html")
+            self.bytesSent += len(data)
+            self.pageTimes.append(
+                time.monotonic() - self._firstRequests.pop(key))
+        self.statuses[response.status] = (
+            self.statuses.get(response.status, 0) + 1)
+        self.requestTimes.append(time.monotonic() - start)
+        return response
+
+    async def start(self, host="localhost", port=8080):
+        """Start serving in the running event loop.
+
+        Keyword arguments:
+        host -- the interface to listen on
+        port -- the port to listen on, or 0 for any free port
+        """
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "http://{}:{}".format(host, port)
+        logging.info("Replaying {} recorded pages on {}".format(
+            len(self.pages), self.url))
+        return self.url
+
+    async def stop(self):
+        """Stop serving."""
+        await self._runner.cleanup()
+
+    def report(self, elapsed):
+        """Log the throughput and latency since the last reset.
+
+        Keyword arguments:
+        elapsed -- the number of seconds that the statistics cover
+        """
+        requestTimes = sorted(self.requestTimes)
+        pageTimes = sorted(self.pageTimes)
+        logging.info("Served {} pages ({:.1f} MiB) in {:.1f} seconds "
+                     "({:.1f} pages/sec)".format(
+                         len(pageTimes), self.bytesSent / 2 ** 20, elapsed,
+                         len(pageTimes) / max(elapsed, 1e-9)))
+        logging.info("Responses: {}".format(", ".join(
+            "{} x {}".format(count, status)
+            for (status, count) in sorted(self.statuses.items()))))
+        for (name, times) in (("Request", requestTimes),
+                              ("Page (with retries)", pageTimes)):
+            if (len(times) == 0):
+                continue
+            logging.info("{} latency ms: median {:.0f}, p90 {:.0f}, "
+                         "p99 {:.0f}, max {:.0f}".format(
+                             name, statistics.median(times) * 1000,
+                             percentile(times, 0.9) * 1000,
+                             percentile(times, 0.99) * 1000,
+                             times[-1] * 1000))
+
+
+async def runCrawler(server, crawler, crawlerArgs):
+    """Run a crawler against the server and report how it did.
+
+    The crawler runs in a temporary directory so that it doesn't overwrite
+    the real pokedex.json and terrariaPrefixes.json.
+    Keyword arguments:
+    server      -- the running ReplayServer
+    crawler     -- the crawler script, e.g. asyncTest.py
+    crawlerArgs -- extra arguments for the crawler
+    """
+    crawler = path.abspath(crawler)
+    workDir = tempfile.mkdtemp()
+    server.reset()
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, crawler, "--upstream", server.url, *crawlerArgs,
+        cwd=workDir)
+    returnCode = await process.wait()
+    elapsed = time.monotonic() - start
+    logging.info("{} exited with {} after {:.1f} seconds".format(
+        path.split(crawler)[1], returnCode, elapsed))
+    server.report(elapsed)
+    if (resource is not None):
+        # Kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        logging.info("Peak memory of the largest crawler process: "
+                     "{:.1f} MiB".format(peak / 1024))
+    logging.info("The crawler's output is in {}".format(workDir))
+    return returnCode
+
+
+def help(returnCode):
+    info = """\
+Usage: %s [options...] [-- crawler arguments...]
+  -h, --help            Print this help message
+  -p, --port PORT       Port to listen on (default: 8080)
+  -l, --latency MS      Milliseconds to wait before every response (default: 50)
+  -j, --jitter MS       Mean of an extra, exponentially distributed wait
+                        (default: 20)
+  -e, --errors F        Fraction of requests to answer with 503 (default: 0)
+  -t, --throttle F      Fraction of requests to answer with 429 (default: 0)
+  -f, --fallback FILE   Fixture to serve for unrecorded Pokemon pages
+                        (default: charizard.html)
+  -s, --seed N          Seed for the injected latency and errors
+  -c, --crawl SCRIPT    Run SCRIPT (asyncTest.py or setup.py) against the
+                        server, report pages/sec, latency and peak memory and
+                        then exit
+
+Without --crawl the server runs until it's interrupted, for use with the
+--upstream option of bot.py, asyncTest.py and setup.py.
+""" % path.split(__file__)[1]
+    print(info)
+    exit(returnCode)
+
+
+def main(argv):
+    logFormat = "%(asctime)s %(levelname)s %(message)s"
+    dateFormat = "%Y-%m-%d %H:%M:%S UTC-%z"
+    logging.basicConfig(format=logFormat, datefmt=dateFormat, level=20)
+    shortOpts = "hp:l:j:e:t:f:s:c:"
+    longOpts = ["help", "port=", "latency=", "jitter=", "errors=", "throttle=",
+                "fallback=", "seed=", "crawl="]
+    try:
+        opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
+    except getopt.GetoptError as e:
+        logging.error(e)
+        help(2)
+    port = 8080
+    options = {"fallback": "charizard.html"}
+    crawler = None
+    try:
+        for (o, a) in opts:
+            if (o in ("-h", "--help")):
+                help(2)
+            elif (o in ("-p", "--port")):
+                port = int(a)
+            elif (o in ("-l", "--latency")):
+                options["latency"] = float(a) / 1000
+            elif (o in ("-j", "--jitter")):
+                options["jitter"] = float(a) / 1000
+            elif (o in ("-e", "--errors")):
+                options["errorRate"] = float(a)
+            elif (o in ("-t", "--throttle")):
+                options["throttleRate"] = float(a)
+            elif (o in ("-f", "--fallback")):
+                options["fallback"] = a
+            elif (o in ("-s", "--seed")):
+                options["seed"] = int(a)
+            elif (o in ("-c", "--crawl")):
+                crawler = a
+    except ValueError as e:
+        logging.error(e)
+        help(2)
+    server = ReplayServer(**options)
+    if (len(server.pages) == 0):
+        logging.error("No fixtures found, record them with benchmark.py "
+                      "--record")
+        exit(1)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start(port=(0 if crawler else port)))
+    start = time.monotonic()
+    try:
+        if (crawler is not None):
+            returnCode = loop.run_until_complete(
+                runCrawler(server, crawler, args))
+            exit(returnCode)
+        loop.run_forever()
+    except KeyboardInterrupt:
+        server.report(time.monotonic() - start)
+    finally:
+        loop.run_until_complete(server.stop())
+    return
+
+
+if __name__ == '__main__':
+    main(argv)
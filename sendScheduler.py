@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from collections import deque
+
+from rateLimit import TokenBucket
+
+# Priorities of queued messages, lower is sent first
+interactivePriority = 0  # Replies to a command
+bulkPriority = 1         # Output such as !repeat's that can wait
+# Discord allows about 5 messages every 5 seconds in a channel and 50 requests
+# a second overall, so stay just under those instead of waiting for 429s
+channelRate = 1
+channelBurst = 5
+globalRate = 45
+globalBurst = 45
+# Maximum length of a message's content
+maxLength = 2000
+
+
+class OutboundMessage:
+    """A message waiting to be sent and the futures of everyone waiting on it.
+
+    Consecutive text-only messages are merged into one OutboundMessage, so
+    there can be a future for each of the merged messages.
+    """
+    __slots__ = ("content", "kwargs", "futures")
+
+    def __init__(self, content, kwargs, future):
+        self.content = content
+        self.kwargs = kwargs
+        self.futures = [future]
+
+    def canMerge(self, other):
+        """Return whether other can be appended to this message."""
+        return ((not self.kwargs) and (not other.kwargs) and
+                (self.content is not None) and (other.content is not None) and
+                (len(self.content) + 1 + len(other.content) <= maxLength))
+
+    def merge(self, other):
+        """Append other's content to this message."""
+        self.content = "{}\n{}".format(self.content, other.content)
+        self.futures.extend(other.futures)
+
+
+class ChannelQueue:
+    """The messages waiting to be sent to a channel and its rate limit."""
+    def __init__(self):
+        # Priority -> queued OutboundMessages
+        self.queues = {interactivePriority: deque(), bulkPriority: deque()}
+        self.bucket = TokenBucket(channelRate, channelBurst)
+        self.worker = None
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, message, priority):
+        """Queue a message, merging it into the last one if possible."""
+        queue = self.queues[priority]
+        if ((len(queue) > 0) and queue[-1].canMerge(message)):
+            queue[-1].merge(message)
+        else:
+            queue.append(message)
+
+    def pop(self):
+        """Return the next message to send, interactive messages first."""
+        for priority in sorted(self.queues):
+            if (len(self.queues[priority]) > 0):
+                return self.queues[priority].popleft()
+        return None
+
+
+class SendScheduler:
+    """Bot-wide scheduler for outgoing messages.
+
+    Every channel has its own queue that a worker task drains at the rate
+    Discord allows, so a spammy command in one channel doesn't hold up the
+    others and replies to commands overtake bulk output in the same channel.
+    Text messages that are queued back to back are coalesced into as few
+    messages of up to 2000 characters as possible.
+    """
+    def __init__(self):
+        # Channel ID -> ChannelQueue
+        # Kept after the queue empties so the channel's rate limit carries over
+        self.channels = dict()
+        self.globalBucket = TokenBucket(globalRate, globalBurst)
+        # Messages sent and messages merged into others
+        self.sent = 0
+        self.coalesced = 0
+
+    def send(self, channel, content=None, priority=interactivePriority,
+             **kwargs):
+        """Queue a message and return a future of the sent discord.Message.
+
+        The future of a message that was coalesced with others gets the
+        message that they were sent in.
+        Keyword arguments:
+        channel  -- the channel (or anything else with send()) to send to
+        content  -- the message's text
+        priority -- interactivePriority or bulkPriority
+        kwargs   -- other arguments for channel.send(), e.g. embed
+        """
+        future = asyncio.get_event_loop().create_future()
+        if (content is not None):
+            content = str(content)
+        message = OutboundMessage(content, kwargs, future)
+        key = getattr(channel, "id", id(channel))
+        channelQueue = self.channels.get(key)
+        if (channelQueue is None):
+            channelQueue = self.channels[key] = ChannelQueue()
+        channelQueue.push(message, priority)
+        if (channelQueue.worker is None):
+            channelQueue.worker = asyncio.ensure_future(
+                self._drain(channel, channelQueue))
+        return future
+
+    async def _drain(self, channel, channelQueue):
+        """Send a channel's messages until its queue is empty.
+
+        Keyword arguments:
+        channel      -- the channel to send to
+        channelQueue -- the channel's ChannelQueue
+        """
+        try:
+            while (len(channelQueue) > 0):
+                await channelQueue.bucket.acquire()
+                await self.globalBucket.acquire()
+                # Pop after waiting so that anything queued in the meantime
+                # can be coalesced or overtake bulk output
+                message = channelQueue.pop()
+                await self._sendMessage(channel, channelQueue, message)
+        finally:
+            channelQueue.worker = None
+
+    async def _sendMessage(self, channel, channelQueue, message):
+        """Send a message and resolve its futures."""
+        try:
+            sent = await channel.send(message.content, **message.kwargs)
+        except Exception as e:
+            retryAfter = getattr(e, "retry_after", None)
+            if (retryAfter is not None):
+                channelQueue.bucket.pause(retryAfter)
+            logging.error(e)
+            for future in message.futures:
+                if (not future.done()):
+                    future.set_exception(e)
+            return
+        self.sent += 1
+        self.coalesced += len(message.futures) - 1
+        for future in message.futures:
+            if (not future.done()):
+                future.set_result(sent)
+
+    def stats(self):
+        """Return the queue lengths and counters."""
+        return {"active": sum(1 for queue in self.channels.values()
+                              if (queue.worker is not None)),
+                "queued": sum(len(queue) for queue in self.channels.values()),
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                }
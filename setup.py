@@ -2,16 +2,20 @@ import getopt
 import io
 import json
 import logging
+import os
 import re
 import traceback
 import urllib.error
 import urllib.request
-from bs4 import BeautifulSoup
 from os import path
 from sys import argv, exc_info, exit
 
 import time
 
+from pokeRecord import FormStats
+from soupUtils import makeFullSoup, makeSoup, pokePageStrainer, tableStrainer
+from upstream import setUpstream, upstreamURL
+
 user_agent = 'Mozilla/5.0 (Windows; U; Windows NT 10.0; rv:10.0) Gecko/20100101 Firefox/52.0'
 sendHeader={'User-Agent':user_agent,}
 
@@ -19,6 +23,13 @@ sendHeader={'User-Agent':user_agent,}
 prefixDict = dict()
 # Dictionary for the national Pokédex
 nationalDex = dict()
+# Each Pokemon is appended to this file as it's parsed and it's compacted into
+# pokedex.json at the end
+checkpointFile = "pokedex.jsonl"
+
+# Raised by getPokemon when a Pokemon's page can't be parsed
+class ParseError(Exception):
+  pass
 
 def help(returnCode):
   info = """\
@@ -26,7 +37,10 @@ Usage: %s [options...]
   -a, --all             Perform all setup operations
   -h, --help            Print this help message
   -p, --pokemon         Setup for Pokémon
+  -r, --resume          Resume an interrupted Pokémon crawl
   -t, --terraria        Setup for Terraria prefixes
+  -u, --upstream URL    Request the pages from URL (e.g. a replayServer.py)
+                        instead of the wikis
 """ % path.split(__file__)[1]
   print(info)
   exit(returnCode)
@@ -39,8 +53,9 @@ def getExceptionDetails():
   return "An error occurred on line {} in statement {}.".format(line, text)
   
 # Takes in soup, a BeautifulSoup object of a Pokemon's Bulbapedia page, and the
-# Pokemon's name in order to return a formatted string with relevant info about
-# the Pokemon
+# Pokemon's name in order to return a dictionary with relevant info about the
+# Pokemon in the pokeRecord.PokeRecord.toDict format
+# Raises ParseError if the page can't be parsed
 def getPokemon(soup, pokemon):
   # Dictionary with the Pokemon's info
   pokeDict = dict()
@@ -59,7 +74,7 @@ def getPokemon(soup, pokemon):
     assert(len(infoTable) == 1)
   except:
     logging.error("Page layout changed - Need to update the bot")
-    exit(1)
+    raise ParseError(prettyPoke)
   infoTable = infoTable[0]
   # Be careful with the following pokemon
   # sawsbuck  (image)
@@ -79,7 +94,7 @@ def getPokemon(soup, pokemon):
   except Exception as e:
     logging.error(e)
     logging.error("Error getting embedImg for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   try:
     pokeText = infoTable.find(name="a", title=re.compile("Pok.mon category"))
     # Have the Pokemon category
@@ -97,7 +112,7 @@ def getPokemon(soup, pokemon):
   except Exception as e:
     logging.error(e)
     logging.error("Error getting pokeText for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   try:
     dexRE = re.compile("List of Pokémon by National Pokédex number")
     natDexNo = infoTable.find(name="a", title=dexRE)
@@ -106,7 +121,7 @@ def getPokemon(soup, pokemon):
   except Exception as e:
     logging.error(e)
     logging.error("Error getting National Pokedex number for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   try:
     typeRE = re.compile("(?<!Unknown )\(type\)")
     types = infoTable.find_all(name="a", title=typeRE)
@@ -127,10 +142,7 @@ def getPokemon(soup, pokemon):
         # tempTypes = [typeTable.find_parent("td").find("small").string]
         key = typeTable.find_parent("td").find("small").string
         for type in typeTable.find_all(name="a", title=typeRE):
-          if (key in pokeTypes):
-            pokeTypes[key] = pokeTypes[key] + ";" + type.string
-          else:
-            pokeTypes[key] = type.string
+          pokeTypes.setdefault(key, []).append(str(type.string))
           # tempTypes += [type.string]
         # pokeTypes += [tempTypes]
     # No mega evolutions
@@ -138,10 +150,7 @@ def getPokemon(soup, pokemon):
       # tempTypes += [prettyPoke]
       key = prettyPoke
       for type in types:
-        if (key in pokeTypes):
-          pokeTypes[key] = pokeTypes[key] + ";" + type.string
-        else:
-          pokeTypes[key] = type.string
+        pokeTypes.setdefault(key, []).append(str(type.string))
         # tempTypes += [type.string]
       # pokeTypes += [tempTypes]
       # pokeTypes += [tempTypes]
@@ -149,7 +158,7 @@ def getPokemon(soup, pokemon):
   except Exception as e:
     logging.error(e)
     logging.error("Error getting types for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   # abilities
   try:
     # Find the link in the table for abilities
@@ -172,15 +181,12 @@ def getPokemon(soup, pokemon):
         # No subtitle which implies that it's a normal ability so leave it blank
         except:
           key = prettyPoke
-        if (key in abilities):
-          abilities[key] = abilities[key] + ";" + ability.a.string
-        else:
-          abilities[key] = ability.a.string
+        abilities.setdefault(key, []).append(str(ability.a.string))
     pokeDict["abilities"] = abilities
   except Exception as e:
     logging.error(e)
     logging.error("Error getting hidden abilities for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   # base stats
   try:
     statTables = soup.find_all(name="table", align="left")
@@ -201,40 +207,66 @@ def getPokemon(soup, pokemon):
       # baseStat  = baseStat.find_next(name="th").find_next(name="th").string.strip()
       # Get the stat range at level 50
       range50   = range50.string
-      tempDict[baseStat.a.string] = """\
-%s;%s;%s""" % (baseStat.find_next(name="th").find_next(name="th").string.strip(),
-               range50, range100)
+      tempDict[baseStat.a.string] = (
+        baseStat.find_next(name="th").find_next(name="th").string.strip(),
+        range50, range100)
       # Do this 5 more times (total of 6) to get all the stats
       for i in range(0, 5):
         baseStat  = baseStat.find_next(name="td").find_next(name="td")
         range50   = baseStat.find_next(name="small")
         range100  = range50.find_next(name="small").string
         range50   = range50.string
-        tempDict[baseStat.a.string] = """\
-%s;%s;%s""" % (baseStat.find_next(name="th").find_next(name="th").string.strip(),
-               range50, range100)
+        tempDict[baseStat.a.string] = (
+        baseStat.find_next(name="th").find_next(name="th").string.strip(),
+        range50, range100)
       baseStat  = baseStat.find_next(name="td").find_next(name="td")
       tempDict["Total"] = baseStat.find_next("th").find_next("th").string.strip()
-      baseStats[title] = tempDict
+      # Store the stats as the integers of a pokeRecord.FormStats
+      baseStats[str(title)] = list(FormStats.fromParsed(tempDict).values)
     pokeDict["baseStats"] = baseStats
   except Exception as e:
     logging.error(e)
     errorMsg = getExceptionDetails()
     logging.error(errorMsg)
     logging.error("Error getting base stats for %s" % prettyPoke)
-    exit(1)
+    raise ParseError(prettyPoke)
   # use find_previous to find what pokemon the stat is for
   return pokeDict
   
+# Parse data, the HTML of a Pokemon's Bulbapedia page, and return the Pokemon's
+# info from getPokemon
+# Only the tables and headings are parsed, and the whole page is parsed with
+# html.parser if that fails
+def parsePokemon(data, pokemon):
+  try:
+    return getPokemon(makeSoup(data, pokePageStrainer), pokemon)
+  except ParseError:
+    logging.debug("Reparsing the whole page for %s" % pokemon)
+  return getPokemon(makeFullSoup(data), pokemon)
+
+# Send a GET request to targetURL and return the data from the response
+# Print errorMsg if there is an exception raised by urllib
+def getPage(targetURL, errorMsg):
+  try:
+    req = urllib.request.Request(url=upstreamURL(targetURL), data=None,
+                                 headers=sendHeader)
+    response = urllib.request.urlopen(req)
+    data = response.read()
+  except Exception as e:
+    if (errorMsg != ""):
+      logging.error(errorMsg)
+    logging.error(e)
+    exit(1)
+  return data
+
 # Send a GET request to targetURL, read the data from the response, and return
 # it as a BeautifulSoup object
+# Only the parts of the page matching parseOnly (a SoupStrainer) are parsed
 # Print errorMsg if there is an exception raised by urllib or by BeautifulSoup
-def getSoup(targetURL, errorMsg):
+def getSoup(targetURL, errorMsg, parseOnly=None):
+  data = getPage(targetURL, errorMsg)
   try:
-    req = urllib.request.Request(url=targetURL, data=None, headers=sendHeader)
-    response = urllib.request.urlopen(req)
-    data = response.read()
-    soup = BeautifulSoup(data, "html.parser")
+    soup = makeSoup(data, parseOnly)
   except Exception as e:
     if (errorMsg != ""):
       logging.error(errorMsg)
@@ -258,13 +290,70 @@ def saveDict(writeDict, writeFile, errorMsg):
     exit(1)
   return
 
+# Open checkpointFile, an append-only JSON Lines file that each Pokemon's info
+# is streamed to as soon as it has been parsed
+# The file is truncated unless resume is True
+def openCheckpoint(checkpointFile, resume):
+  try:
+    f = open(checkpointFile, "a" if resume else "w", encoding="utf-8")
+    # End a truncated last line from a crash so it doesn't corrupt the next one
+    if (resume and (f.tell() > 0)):
+      f.write("\n")
+  except Exception as e:
+    logging.error("Error opening %s" % checkpointFile)
+    logging.error(e)
+    exit(1)
+  return f
+
+# Append the info for the Pokemon key to the open checkpoint file f
+# Every line is flushed so that a crash loses at most the line being written
+def appendRecord(f, key, record):
+  f.write(json.dumps({"key": key, "record": record}, sort_keys=True))
+  f.write("\n")
+  f.flush()
+  return
+
+# Load checkpointFile and return a dictionary of every Pokemon in it
+# A truncated last line from a crash is ignored
+def loadCheckpoint(checkpointFile):
+  records = dict()
+  if (not path.exists(checkpointFile)):
+    return records
+  with open(checkpointFile, "r", encoding="utf-8") as f:
+    for line in f:
+      if (line.strip() == ""):
+        continue
+      try:
+        entry = json.loads(line)
+      except ValueError:
+        logging.debug("Ignoring a partial line in %s" % checkpointFile)
+        continue
+      records[entry["key"]] = entry["record"]
+  return records
+
+# Compact checkpointFile into writeFile with saveDict and remove the checkpoint
+# Records in fallback are written for the Pokemon missing from the checkpoint
+# Keep the checkpoint if keep is True so the missing Pokemon can be retried
+# with --resume
+# Print errorMsg if there is an exception
+def compactCheckpoint(checkpointFile, writeFile, errorMsg, fallback=None,
+                      keep=False):
+  records = loadCheckpoint(checkpointFile)
+  if (fallback is not None):
+    for (key, record) in fallback.items():
+      records.setdefault(key, record)
+  saveDict(writeDict=records, writeFile=writeFile, errorMsg=errorMsg)
+  if (not keep):
+    os.remove(checkpointFile)
+  return len(records)
+
 def main(argv):
   start = time.time()
   logFormat   = "%(asctime)s %(levelname)s %(message)s"
   dateFormat  = "%Y-%m-%d %H:%M:%S UTC-%z"
   logging.basicConfig(format=logFormat, datefmt=dateFormat, level=10)
-  shortOpts = "ahpt"
-  longOpts = ["all", "help", "pokemon", "terraria"]
+  shortOpts = "ahprtu:"
+  longOpts = ["all", "help", "pokemon", "resume", "terraria", "upstream="]
   try:
     opts, args = getopt.getopt(argv[1:], shortOpts, longOpts)
   except getopt.GetoptError as e:
@@ -274,6 +363,8 @@ def main(argv):
   pokedex = False
   # Whether or not to get the prefixes from the official Terraria wiki
   prefixes = False
+  # Whether or not to skip the Pokemon already in the checkpoint file
+  resume = False
   for (o, a) in opts:
     if (o in ("-a", "--all")):
       pokedex = True
@@ -282,8 +373,12 @@ def main(argv):
       help(2)
     elif (o in ("-p", "--pokemon")):
       pokedex = True
+    elif (o in ("-r", "--resume")):
+      resume = True
     elif (o in ("-t", "--terraria")):
       prefixes = True
+    elif (o in ("-u", "--upstream")):
+      setUpstream(a)
   if ((not pokedex) and (not prefixes)):
     logging.error("Please specify what you would like to setup.")
     help(2)
@@ -292,7 +387,7 @@ def main(argv):
     baseURL = "http://bulbapedia.bulbagarden.net"
     regions = {"Kanto", "Johto", "Hoenn", "Sinnoh", "Unova", "Kalos", "Alola"}
     soup = getSoup(targetURL="%s%s"%(baseURL, "/wiki/List_of_Pok%C3%A9mon_by_National_Pok%C3%A9dex_number"),
-                   errorMsg="")
+                   errorMsg="", parseOnly=tableStrainer)
     tables = soup.find_all("table")
     # tables[1] should be Kanto
     # tables[2] should be Johto
@@ -333,16 +428,32 @@ def main(argv):
       # It's not a table that we're interested in
       else:
         continue
+    # Pokemon that were finished before the crawl was interrupted
+    completed = set()
+    if (resume):
+      completed = set(loadCheckpoint(checkpointFile))
+      logging.debug("Resuming with %d Pokémon already done" % len(completed))
+    checkpoint = openCheckpoint(checkpointFile, resume)
     for key in nationalDex:
+      if (key in completed):
+        continue
       tempDict = nationalDex[key]
-      soup = getSoup(targetURL=tempDict["url"],
+      data = getPage(targetURL=tempDict["url"],
                      errorMsg="")
-      tempDict.update(getPokemon(soup, key))
-      nationalDex[key] = tempDict
+      try:
+        tempDict.update(parsePokemon(data, key))
+      except ParseError:
+        # The Pokemon can be retried with --resume
+        checkpoint.close()
+        exit(1)
+      # Stream the Pokemon to the checkpoint instead of keeping it in memory
+      appendRecord(checkpoint, key, tempDict)
+      nationalDex[key] = {"url": tempDict["url"]}
+    checkpoint.close()
   if (prefixes):
     logging.debug("Preparing Terraria prefixes...")
     soup = getSoup(targetURL="http://terraria.gamepedia.com/Prefix_IDs",
-                   errorMsg="")
+                   errorMsg="", parseOnly=tableStrainer)
     # Get the tables
     tables = soup.find_all("table")
     for tableBody in tables:
@@ -354,11 +465,8 @@ def main(argv):
           if (len(cols) == 2):
             prefix  = cols[0].string.lower().strip()
             id      = cols[1].string.lower().strip()
-            # Prefix that has multiple IDs
-            if (prefix in prefixDict):
-              prefixDict[prefix] = [prefixDict[prefix], id]
-            else:
-              prefixDict[prefix] = id
+            # Prefixes may have multiple IDs
+            prefixDict.setdefault(prefix, []).append(id)
           # Ignore the table headers
           else:
             assert(len(row.find_all("th")) != 0)
@@ -367,9 +475,9 @@ def main(argv):
         continue
   if (pokedex):
     logging.debug("Writing pokedex to pokedex.json...")
-    saveDict(writeDict=nationalDex,
-             writeFile="pokedex.json",
-             errorMsg="Error writing pokedex to pokedex.json")
+    compactCheckpoint(checkpointFile=checkpointFile,
+                      writeFile="pokedex.json",
+                      errorMsg="Error writing pokedex to pokedex.json")
     logging.debug("Done!")
   if (prefixes):
     logging.debug("Writing prefixes to terrariaPrefixes.json...")
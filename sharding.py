@@ -0,0 +1,71 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+
+# Shards hosted by this process, set by launch() for every bot process
+# None when the bot isn't sharded
+shardIDs = None
+if (os.environ.get("COMPANIONBOT_SHARD_IDS")):
+    shardIDs = [int(i) for i in
+                os.environ["COMPANIONBOT_SHARD_IDS"].split(",")]
+shardCount = int(os.environ.get("COMPANIONBOT_SHARD_COUNT", "1"))
+# Index of this process among the bot's processes
+processIndex = int(os.environ.get("COMPANIONBOT_PROCESS", "0"))
+# The process with shard 0 refreshes the data shared by every process and the
+# others only read it
+isLeader = (shardIDs is None) or (0 in shardIDs)
+# Discord only lets a bot identify one shard every 5 seconds
+identifyDelay = 5
+
+
+def shardOptions():
+    """Return the keyword arguments for this process's AutoShardedBot."""
+    if (shardIDs is None):
+        return dict()
+    return {"shard_ids": shardIDs, "shard_count": shardCount}
+
+
+def launch(shards, processes, argv):
+    """Run the bot in several processes that each host some of the shards.
+
+    Returns the exit code of the first process to exit after stopping the
+    others.
+    Keyword arguments:
+    shards    -- the total number of shards
+    processes -- the number of processes to split the shards between
+    argv      -- the bot's command line, which every process is started with
+    """
+    processes = max(1, min(processes, shards))
+    children = []
+    try:
+        for i in range(processes):
+            ids = list(range(i, shards, processes))
+            env = dict(os.environ,
+                       COMPANIONBOT_SHARD_IDS=",".join(str(id) for id in ids),
+                       COMPANIONBOT_SHARD_COUNT=str(shards),
+                       COMPANIONBOT_PROCESS=str(i))
+            child = subprocess.Popen([sys.executable] + argv, env=env)
+            children.append(child)
+            logging.info("Started process {} with shards {}".format(
+                child.pid, ids))
+            # Let the process identify its shards before starting the next
+            if (i < processes - 1):
+                time.sleep(identifyDelay * len(ids))
+        while True:
+            for child in children:
+                returnCode = child.poll()
+                if (returnCode is not None):
+                    logging.error("Process {} exited with {}".format(
+                        child.pid, returnCode))
+                    return returnCode
+            time.sleep(1)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        for child in children:
+            if (child.poll() is None):
+                child.terminate()
+        for child in children:
+            child.wait()
@@ -0,0 +1,38 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single call.
+
+    The first caller for a key starts the work and every caller that arrives
+    while it is in flight awaits the same future instead of repeating it.
+    """
+    def __init__(self):
+        # Futures for the calls that are in flight keyed by their key
+        self.inFlight = dict()
+
+    async def do(self, key, func, *args, **kwargs):
+        """Await func(*args, **kwargs) unless a call for key is in flight.
+
+        Keyword arguments:
+        key  -- the key identifying the call
+        func -- the coroutine function to call
+        """
+        future = self.inFlight.get(key)
+        if (future is None):
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self.inFlight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        # Shield the shared call so one caller being cancelled doesn't cancel
+        # it for everybody else
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        """Remove a finished call from the in flight calls.
+
+        Keyword arguments:
+        key    -- the key identifying the call
+        future -- the finished future
+        """
+        if (self.inFlight.get(key) is future):
+            del self.inFlight[key]
@@ -0,0 +1,45 @@
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Use lxml if it is installed since it is much faster than html.parser
+try:
+    import lxml  # noqa: F401
+    parserName = "lxml"
+except ImportError:
+    parserName = "html.parser"
+
+# Only the tables and the headings before them are needed from a Pokemon's
+# Bulbapedia page. The headings are kept because the base stat tables are
+# titled by the element right before them (e.g. "Mega Charizard X").
+pokePageStrainer = SoupStrainer(["table", "h2", "h3", "h4", "h5", "h6"])
+# Only the tables are needed from the National Pokedex list and Prefix_IDs
+tableStrainer = SoupStrainer("table")
+
+
+def makeSoup(data, parseOnly=None):
+    """Parse a page with the fastest available parser.
+
+    Falls back to html.parser if the faster parser fails.
+    Keyword arguments:
+    data      -- the HTML of the page
+    parseOnly -- a SoupStrainer restricting which parts of the page to parse
+    """
+    try:
+        return BeautifulSoup(data, parserName, parse_only=parseOnly)
+    except Exception as e:
+        if (parserName == "html.parser"):
+            raise
+        logging.debug(e)
+        logging.debug("{} failed, falling back to html.parser".format(
+            parserName))
+        return BeautifulSoup(data, "html.parser", parse_only=parseOnly)
+
+
+def makeFullSoup(data):
+    """Parse an entire page with html.parser.
+
+    Keyword arguments:
+    data -- the HTML of the page
+    """
+    return BeautifulSoup(data, "html.parser")
@@ -0,0 +1,310 @@
+import operator
+import re
+
+from pokeRecord import missing
+from pokeStore import dexNumber, statColumns
+
+# NumPy is optional, !query is disabled without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Names that can be used for each column in a query
+columnNames = {"hp": "hp",
+               "attack": "attack", "atk": "attack",
+               "defense": "defense", "def": "defense",
+               "spatk": "spAtk", "sp.atk": "spAtk", "spa": "spAtk",
+               "spdef": "spDef", "sp.def": "spDef", "spd": "spDef",
+               "speed": "speed", "spe": "speed",
+               "total": "total", "bst": "total",
+               "number": "natDexNo", "no": "natDexNo",
+               }
+# Comparison operators
+comparisons = {">=": operator.ge,
+               "<=": operator.le,
+               "!=": operator.ne,
+               ">": operator.gt,
+               "<": operator.lt,
+               "=": operator.eq,
+               }
+# A term such as "speed>100", with ">=" tried before ">"
+termRE = re.compile(r"^([a-z.]+)(>=|<=|!=|>|<|=)(.*)$")
+# The columns of numbers in a StatTable, in PokeStore.statRows order
+numberColumns = ("natDexNo",) + statColumns + ("total",)
+# Number of results if the query doesn't have a limit and the most it can have
+defaultLimit = 10
+maxLimit = 25
+
+
+def formatStat(value):
+    """Format a value from a StatTable's columns, "?" if it's missing."""
+    return "?" if numpy.isnan(value) else str(int(value))
+
+
+class StatQuery:
+    """A parsed query such as "speed>100 type=fire sort=-attack limit=10"."""
+    def __init__(self):
+        # (column, comparison function, value) tuples
+        self.comparisons = []
+        self.types = []
+        self.abilities = []
+        # Prefix of the forms' names
+        self.form = None
+        # Column to sort by, by National Dex number if it's None
+        self.sort = None
+        self.descending = False
+        self.limit = defaultLimit
+
+    @classmethod
+    def parse(cls, words):
+        """Parse the words of a query.
+
+        Raises ValueError with a message for the user if a term is invalid.
+        Keyword arguments:
+        words -- the query split on spaces
+        """
+        query = cls()
+        # Values with spaces such as "ability=thick fat" are split into words
+        terms = []
+        for word in words:
+            match = termRE.match(word.lower())
+            if (match is not None):
+                terms.append(list(match.groups()))
+            elif ((len(terms) > 0) and (terms[-1][0] in ("ability", "form"))):
+                terms[-1][2] = "{} {}".format(terms[-1][2], word.lower())
+            else:
+                raise ValueError("Invalid term '{}'".format(word))
+        for (name, op, value) in terms:
+            value = value.strip()
+            if (name in ("type", "ability", "form", "sort", "limit")):
+                if ((op != "=") or (value == "")):
+                    raise ValueError("Use {}=VALUE".format(name))
+            if (name == "type"):
+                query.types.append(value)
+            elif (name == "ability"):
+                query.abilities.append(value)
+            elif (name == "form"):
+                query.form = value
+            elif (name == "sort"):
+                query.descending = value.startswith("-")
+                query.sort = columnNames.get(value.lstrip("-+"))
+                if (query.sort is None):
+                    raise ValueError("Can't sort by '{}'".format(value))
+            elif (name == "limit"):
+                try:
+                    query.limit = int(value)
+                    assert(1 <= query.limit <= maxLimit)
+                except (AssertionError, ValueError):
+                    raise ValueError("The limit must be from 1 to {}".format(
+                        maxLimit))
+            elif (name in columnNames):
+                try:
+                    number = float(value.lstrip("#"))
+                except ValueError:
+                    raise ValueError("Invalid number '{}'".format(value))
+                query.comparisons.append((columnNames[name], comparisons[op],
+                                          number))
+            else:
+                raise ValueError("Unknown stat '{}'".format(name))
+        return query
+
+
+class StatTable:
+    """Columnar NumPy arrays of the base stats of every form in a PokeStore.
+
+    Every form is a row and every stat is a column, so a query is answered
+    with a few comparisons over whole columns instead of a loop over the
+    Pokemon. Types and abilities are kept as a boolean column for each value.
+    """
+    def __init__(self, store):
+        """Read every form's stats, types and abilities from a store.
+
+        Keyword arguments:
+        store -- the pokeStore.PokeStore
+        """
+        rows = store.statRows()
+        # Row -> (Pokemon, form)
+        self.keys = [(pokemon, form) for (pokemon, form, *_) in rows]
+        # Column -> values, NaN if the stat is missing
+        self.columns = dict()
+        numbers = self._numbers([row[2:] for row in rows])
+        for (i, column) in enumerate(numberColumns):
+            self.columns[column] = numbers[:, i]
+        self.forms = numpy.array([form.lower() for (_, form) in self.keys],
+                                 dtype=str)
+        self.typeColumns = self._valueColumns(
+            self._formValues(self.keys, store.formRows("types")))
+        self.abilityColumns = self._valueColumns(
+            self._formValues(self.keys, store.formRows("abilities")))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def _numbers(rows):
+        """Return rows of numbers as a 2D float array, NaN for None."""
+        return numpy.array(rows, dtype=float).reshape(len(rows),
+                                                      len(numberColumns))
+
+    @staticmethod
+    def _formValues(keys, formRows):
+        """Return the set of types or abilities of each row.
+
+        Entries that aren't forms with stats (e.g. "Hidden Ability") belong
+        to the base form, whose name is the Pokemon's, and to every form
+        without types or abilities of its own.
+        Keyword arguments:
+        keys     -- the (Pokemon, form) of each row
+        formRows -- the (Pokemon, form, value) rows from PokeStore.formRows
+        """
+        # Pokemon -> form -> values
+        byPokemon = dict()
+        for (pokemon, form, value) in formRows:
+            byPokemon.setdefault(pokemon, dict()).setdefault(
+                form, set()).add(value.lower())
+        statForms = set(keys)
+        rowValues = []
+        for (pokemon, form) in keys:
+            forms = byPokemon.get(pokemon, dict())
+            values = set(forms.get(form, ()))
+            isBase = (form.lower() == pokemon.replace("_", " ").lower())
+            if (isBase or (form not in forms)):
+                for (otherForm, otherValues) in forms.items():
+                    if ((pokemon, otherForm) not in statForms):
+                        values |= otherValues
+            rowValues.append(values)
+        return rowValues
+
+    @staticmethod
+    def _valueColumns(rowValues):
+        """Return a boolean column for each type or ability.
+
+        Keyword arguments:
+        rowValues -- the set of values of each row from _formValues
+        """
+        valueColumns = dict()
+        for (row, values) in enumerate(rowValues):
+            for value in values:
+                column = valueColumns.get(value)
+                if (column is None):
+                    column = valueColumns[value] = numpy.zeros(len(rowValues),
+                                                               dtype=bool)
+                column[row] = True
+        return valueColumns
+
+    @staticmethod
+    def _splice(array, remove, position, values):
+        """Return a column with some rows removed and new rows inserted.
+
+        Keyword arguments:
+        array    -- the column
+        remove   -- the rows to remove
+        position -- the row to insert the new rows at after removing
+        values   -- the values of the new rows
+        """
+        kept = numpy.delete(array, remove)
+        # Strings are concatenated so longer ones aren't truncated
+        dtype = str if (array.dtype.kind == "U") else array.dtype
+        return numpy.concatenate((kept[:position],
+                                  numpy.asarray(values, dtype=dtype),
+                                  kept[position:]))
+
+    def _position(self, pokemon, natDexNo):
+        """Return the row of a Pokemon's first form once its rows are removed.
+
+        The rows are in statRows order, by National Dex number and then name.
+        Keyword arguments:
+        pokemon  -- the name of the Pokemon
+        natDexNo -- its National Dex number as an int or None
+        """
+        numbers = self.columns["natDexNo"]
+        sortKey = (-1 if (natDexNo is None) else natDexNo, pokemon)
+        position = 0
+        for (row, (name, _)) in enumerate(self.keys):
+            number = -1 if numpy.isnan(numbers[row]) else numbers[row]
+            if ((name != pokemon) and ((number, name) < sortKey)):
+                position += 1
+        return position
+
+    def update(self, pokemon, record):
+        """Replace a Pokemon's rows with the forms of its new record.
+
+        Only the Pokemon's rows change, so a refreshed page doesn't require
+        reading every form from the store again.
+        Keyword arguments:
+        pokemon -- the name of the Pokemon
+        record  -- its pokeRecord.PokeRecord
+        """
+        remove = [row for (row, (name, _)) in enumerate(self.keys)
+                  if (name == pokemon)]
+        natDexNo = dexNumber(record.natDexNo)
+        position = self._position(pokemon, natDexNo)
+        forms = sorted(record.baseStats, key=str.lower)
+        keys = [(pokemon, form) for form in forms]
+        rows = []
+        for form in forms:
+            stats = record.baseStats[form]
+            values = [stats.base(i) for i in range(len(statColumns))]
+            values.append(stats.total)
+            rows.append([natDexNo] + [None if (value == missing) else value
+                                      for value in values])
+        numbers = self._numbers(rows)
+        for (i, column) in enumerate(numberColumns):
+            self.columns[column] = self._splice(self.columns[column], remove,
+                                                position, numbers[:, i])
+        self.forms = self._splice(self.forms, remove, position,
+                                  [form.lower() for form in forms])
+        self.keys = [key for key in self.keys if (key[0] != pokemon)]
+        self.keys[position:position] = keys
+        for (valueColumns, formDict) in ((self.typeColumns, record.types),
+                                         (self.abilityColumns,
+                                          record.abilities)):
+            rowValues = self._formValues(
+                keys, [(pokemon, form, value)
+                       for (form, values) in formDict.items()
+                       for value in values])
+            for (value, column) in list(valueColumns.items()):
+                valueColumns[value] = self._splice(
+                    column, remove, position,
+                    [value in values for values in rowValues])
+            for value in set().union(*rowValues) - set(valueColumns):
+                column = numpy.zeros(len(self.keys), dtype=bool)
+                column[position:position + len(keys)] = [
+                    value in values for values in rowValues]
+                valueColumns[value] = column
+
+    def run(self, query):
+        """Return the (Pokemon, form, stats) of the rows matching a query.
+
+        stats maps each of the columns to its value, NaN if it's missing.
+        Also returns the number of matching rows before the limit.
+        Keyword arguments:
+        query -- the StatQuery
+        """
+        mask = numpy.ones(len(self.keys), dtype=bool)
+        for (column, compare, value) in query.comparisons:
+            values = self.columns[column]
+            # Missing stats never match
+            mask &= compare(values, value) & ~numpy.isnan(values)
+        empty = numpy.zeros(len(self.keys), dtype=bool)
+        for value in query.types:
+            mask &= self.typeColumns.get(value, empty)
+        for value in query.abilities:
+            mask &= self.abilityColumns.get(value, empty)
+        if (query.form is not None):
+            mask &= numpy.char.startswith(self.forms, query.form)
+        rows = numpy.flatnonzero(mask)
+        if (query.sort is not None):
+            sortValues = self.columns[query.sort][rows]
+            if (query.descending):
+                sortValues = -sortValues
+            # Stable so that ties stay in National Dex order and NaNs go last
+            rows = rows[numpy.argsort(sortValues, kind="stable")]
+        results = []
+        for row in rows[:query.limit]:
+            (pokemon, form) = self.keys[row]
+            results.append((pokemon, form,
+                            {column: values[row]
+                             for (column, values) in self.columns.items()}))
+        return (results, len(rows))
@@ -1,31 +1,73 @@
 # Standard Python modules
+import asyncio
+import json
 import logging
+import os
+import time
+from os import path
 # Non-standard Python modules
-import aiohttp
 import discord
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
-user_agent = 'Mozilla/5.0 (Windows; U; Windows NT 10.0; rv:10.0) Gecko/20100101 Firefox/52.0'
-sendHeader = {'UserAgent':user_agent,}
+import metrics
+import sharding
+from prefixIndex import PrefixIndex, normalizePrefixes
+from singleFlight import SingleFlight
+from upstream import upstreamURL
+
+# Longest reply that fits in a Discord message along with its code block
+maxReplyLength = 1990
 
 class Terraria:
   """Terraria-related commands."""
-  def __init__(self, bot):
+  def __init__(self, bot, httpClient, cogDir=None):
+    """Create the cog and open its data files.
+
+    Keyword arguments:
+    bot        -- the bot the cog is added to
+    httpClient -- the HTTP client shared by every cog
+    cogDir     -- the directory with the cog's data files, the directory this
+                  file is in by default
+    """
     self.bot = bot
+    # The HTTP client shared by every cog
+    self.httpClient = httpClient
+    # Prefix name -> list of IDs
     self.prefixes = None
+    # Prefix ID -> prefix name
+    self.prefixIDs = None
+    # Sorted index of self.prefixes for partial matches
+    self.index = None
+    # Coalesces concurrent downloads of the prefix table
+    self.flights = SingleFlight()
+    if (cogDir is None):
+      cogDir = path.split(__file__)[0]
+    # Snapshot of the prefixes from setup.py, asyncTest.py or the last download
+    self.prefixFile = path.join(cogDir, "terrariaPrefixes.json")
+    self._warmUpTask = None
 
   async def _getTPrefixes(self, session):
     """Create a dictionary containing the ID's for each Terraria prefix."""
     url = "http://terraria.gamepedia.com/Prefix_IDs"
-    async with session.get(url) as response:
+    # Imported on first use since BeautifulSoup is slow to import
+    from soupUtils import makeSoup, tableStrainer
+    # Connection errors are raised by session.get before there's a response
+    response = None
+    with metrics.httpLatency.time("gamepedia"):
       try:
-        assert(response.status == 200)
-        data = await response.read()
-        soup = BeautifulSoup(data, "html.parser")
+        async with session.get(upstreamURL(url)) as response:
+          assert(response.status == 200)
+          data = await response.read()
       except Exception as e:
+        metrics.httpErrors.inc("gamepedia", metrics.errorReason(response, e))
         logging.error(e)
         return False
+    try:
+      with metrics.parseLatency.time("prefixes"):
+        soup = makeSoup(data, tableStrainer)
+    except Exception as e:
+      logging.error(e)
+      return False
     d = dict()
     tables = soup.find_all(name="table")
     for tableBody in tables:
@@ -37,34 +79,164 @@ class Terraria:
           if (len(cols) == 2):
             prefix = cols[0].string.lower().strip()
             id     = cols[1].string.lower().strip()
-            #Prefix that has multiple IDs
-            if (prefix in d):
-              d[prefix] = [d[prefix], id]
-            else:
-              d[prefix] = id
-    self.prefixes = d
+            # Prefixes may have multiple IDs
+            d.setdefault(prefix, []).append(id)
+    self._setPrefixes(d)
+    # Replace the file atomically since other processes may be reading it
+    tempFile = "{}.{}.tmp".format(self.prefixFile, os.getpid())
+    try:
+      with open(tempFile, "w") as f:
+        json.dump(d, f, sort_keys=True, indent=2)
+      os.replace(tempFile, self.prefixFile)
+    except Exception as e:
+      logging.error(e)
     return
 
+  def _loadTPrefixes(self):
+    """Load the prefixes from the snapshot saved by _getTPrefixes."""
+    if (not path.exists(self.prefixFile)):
+      return False
+    try:
+      with open(self.prefixFile, "r") as f:
+        d = json.load(f)
+    except Exception as e:
+      logging.error(e)
+      logging.error("Error loading {}".format(self.prefixFile))
+      return False
+    # Don't overwrite prefixes that were downloaded in the meantime
+    if (self.prefixes == None):
+      self._setPrefixes(d)
+    return True
+
+  def _setPrefixes(self, d):
+    """Use a new prefix dictionary and rebuild the indexes from it."""
+    # Snapshots from older versions may store IDs as strings or nested lists
+    d = normalizePrefixes(d)
+    self.index = PrefixIndex(d)
+    self.prefixIDs = {id: prefix for (prefix, ids) in d.items() for id in ids}
+    self.prefixes = d
+
+  async def warmUp(self):
+    """Load the prefixes from their snapshot and then refresh them."""
+    start = time.time()
+    if (self._loadTPrefixes()):
+      logging.info("Loaded {} prefixes from {} in {:.3f} seconds".format(
+        len(self.prefixes), self.prefixFile, time.time() - start))
+      # Only one of the bot's processes refreshes the shared prefixes
+      if (not sharding.isLeader):
+        return
+    try:
+      await self.flights.do("prefixes", self._getTPrefixes,
+                            self.httpClient.session)
+    except Exception as e:
+      logging.error(e)
+      logging.error("Error refreshing the Terraria prefixes")
+      return
+    logging.info("Terraria prefix warm-up finished in {:.3f} seconds".format(
+      time.time() - start))
+
+  def startWarmUp(self):
+    """Start warming up the prefixes without blocking the bot."""
+    if (self._warmUpTask == None):
+      self._warmUpTask = asyncio.ensure_future(self.warmUp())
+
+  async def on_ready(self):
+    # on_ready is also dispatched after reconnecting
+    self.startWarmUp()
+
+  def __unload(self):
+    """Stop the warm-up when the cog is unloaded."""
+    if (self._warmUpTask != None):
+      self._warmUpTask.cancel()
+
+  def _formatPrefix(self, prefix):
+    """Format a prefix and its ID(s) for a reply."""
+    return "{0}: {1}".format(prefix, ", ".join(self.prefixes[prefix]))
+
   @commands.command()
-  async def prefix(self, ctx, search : str):
-    """Look up an item prefix on the official Terraria wiki."""
-    if (search == ""):
+  async def prefix(self, ctx, *search : str):
+    """Look up item prefixes on the official Terraria wiki.
+
+    Partial names are completed, e.g. "leg" finds "legendary".
+    """
+    if (len(search) < 1):
       await ctx.send("Please specify a Terraria prefix to look up.")
       return
-    # Share a client session so it will not open a new session for each request
-    async with aiohttp.ClientSession() as session:
-      # Setup the dictionary with all of the prefixes first
-      if (self.prefixes == None):
-        await self._getTPrefixes(session)
-    prefix = search.lower()
+    # Setup the dictionary with all of the prefixes first
+    if (self.prefixes == None):
+      await self.flights.do("prefixes", self._getTPrefixes,
+                            self.httpClient.session)
+    if (self.prefixes == None):
+      await ctx.send("Unable to get the prefixes from the Terraria wiki.")
+      return
+    lines = []
+    for term in search:
+      lines.append(self._lookUpName(term))
+    await self._sendLines(ctx, lines)
+    return
+
+  async def _sendLines(self, ctx, lines):
+    """Send reply lines split to stay under Discord's 2000 character limit."""
+    message = []
+    for line in lines:
+      # A "did you mean" line can be longer than a whole message
+      if (len(line) > maxReplyLength):
+        line = "{}...".format(line[:maxReplyLength - 3])
+      if ((len(message) > 0) and
+          (len("\n".join(message + [line])) > maxReplyLength)):
+        await ctx.send("```{}```".format("\n".join(message)))
+        message = []
+      message.append(line)
+    await ctx.send("```{}```".format("\n".join(message)))
+
+  def _lookUpName(self, term):
+    """Return a reply line for a prefix name or the start of one."""
+    prefix = term.lower()
     if (prefix in self.prefixes):
-      id = self.prefixes[prefix]
-      # Prefix with multiple IDs
-      if (type(id) == list):
-        await ctx.send("```{0}: {1}```".format(prefix, ", ".join(id)))
+      return self._formatPrefix(prefix)
+    matches = self.index.search(prefix)
+    if (len(matches) == 1):
+      return self._formatPrefix(matches[0])
+    elif (len(matches) > 1):
+      return "{}: did you mean {}?".format(
+        term, ", ".join(self._formatPrefix(m) for m in matches))
+    return "Invalid prefix '{}' specified.".format(term)
+
+  # Named prefixBatch since self.prefixes would hide a method named prefixes
+  @commands.command(name="prefixes")
+  async def prefixBatch(self, ctx, *search : str):
+    """Look up many item prefixes or prefix IDs at once.
+
+    Names and IDs can be mixed and separated by spaces or commas.
+    """
+    terms = [t for t in " ".join(search).replace(",", " ").split() if t]
+    if (len(terms) < 1):
+      await ctx.send("Please specify Terraria prefixes or IDs to look up.")
+      return
+    if (self.prefixes == None):
+      await self.flights.do("prefixes", self._getTPrefixes,
+                            self.httpClient.session)
+    if (self.prefixes == None):
+      await ctx.send("Unable to get the prefixes from the Terraria wiki.")
+      return
+    lines = []
+    for term in terms:
+      if (term.isdigit()):
+        # Strip leading zeros so "007" finds ID 7
+        id = str(int(term))
+        if (id in self.prefixIDs):
+          lines.append("{0}: {1}".format(id, self.prefixIDs[id]))
+        else:
+          lines.append("Invalid prefix ID '{}' specified.".format(term))
       else:
-        await ctx.send("```{0}: {1}```".format(prefix, id))
-    else:
-      await ctx.send("""```Invalid prefix '{}' specified. Please specify \
-a valid prefix to look up```.""".format(search))
-    return
\ No newline at end of file
+        lines.append(self._lookUpName(term))
+    await self._sendLines(ctx, lines)
+    return
+
+def setup(bot):
+  """Add the cog when the bot loads this module as an extension."""
+  cog = Terraria(bot, bot.httpClient)
+  bot.add_cog(cog)
+  # on_ready has already been dispatched if the cog is loaded at runtime
+  if (bot.is_ready()):
+    cog.startWarmUp()
@@ -0,0 +1,25 @@
+from pokeRecord import PokeRecord
+
+
+def makeRecord(natDexNo="#006", speed=100, forms=("Charizard",)):
+    """Return a small PokeRecord for the tests.
+
+    Keyword arguments:
+    natDexNo -- the record's National Dex number
+    speed    -- the base Speed of every form
+    forms    -- the names of the forms
+    """
+    stats = [0] * 31
+    for i in range(6):
+        stats[i * 5] = 50 + i
+    stats[25] = speed
+    stats[30] = sum(stats[i * 5] for i in range(6))
+    return PokeRecord.fromDict({
+        "category": "Flame Pokémon",
+        "natDexNo": natDexNo,
+        "img": "https://example.com/charizard.png",
+        "types": {form: ["Fire", "Flying"] for form in forms},
+        "abilities": {forms[0]: ["Blaze"], "Hidden Ability": ["Solar Power"]},
+        "baseStats": {form: stats for form in forms},
+        "url": "http://bulbapedia.bulbagarden.net/wiki/Charizard_(Pok%C3%A9mon)",
+    })
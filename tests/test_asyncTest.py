@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import asyncTest
+from setup import compactCheckpoint, loadCheckpoint, openCheckpoint
+
+url = "http://bulbapedia.bulbagarden.net/wiki/Charizard_(Pok%C3%A9mon)"
+previous = {"url": url, "category": "Flame Pokémon"}
+
+
+def crawlOne(tmp_path, monkeypatch, pokeInfo):
+    """Crawl charizard with a stubbed download and parse.
+
+    Returns the path of the checkpoint file.
+    Keyword arguments:
+    pokeInfo -- what parsing the page returns, None if it fails
+    """
+    async def conditionalGet(session, url, conditional=True):
+        return b"<html></html>"
+
+    checkpointFile = str(tmp_path / "pokedex.jsonl")
+    monkeypatch.setattr(asyncTest, "conditionalGet", conditionalGet)
+    monkeypatch.setattr(asyncTest, "parseInWorker",
+                        lambda data, key: pokeInfo)
+    monkeypatch.setattr(asyncTest, "parsePool", None)
+    monkeypatch.setattr(asyncTest, "nationalDex", {"charizard": {"url": url}})
+    monkeypatch.setattr(asyncTest, "previousDex", {"charizard": previous})
+    monkeypatch.setattr(asyncTest, "failed", set())
+    monkeypatch.setattr(asyncTest, "checkpoint",
+                        openCheckpoint(checkpointFile, False))
+    asyncio.new_event_loop().run_until_complete(
+        asyncTest.getPokeInfo("charizard", None))
+    asyncTest.checkpoint.close()
+    return checkpointFile
+
+
+def test_parse_failure_keeps_the_previous_record(tmp_path, monkeypatch):
+    checkpointFile = crawlOne(tmp_path, monkeypatch, None)
+    assert asyncTest.failed == {"charizard"}
+    # Not marked as done, so --resume retries it
+    assert loadCheckpoint(checkpointFile) == dict()
+    dexFile = str(tmp_path / "pokedex.json")
+    compactCheckpoint(checkpointFile, dexFile, "",
+                      fallback={"charizard": previous}, keep=True)
+    with open(dexFile) as f:
+        assert json.load(f) == {"charizard": previous}
+    assert (tmp_path / "pokedex.jsonl").exists()
+
+
+def test_parsed_records_are_not_kept_in_memory(tmp_path, monkeypatch):
+    checkpointFile = crawlOne(tmp_path, monkeypatch, {"category": "New"})
+    assert asyncTest.failed == set()
+    assert asyncTest.nationalDex == {"charizard": {"url": url}}
+    assert loadCheckpoint(checkpointFile) == {
+        "charizard": {"url": url, "category": "New"}}
+    compactCheckpoint(checkpointFile, str(tmp_path / "pokedex.json"), "")
+    assert not (tmp_path / "pokedex.jsonl").exists()
+
+
+def test_failed_list_download_reuses_the_previous_list(monkeypatch):
+    async def conditionalGet(session, url, conditional=True):
+        raise AssertionError("HTTP 503")
+
+    monkeypatch.setattr(asyncTest, "conditionalGet", conditionalGet)
+    monkeypatch.setattr(asyncTest, "nationalDex", dict())
+    monkeypatch.setattr(asyncTest, "previousDex", {"charizard": previous})
+    monkeypatch.setattr(asyncTest, "prefixDict", dict())
+    monkeypatch.setattr(asyncTest, "previousPrefixes", {"legendary": ["81"]})
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(asyncTest.getDexURL(None))
+    loop.run_until_complete(asyncTest.getPrefixes(None))
+    assert asyncTest.nationalDex == {"charizard": {"url": url}}
+    assert asyncTest.prefixDict == {"legendary": ["81"]}
+
+
+def test_worker_exceptions_mark_the_pokemon_as_failed(monkeypatch):
+    async def getPokeInfo(key, session):
+        if (key == "mew"):
+            raise RuntimeError("worker died")
+        asyncTest.crawlStats["updated"] += 1
+
+    monkeypatch.setattr(asyncTest, "getPokeInfo", getPokeInfo)
+    monkeypatch.setattr(asyncTest, "nationalDex", {"charizard": {"url": url},
+                                                   "mew": {"url": url}})
+    monkeypatch.setattr(asyncTest, "completed", set())
+    monkeypatch.setattr(asyncTest, "failed", set())
+    monkeypatch.setattr(asyncTest, "crawlStats",
+                        {"updated": 0, "unchanged": 0})
+    asyncio.new_event_loop().run_until_complete(asyncTest.getPokedex())
+    assert asyncTest.failed == {"mew"}
+    assert asyncTest.crawlStats["updated"] == 1
+
+
+def test_pages_that_failed_to_parse_are_parsed_again(tmp_path, monkeypatch):
+    requests = []
+
+    async def fetch(session, url, limiter, headers=None):
+        requests.append(headers)
+        if (headers.get("If-None-Match") == "v2"):
+            return (304, dict(), b"")
+        return (200, {"ETag": "v2"}, b"<html>new</html>")
+
+    monkeypatch.setattr(asyncTest, "fetch", fetch)
+    monkeypatch.setattr(asyncTest, "parsePool", None)
+    monkeypatch.setattr(asyncTest, "nationalDex", {"charizard": {"url": url}})
+    monkeypatch.setattr(asyncTest, "previousDex", {"charizard": previous})
+    monkeypatch.setattr(asyncTest, "crawlManifest",
+                        {url: {"sha1": "old", "etag": "v1"}})
+    monkeypatch.setattr(asyncTest, "completed", set())
+    monkeypatch.setattr(asyncTest, "crawlStats",
+                        {"updated": 0, "unchanged": 0})
+    for pokeInfo in (None, {"category": "New"}):
+        monkeypatch.setattr(asyncTest, "parseInWorker",
+                            lambda data, key: pokeInfo)
+        monkeypatch.setattr(asyncTest, "failed", set())
+        monkeypatch.setattr(asyncTest, "checkpoint", openCheckpoint(
+            str(tmp_path / "pokedex.jsonl"), False))
+        asyncio.new_event_loop().run_until_complete(asyncTest.getPokedex())
+        asyncTest.checkpoint.close()
+    # The second crawl didn't send the validators from the failed parse
+    assert requests == [{"If-None-Match": "v1"}, dict()]
+    assert asyncTest.failed == set()
+    assert asyncTest.crawlStats == {"updated": 1, "unchanged": 0}
+    assert asyncTest.crawlManifest[url]["etag"] == "v2"
@@ -0,0 +1,58 @@
+import time
+
+from helpers import makeRecord
+from pokeCache import LRUCache, PokeCache
+
+
+class FakeSnapshot(dict):
+    """Stands in for a PokeSnapshot or PokeStore."""
+
+
+def test_snapshot_records_are_served_stale_until_refreshed(tmp_path):
+    cache = PokeCache(str(tmp_path / "cache.json"))
+    record = makeRecord()
+    cache.attachSnapshot(FakeSnapshot(charizard=record))
+    assert cache.get("charizard") == (record, False)
+    # A second lookup still finds it instead of dropping it
+    assert cache.get("charizard") == (record, False)
+    cache.put("charizard", record)
+    assert cache.get("charizard") == (record, True)
+
+
+def test_stale_entries_are_served_until_max_stale(tmp_path):
+    cache = PokeCache(str(tmp_path / "cache.json"), ttl=10, maxStale=100)
+    record = makeRecord()
+    cache.put("charizard", record)
+    cache.entries["charizard"]["fetched"] = time.time() - 50
+    assert cache.get("charizard") == (record, False)
+    cache.entries["charizard"]["fetched"] = time.time() - 200
+    assert cache.get("charizard") == (None, False)
+    assert "charizard" not in cache.entries
+
+
+def test_entries_survive_a_restart(tmp_path):
+    cacheFile = str(tmp_path / "cache.json")
+    record = makeRecord()
+    cache = PokeCache(cacheFile)
+    cache.put("charizard", record)
+    cache.save()
+    assert PokeCache(cacheFile).get("charizard") == (record, True)
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxEntries=2, maxBytes=1000)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_lru_evicts_entries_past_max_bytes():
+    cache = LRUCache(maxEntries=10, maxBytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
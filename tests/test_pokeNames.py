@@ -0,0 +1,46 @@
+import pytest
+
+from pokeNames import NameIndex, editDistance, normalize
+
+names = ["bulbasaur", "charizard", "nidoran_(f)", "nidoran_(m)", "mudkip",
+         "flabébé", "type:_null", "farfetch'd", "mr._mime"]
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("Flabébé", "flabebe"), ("Nidoran♀", "nidoranf"),
+    ("nidoran_(f)", "nidoranf"), ("Type: Null", "typenull"),
+    ("Farfetch’d", "farfetchd")])
+def test_normalize(query, expected):
+    assert normalize(query) == expected
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert editDistance("charizard", "charizrad", 2) == 2
+    assert editDistance("charizard", "mew", 2) == 3
+    assert editDistance("bulbasaur", "ivysaurxx", 2) == 3
+
+
+def test_resolve_aliases():
+    index = NameIndex(names)
+    assert index.resolve("FLABEBE") == "flabébé"
+    assert index.resolve("Nidoran♂") == "nidoran_(m)"
+    assert index.resolve("Mr. Mime") == "mr._mime"
+    assert index.resolve("derpkip") == "mudkip"
+    assert index.resolve("missingno") is None
+
+
+def test_aliases_of_unknown_names_are_dropped():
+    index = NameIndex(["charizard"], aliases={"zard": "charizard",
+                                              "derpkip": "mudkip"})
+    assert index.resolve("zard") == "charizard"
+    assert index.resolve("derpkip") is None
+
+
+def test_suggest_typos_and_starts_of_names():
+    index = NameIndex(names)
+    assert index.suggest("charzard")[0] == "charizard"
+    assert index.suggest("bulbsaur")[0] == "bulbasaur"
+    assert sorted(index.suggest("nidoran", limit=2)) == ["nidoran_(f)",
+                                                          "nidoran_(m)"]
+    assert index.suggest("") == []
+    assert index.suggest("zzzzzz") == []
@@ -0,0 +1,45 @@
+from helpers import makeRecord
+from pokeRecord import FormStats, PokeRecord, missing
+
+
+def test_form_stats_from_parsed_strings():
+    parsed = {"HP": ("78", "138 - 185", "266 - 360"),
+              "Speed": ("100", "94 - 167", "184 - 328"),
+              "Total": "534"}
+    stats = FormStats.fromParsed(parsed)
+    assert stats.base(0) == 78
+    assert stats.strings(0) == ("78", "138 - 185", "266 - 360")
+    assert stats.strings(5) == ("100", "94 - 167", "184 - 328")
+    # Stats missing from the page are stored as missing and shown as "?"
+    assert stats.base(1) == missing
+    assert stats.strings(1) == ("?", "? - ?", "? - ?")
+    assert (stats.total, stats.totalString()) == (534, "534")
+
+
+def test_form_stats_from_the_old_format():
+    stats = FormStats.fromStrings({"HP": "78;138 - 185;266 - 360",
+                                   "Attack": "84",
+                                   "Total": "534"})
+    assert stats.strings(0) == ("78", "138 - 185", "266 - 360")
+    assert stats.strings(1) == ("84", "? - ?", "? - ?")
+
+
+def test_records_round_trip_through_dicts():
+    record = makeRecord(forms=("Charizard", "Mega Charizard X"))
+    assert PokeRecord.fromDict(record.toDict()) == record
+    assert record.types["Charizard"] == ("Fire", "Flying")
+
+
+def test_old_records_are_converted():
+    record = PokeRecord.fromDict({
+        "category": "Flame Pokémon", "natDexNo": "#006",
+        "img": "//cdn.bulbagarden.net/charizard.png",
+        "types": {"Charizard": "Fire;Flying"},
+        "abilities": {"Charizard": "Blaze"},
+        "baseStats": {"Charizard": {"HP": "78;138 - 185;266 - 360",
+                                    "Total": "534"}}})
+    assert record.img == "https://cdn.bulbagarden.net/charizard.png"
+    assert record.types == {"Charizard": ("Fire", "Flying")}
+    assert record.baseStats["Charizard"].total == 534
+    assert record.url is None
+    assert "url" not in record.toDict()
@@ -0,0 +1,66 @@
+from helpers import makeRecord
+from pokeSnapshot import PokeSnapshot, writeSnapshot
+
+
+def test_records_round_trip(tmp_path):
+    snapshotFile = str(tmp_path / "pokedex.bin")
+    record = makeRecord(forms=("Charizard", "Mega Charizard X"))
+    count = writeSnapshot({"charizard": record.toDict(),
+                           "mudkip": {"url": "http://example.com/mudkip"}},
+                          snapshotFile)
+    # Pokemon without records are skipped
+    assert count == 1
+    snapshot = PokeSnapshot(snapshotFile)
+    try:
+        assert len(snapshot) == 1
+        assert "charizard" in snapshot
+        assert "mudkip" not in snapshot
+        assert snapshot.get("charizard") == record
+        assert snapshot.url("charizard") == record.url
+        assert snapshot.get("mudkip") is None
+    finally:
+        snapshot.close()
+
+
+def test_legacy_records_are_converted(tmp_path):
+    snapshotFile = str(tmp_path / "pokedex.bin")
+    legacy = {"category": "Mud Fish Pokémon", "natDexNo": "#258",
+              "img": "//example.com/mudkip.png",
+              "types": {"Mudkip": "Water"},
+              "abilities": {"Mudkip": "Torrent"},
+              "baseStats": {"Mudkip": {"HP": "50;110 - 157;210 - 304",
+                                       "Total": "310"}}}
+    writeSnapshot({"mudkip": legacy}, snapshotFile)
+    snapshot = PokeSnapshot(snapshotFile)
+    try:
+        record = snapshot.get("mudkip")
+        assert record.img == "https://example.com/mudkip.png"
+        assert record.types == {"Mudkip": ("Water",)}
+        stats = record.baseStats["Mudkip"]
+        assert stats.strings(0) == ("50", "110 - 157", "210 - 304")
+        assert stats.strings(1) == ("?", "? - ?", "? - ?")
+        assert stats.totalString() == "310"
+    finally:
+        snapshot.close()
+
+
+def test_rewrites_keep_open_snapshots_readable(tmp_path):
+    snapshotFile = str(tmp_path / "pokedex.bin")
+    old = makeRecord(speed=100)
+    writeSnapshot({"charizard": old.toDict()}, snapshotFile)
+    snapshot = PokeSnapshot(snapshotFile)
+    try:
+        new = makeRecord(speed=120)
+        writeSnapshot({"charizard": new.toDict(),
+                       "blastoise": makeRecord(natDexNo="#009").toDict()},
+                      snapshotFile)
+        # The open snapshot still maps the file it was opened with
+        assert snapshot.get("charizard") == old
+    finally:
+        snapshot.close()
+    assert [path.name for path in tmp_path.iterdir()] == ["pokedex.bin"]
+    snapshot = PokeSnapshot(snapshotFile)
+    try:
+        assert (len(snapshot), snapshot.get("charizard")) == (2, new)
+    finally:
+        snapshot.close()
@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+import time
+
+from helpers import makeRecord
+from pokeCache import PokeCache
+from pokeStore import PokeStore, StoreWriter
+
+charizardURL = "http://bulbapedia.bulbagarden.net/wiki/Charizard_(Pok%C3%A9mon)"
+
+
+def makeStore(tmp_path):
+    """Return a store with Charizard's record and Pikachu's URL."""
+    store = PokeStore(str(tmp_path / "pokedex.db"))
+    store.put("charizard",
+              makeRecord(forms=("Charizard", "Mega Charizard X")))
+    store.putURLs({"pikachu": "http://bulbapedia.bulbagarden.net/wiki/"
+                              "Pikachu_(Pok%C3%A9mon)"},
+                  {"pikachu": 25})
+    return store
+
+
+def test_records_round_trip(tmp_path):
+    store = makeStore(tmp_path)
+    record = makeRecord(forms=("Charizard", "Mega Charizard X"))
+    assert store.get("charizard").toDict() == record.toDict()
+    assert store.url("charizard") == charizardURL
+    # Indexed Pokemon whose pages haven't been crawled have no record
+    assert store.get("pikachu") is None
+    assert "pikachu" in store
+    assert (len(store), store.recordCount()) == (2, 1)
+
+
+def test_dex_numbers_round_trip_as_written(tmp_path):
+    store = makeStore(tmp_path)
+    record = makeRecord(natDexNo="#0025", forms=("Pikachu",))
+    store.put("pikachu", record)
+    assert store.get("pikachu") == record
+    assert store.find(natDexNo=25) == ["pikachu"]
+
+
+def test_put_urls_keeps_records(tmp_path):
+    store = makeStore(tmp_path)
+    store.putURLs({"charizard": "http://example.com/charizard"}, {})
+    assert store.url("charizard") == "http://example.com/charizard"
+    assert store.get("charizard").natDexNo == "#006"
+
+
+def test_find_filters(tmp_path):
+    store = makeStore(tmp_path)
+    assert store.find() == ["charizard", "pikachu"]
+    assert store.find(natDexNo=25) == ["pikachu"]
+    assert store.find(type="FIRE") == ["charizard"]
+    assert store.find(ability="solar power") == ["charizard"]
+    assert store.find(type="fire", ability="static") == []
+
+
+def test_find_forms_by_prefix(tmp_path):
+    store = makeStore(tmp_path)
+    assert store.find(form="mega") == ["charizard"]
+    assert store.find(form="charizard x") == []
+    # LIKE wildcards in the query are matched literally
+    assert store.find(form="%") == []
+    assert store.find(form="m_ga") == []
+
+
+def test_get_newer_only_returns_records_fetched_by_the_bot(tmp_path):
+    store = makeStore(tmp_path)
+    # Written by a crawler
+    assert store.getNewer("charizard") is None
+    store.put("charizard", makeRecord(), fetched=100)
+    (record, fetched) = store.getNewer("charizard", 50)
+    assert (record.natDexNo, fetched) == ("#006", 100)
+    assert store.getNewer("charizard", 100) is None
+
+
+def test_cache_picks_up_records_fetched_by_another_process(tmp_path):
+    store = makeStore(tmp_path)
+    cache = PokeCache(str(tmp_path / "cache.json"), ttl=10)
+    cache.attachStore(store)
+    cache.put("charizard", makeRecord(speed=1))
+    cache.entries["charizard"]["fetched"] = time.time() - 20
+    # Another process refreshed Charizard in the meantime
+    other = PokeStore(str(tmp_path / "pokedex.db"))
+    other.put("charizard", makeRecord(speed=2), fetched=time.time())
+    (record, fresh) = cache.get("charizard")
+    assert (record.baseStats["Charizard"].base(5), fresh) == (2, True)
+
+
+def test_writer_runs_writes_in_its_own_thread(tmp_path):
+    store = makeStore(tmp_path)
+    writer = StoreWriter(store.dbFile)
+
+    async def write():
+        await writer.run("put", "blastoise", makeRecord(natDexNo="#009"), 5)
+        await writer.run("putURLs", {"mew": "http://example.com/mew"})
+
+    asyncio.run(write())
+    writer.close()
+    assert store.getNewer("blastoise")[1] == 5
+    assert store.url("mew") == "http://example.com/mew"
+
+
+def test_databases_without_fetched_are_upgraded(tmp_path):
+    dbFile = str(tmp_path / "pokedex.db")
+    db = sqlite3.connect(dbFile)
+    db.execute("""CREATE TABLE pokemon (name TEXT PRIMARY KEY,
+                  url TEXT NOT NULL, natDexNo INTEGER, category TEXT,
+                  img TEXT)""")
+    db.execute("INSERT INTO pokemon (name, url) VALUES ('mew', 'url')")
+    db.execute("""INSERT INTO pokemon (name, url, natDexNo, category)
+                  VALUES ('mudkip', 'url', 258, 'Mud Fish')""")
+    db.commit()
+    db.close()
+    store = PokeStore(dbFile)
+    store.put("mew", makeRecord(natDexNo="#151"), fetched=1)
+    assert store.getNewer("mew")[1] == 1
+    assert store.get("mew").natDexNo == "#151"
+    # Records stored before dexText was added fall back on the number
+    assert store.get("mudkip").natDexNo == "#258"
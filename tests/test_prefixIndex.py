@@ -0,0 +1,31 @@
+from prefixIndex import PrefixIndex, flattenIDs, normalizePrefixes
+
+names = ["legendary", "deadly", "dangerous", "hasty", "quick", "unreal",
+         "mythical", "godly", "demonic", "lucky"]
+
+
+def test_old_prefix_files_are_flattened():
+    assert flattenIDs("81") == ["81"]
+    assert flattenIDs([["20", "43"], "7"]) == ["20", "43", "7"]
+    assert normalizePrefixes({"deadly": [["20"], "43"], "quick": "42"}) == {
+        "deadly": ["20", "43"], "quick": ["42"]}
+
+
+def test_starting_with_and_containing():
+    index = PrefixIndex(names)
+    assert len(index) == len(names)
+    assert index.startingWith("d") == ["dangerous", "deadly", "demonic"]
+    assert index.startingWith("x") == []
+    # Only past the first letter, which startingWith covers
+    assert index.containing("ly") == {"deadly", "godly"}
+    assert index.containing("l") == {"deadly", "godly", "mythical",
+                                     "unreal"}
+
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = PrefixIndex(names + ["legend"])
+    assert index.search("legend") == ["legend", "legendary"]
+    assert index.search("de") == ["deadly", "demonic"]
+    assert index.search("ly") == ["godly", "deadly"]
+    assert index.search("d", limit=2) == ["deadly", "demonic"]
+    assert index.search("") == []
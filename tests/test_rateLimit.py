@@ -0,0 +1,57 @@
+import asyncio
+import email.utils
+import time
+
+from rateLimit import AdaptiveLimiter, TokenBucket, backoffDelay, retryAfter
+
+
+def test_bucket_does_not_burst_after_a_pause():
+    bucket = TokenBucket(rate=20, burst=20)
+
+    async def takeThree():
+        bucket.pause(0.05)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # The pause and then one token every 1/20 seconds, not a burst of 20
+    assert asyncio.run(takeThree()) >= 0.14
+
+
+def test_bucket_hands_out_its_burst_at_once():
+    bucket = TokenBucket(rate=1, burst=5)
+
+    async def takeFive():
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(takeFive()) < 0.1
+
+
+def test_retry_after_seconds_and_dates():
+    assert retryAfter({"Retry-After": "120"}) == 120.0
+    assert retryAfter({"Retry-After": "-5"}) == 0.0
+    assert retryAfter({"Retry-After": "soon"}) is None
+    assert retryAfter({}) is None
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < retryAfter({"Retry-After": date}) <= 60
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoffDelay(attempt, cap=3) <= 3
+               for attempt in range(20))
+
+
+def test_limiter_halves_on_backoff_and_grows_on_success():
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=9)
+    limiter.onBackoff()
+    assert limiter.limit == 4
+    # Only one decrease per round of in flight requests
+    limiter.onBackoff()
+    assert limiter.limit == 4
+    for _ in range(100):
+        limiter.onSuccess(0.1)
+    assert limiter.limit == 9
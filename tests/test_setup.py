@@ -0,0 +1,34 @@
+import pytest
+
+import asyncTest
+from recordedPages import loadFixture, pokeFixtures
+from setup import ParseError, getPokemon, parsePokemon
+from soupUtils import makeFullSoup, makeSoup, pokePageStrainer
+
+# The forms and the base Speed of each of the Pokemon in the fixtures
+expectedSpeeds = {
+    "charizard": {"Charizard": 100, "Mega Charizard X": 100,
+                  "Mega Charizard Y": 100},
+    "deoxys": {"Normal Forme": 150, "Attack Forme": 150,
+               "Defense Forme": 90, "Speed Forme": 180},
+    "nidoran_(f)": {"Nidoran (f)": 41},
+    "flabébé": {"Flabébé": 42},
+    "type:_null": {"Type: Null": 59},
+    "venusaur": {"Venusaur": 80, "Mega Venusaur": 80},
+}
+
+
+@pytest.mark.parametrize("pokemon", sorted(pokeFixtures))
+def test_strained_parse_matches_the_full_parse(pokemon):
+    data = loadFixture(pokeFixtures[pokemon][0])
+    strained = getPokemon(makeSoup(data, pokePageStrainer), pokemon)
+    assert strained == getPokemon(makeFullSoup(data), pokemon)
+    # The form titles come from the headings before the stat tables
+    assert ({form: stats[25] for (form, stats) in
+             strained["baseStats"].items()} == expectedSpeeds[pokemon])
+
+
+def test_unparseable_pages_raise_parse_error():
+    with pytest.raises(ParseError):
+        parsePokemon(b"<html><body><table></table></body></html>", "mew")
+    assert asyncTest.parseInWorker(b"<html></html>", "mew") is None
@@ -0,0 +1,104 @@
+import operator
+
+import pytest
+
+from helpers import makeRecord
+from pokeStore import PokeStore
+from statQuery import StatQuery, maxLimit
+
+
+def test_parse_terms():
+    query = StatQuery.parse(["speed>=100", "type=Fire", "ability=thick",
+                             "fat", "sort=-atk", "limit=5", "no<#151"])
+    assert query.comparisons == [("speed", operator.ge, 100.0),
+                                 ("natDexNo", operator.lt, 151.0)]
+    assert query.types == ["fire"]
+    assert query.abilities == ["thick fat"]
+    assert (query.sort, query.descending, query.limit) == ("attack", True, 5)
+
+
+@pytest.mark.parametrize("words", [["speed"], ["speed>fast"], ["luck>1"],
+                                   ["type>fire"], ["sort=luck"],
+                                   ["limit={}".format(maxLimit + 1)]])
+def test_parse_rejects_invalid_terms(words):
+    with pytest.raises(ValueError):
+        StatQuery.parse(words)
+
+
+def makeStore(tmp_path):
+    """Return a store with two Pokemon, one of them with a Mega form."""
+    store = PokeStore(str(tmp_path / "pokedex.db"))
+    store.put("charizard",
+              makeRecord(speed=100, forms=("Charizard", "Mega Charizard X")))
+    pikachu = makeRecord(natDexNo="#025", speed=90, forms=("Pikachu",))
+    pikachu.abilities = {"Pikachu": ("Static",)}
+    store.put("pikachu", pikachu)
+    return store
+
+
+def names(table, words):
+    """Return the forms matching a query."""
+    (results, _) = table.run(StatQuery.parse(words))
+    return [form for (_, form, _) in results]
+
+
+def test_table_runs_queries(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    from statQuery import StatTable, formatStat
+    table = StatTable(makeStore(tmp_path))
+    assert len(table) == 3
+    assert names(table, ["speed>95"]) == ["Charizard", "Mega Charizard X"]
+    assert names(table, ["form=mega"]) == ["Mega Charizard X"]
+    assert names(table, ["sort=no"]) == ["Charizard", "Mega Charizard X",
+                                         "Pikachu"]
+    assert names(table, ["ability=blaze"]) == ["Charizard"]
+    # The base form and forms without abilities of their own get the Hidden
+    # Ability
+    assert names(table, ["ability=solar", "power"]) == ["Charizard",
+                                                        "Mega Charizard X"]
+    assert formatStat(numpy.nan) == "?"
+
+
+def test_update_matches_a_rebuilt_table(tmp_path):
+    pytest.importorskip("numpy")
+    from statQuery import StatTable
+    store = makeStore(tmp_path)
+    table = StatTable(store)
+    updates = {"charizard": makeRecord(speed=120, forms=("Charizard",)),
+               "bulbasaur": makeRecord(natDexNo="#001", speed=45,
+                                       forms=("Bulbasaur",
+                                              "A very long form name"))}
+    updates["bulbasaur"].types = {"Bulbasaur": ("Grass", "Poison")}
+    updates["bulbasaur"].abilities = {"Bulbasaur": ("Overgrow",)}
+    for (pokemon, record) in updates.items():
+        store.put(pokemon, record)
+        table.update(pokemon, record)
+    rebuilt = StatTable(store)
+    assert table.keys == rebuilt.keys
+    assert list(table.forms) == list(rebuilt.forms)
+    for (column, values) in rebuilt.columns.items():
+        assert list(table.columns[column]) == list(values)
+    for (mine, theirs) in ((table.typeColumns, rebuilt.typeColumns),
+                           (table.abilityColumns, rebuilt.abilityColumns)):
+        assert ({value: list(column) for (value, column) in mine.items()
+                 if column.any()} ==
+                {value: list(column) for (value, column) in theirs.items()})
+
+
+def test_hidden_abilities_of_parsed_pages(tmp_path):
+    pytest.importorskip("numpy")
+    from pokeRecord import PokeRecord
+    from recordedPages import loadFixture, pokeFixtures
+    from setup import parsePokemon
+    from statQuery import StatTable
+    store = PokeStore(str(tmp_path / "pokedex.db"))
+    for pokemon in ("charizard", "deoxys"):
+        info = parsePokemon(loadFixture(pokeFixtures[pokemon][0]), pokemon)
+        info["url"] = pokeFixtures[pokemon][1]
+        store.put(pokemon, PokeRecord.fromDict(info))
+    table = StatTable(store)
+    assert names(table, ["ability=solar", "power"]) == ["Charizard"]
+    assert names(table, ["ability=tough", "claws"]) == ["Mega Charizard X"]
+    # Deoxys' abilities are listed under its name and not its formes
+    assert names(table, ["ability=pressure", "sort=speed"]) == [
+        "Defense Forme", "Attack Forme", "Normal Forme", "Speed Forme"]
@@ -0,0 +1,35 @@
+import os
+from urllib.parse import urlsplit
+
+# Server that every request to the wikis is sent to instead, e.g. a
+# replayServer.py on "http://localhost:8080"
+# None to send requests to the wikis
+override = os.environ.get("COMPANIONBOT_UPSTREAM") or None
+
+
+def setUpstream(url):
+    """Send every request to the wikis to another server.
+
+    Keyword arguments:
+    url -- the server's base URL or None to use the wikis
+    """
+    global override
+    override = url.rstrip("/") if url else None
+
+
+def upstreamURL(url):
+    """Return the URL to request for a page on one of the wikis.
+
+    With an override the wiki's host name becomes the first part of the path,
+    e.g. "http://localhost:8080/bulbapedia.bulbagarden.net/wiki/Mudkip", so
+    pages from different wikis don't collide. Otherwise url is returned.
+    Keyword arguments:
+    url -- the URL of the page on the wiki
+    """
+    if (override is None):
+        return url
+    parts = urlsplit(url)
+    rewritten = "{}/{}{}".format(override, parts.netloc, parts.path)
+    if (parts.query):
+        rewritten = "{}?{}".format(rewritten, parts.query)
+    return rewritten